@@ -28,16 +28,26 @@ definition in :file:`sparks/fabric/__init__.py`.
 """
 
 import os
+import re
 import pwd
+import json
+import time
+import fcntl
+import base64
+import random
+import hashlib
+import inspect
 import logging
 import datetime
 
+from contextlib import contextmanager
+
 try:
     from fabric.api import (env, run, sudo, task,
-                            local, execute, serial)
+                            local, execute)
     from fabric.tasks import Task
-    from fabric.operations import put, prompt
-    from fabric.contrib.files import exists, upload_template, sed
+    from fabric.operations import prompt, get
+    from fabric.contrib.files import exists, sed
     from fabric.context_managers import cd, prefix, settings
 
 except ImportError:
@@ -51,8 +61,13 @@ from ..fabric import (fabfile, all_roles, worker_roles,
                       is_local_environment,
                       is_development_environment,
                       is_production_environment,
-                      execute_or_not, get_current_role,
-                      worker_information_from_role, QUIET)
+                      execute_or_not, execute_in_batches, index_roledefs,
+                      merge_roles_hosts, task_pool_size,
+                      roles_by_host, get_current_role,
+                      worker_information_from_role, get_agent,
+                      remote_exists, prefetch_exists, invalidate_exists,
+                      remote_rm, remote_mv, put, upload_template, QUIET)
+from ..fabric.agent import RemoteAgentError
 from sparks import pkg
 from ..foundations import postgresql as pg
 from ..foundations.classes import SimpleObject
@@ -66,6 +81,41 @@ from ..foundations.classes import SimpleObject
 
 LOGGER = logging.getLogger(__name__)
 
+# (pid, host_string) -> [current hash, stored hash] of the requirements
+# of the host. See requirements_unchanged().
+requirements_stamps = {}
+
+# `-r other.txt` and `-c constraints.txt` lines of PIP requirements files.
+REQUIREMENTS_INCLUDE = re.compile(
+    r'^\s*(?:-r|-c|--requirement|--constraint)[\s=]*(\S+)')
+
+# (pid, host_string) -> [current hash, stored hash] of the database schema
+# sources of the host. See schema_unchanged().
+schema_stamps = {}
+
+# Wheels built for the requirements are kept here, on the controller,
+# one directory per requirements contents. See build_wheelhouse().
+WHEELHOUSE_CACHE_DIR = os.path.expanduser(os.environ.get(
+    'SPARKS_WHEELHOUSE_DIR', '~/.cache/sparks/wheelhouse'))
+
+# Git bundles and the git pull slots locks live here, on the controller.
+# See git_pull_task().
+GIT_CACHE_DIR = os.path.expanduser(os.environ.get(
+    'SPARKS_GIT_CACHE_DIR', '~/.cache/sparks/git'))
+
+# A `git pull` failing with one of these is retried (see git_pull_retrying()):
+# they come from concurrent git processes or an overloaded central server.
+GIT_PULL_TRANSIENT_ERRORS = (
+    '.lock',
+    'cannot lock ref',
+    'Connection reset',
+    'Connection closed',
+    'hung up unexpectedly',
+    'exchange_identification',
+    'early EOF',
+    'Could not read from remote repository',
+)
+
 
 # These can be overridden in local projects fabfiles.
 env.requirements_dir      = 'config'
@@ -78,6 +128,10 @@ env.dev_requirements_file = os.path.join(env.requirements_dir,
 env.branch                = '<GIT-FLOW-DEPENDANT>'
 env.use_ssh_config        = True
 
+# Set once when fab imports the fabfile, before any parallel worker forks:
+# all workers of one fab invocation share it. See git_remote_tip().
+env.sparks_run_id = '{0}-{1}'.format(os.getpid(), time.time())
+
 
 # ••••••••••••••••••••••••••••••••••••••••••••••••••••••••••••••••• Django task
 
@@ -156,7 +210,13 @@ class ServiceRunner(SimpleObject):
         self.update  = False
         self.restart = False
 
-        if exists('/usr/bin/supervisorctl'):
+        # One round trip for all the checks we will need.
+        prefetch_exists(('/usr/bin/supervisorctl',
+                         '/etc/init/{0}.conf'.format(self.program_name),
+                         '/etc/supervisor/conf.d/{0}.conf'.format(
+                             self.program_name)))
+
+        if remote_exists('/usr/bin/supervisorctl'):
             # testing exists('/etc/supervisor') isn't accurate: the
             # directory could still be there on a Debian/Ubuntu system,
             # even after a "remove --purge" (observed on obi.1flow.io).
@@ -413,7 +473,7 @@ class ServiceRunner(SimpleObject):
                 filename = '/etc/supervisor/conf.d/{0}.conf'.format(
                     self.program_name)
 
-            self.__service_configuration_installed = exists(filename)
+            self.__service_configuration_installed = remote_exists(filename)
 
             return self.__service_configuration_installed
 
@@ -439,11 +499,12 @@ class ServiceRunner(SimpleObject):
             self.stop(warn_only=True)
 
             if self.service_handler == 'upstart':
-                sudo("rm /etc/init/{0}.conf".format(self.program_name), quiet=QUIET)
+                remote_rm("/etc/init/{0}.conf".format(self.program_name),
+                          use_sudo=True)
 
             else:
-                sudo("rm /etc/supervisor/conf.d/{0}.conf".format(
-                     self.program_name), quiet=QUIET)
+                remote_rm("/etc/supervisor/conf.d/{0}.conf".format(
+                          self.program_name), use_sudo=True)
             # NO need for self.reload(check_installed=False),
             # the property has still the cached value.
             self.reload()
@@ -648,17 +709,17 @@ class ServiceRunner(SimpleObject):
         self.add_environment_to_context(context, self.has_djsettings)
         self.add_command_pre_post_to_context(context, self.has_djsettings)
 
-        if exists(destination):
+        if remote_exists(destination):
             upload_template(superconf, destination + '.new',
                             context=context, use_sudo=True, backup=False)
 
             if sudo('diff {0} {0}.new'.format(destination),
                     warn_only=True, quiet=QUIET) == '':
-                sudo('rm -f {0}.new'.format(destination), quiet=QUIET)
+                remote_rm(destination + '.new', use_sudo=True)
 
             else:
                 self.stop()
-                sudo('mv {0}.new {0}'.format(destination), quiet=QUIET)
+                remote_mv(destination + '.new', destination, use_sudo=True)
                 self.update  = True
                 self.restart = True
 
@@ -698,23 +759,37 @@ class ServiceRunner(SimpleObject):
         # annoyed with a 'please move <file> out of the way' GIT message,
         # and won't be required to make a manual operation.
 
-        if exists(gunidest):
+        helper = get_agent()
+
+        if helper is not None:
+            try:
+                if helper.same_content(gunidest, guniconf):
+                    # Nothing to upload, diff nor move.
+                    return
+
+            except RemoteAgentError as exc:
+                LOGGER.warning(u'%s, falling back to diff.', exc)
+
+        gunidestdir = os.path.dirname(gunidest)
+
+        prefetch_exists((gunidest, gunidestdir))
+
+        if remote_exists(gunidest):
             put(guniconf, gunidest + '.new')
 
             if sudo('diff {0} {0}.new'.format(gunidest),
                     warn_only=True, quiet=QUIET) == '':
-                sudo('rm -f {0}.new'.format(gunidest), quiet=QUIET)
+                remote_rm(gunidest + '.new', use_sudo=True)
 
             else:
-                sudo('mv {0}.new {0}'.format(gunidest), quiet=QUIET)
+                remote_mv(gunidest + '.new', gunidest, use_sudo=True)
                 self.update  = True
                 self.restart = True
 
         else:
-            gunidestdir = os.path.dirname(gunidest)
-
-            if not exists(gunidestdir):
+            if not remote_exists(gunidestdir):
                 run('mkdir -p "{0}"'.format(gunidestdir), quiet=QUIET)
+                invalidate_exists(gunidestdir)
 
             # copy the default configuration to remote.
             put(guniconf, gunidest)
@@ -919,13 +994,41 @@ class activate_venv(object):
 
             if not activate_venv.use_jenkins:
 
-                workon_home = run('echo $WORKON_HOME', quiet=QUIET).strip() \
-                    or '${HOME}/.virtualenvs'
-
-                activate_venv.project_file = os.path.join(workon_home,
-                                                          env.virtualenv,
-                                                          '.project')
-                activate_venv.has_project  = exists(activate_venv.project_file)
+                helper = get_agent()
+
+                if helper is not None:
+                    # One round trip for both questions.
+                    project_file = os.path.join('{0}', env.virtualenv,
+                                                '.project')
+                    candidates = (project_file.format('$WORKON_HOME'),
+                                  project_file.format('${HOME}/.virtualenvs'))
+
+                    try:
+                        environ, stats = helper.call_many([
+                            ('getenv', {'names': ['WORKON_HOME']}),
+                            ('stat', {'paths': candidates}),
+                        ])
+
+                    except RemoteAgentError as exc:
+                        LOGGER.warning(u'%s, falling back to shell '
+                                       u'commands.', exc)
+                        helper = None
+
+                    else:
+                        activate_venv.project_file = candidates[
+                            0 if environ['WORKON_HOME'] else 1]
+                        activate_venv.has_project = \
+                            stats[activate_venv.project_file] is not None
+
+                if helper is None:
+                    workon_home = run('echo $WORKON_HOME',
+                                      quiet=QUIET).strip() \
+                        or '${HOME}/.virtualenvs'
+
+                    activate_venv.project_file = os.path.join(
+                        workon_home, env.virtualenv, '.project')
+                    activate_venv.has_project  = exists(
+                        activate_venv.project_file)
 
         env_dir = get_project_envs_dir()
         if env_dir:
@@ -1100,12 +1203,179 @@ def init_environment():
         run('mkvirtualenv {0}'.format(env.virtualenv), quiet=QUIET)
 
 
+def prefetch_requirements_paths():
+    """ Check the existence of all the files the requirements tasks need,
+        in one round trip. They will be answered by the cache.
+
+        .. versionadded:: 5.18
+    """
+
+    paths = [os.path.join(env.root, '.pipcache'),
+             os.path.join(env.root, env.requirements_file),
+             os.path.join(env.root, env.gem_file)]
+
+    if wheelhouse_builder() is not None:
+        filenames = wheelhouse_requirements()
+
+        if filenames:
+            paths.append(os.path.join(env.root, '.wheelhouse',
+                                      wheelhouse_key(filenames)))
+
+    if is_development_environment():
+        paths.append(os.path.join(env.root, env.dev_requirements_file))
+
+    role_name = get_current_role()
+
+    if role_name is not None:
+        paths.append(os.path.join(env.root, env.requirements_dir,
+                                  role_name + '.sh'))
+
+    prefetch_exists(paths)
+
+
+def requirements_stamp_file():
+    """ Return the remote file holding the hash of the requirements which
+        were successfully installed, for the current role. """
+
+    return os.path.join(env.root, '.sparks-requirements-{0}'.format(
+                        get_current_role() or 'all'))
+
+
+def requirements_with_includes(filenames):
+    """ Return :param:`filenames` and all the files they include with
+        ``-r`` or ``-c`` lines, recursively. Includes are looked up in
+        the local project, which is the one deployed (it is pushed before),
+        relative to the including file, like PIP does. URLs are ignored.
+
+        .. versionadded:: 5.18
+    """
+
+    result  = []
+    pending = list(filenames)
+
+    while pending:
+        filename = os.path.normpath(pending.pop(0))
+
+        if filename in result:
+            continue
+
+        result.append(filename)
+
+        try:
+            with open(filename) as handle:
+                lines = handle.readlines()
+
+        except (IOError, OSError):
+            continue
+
+        for line in lines:
+            match = REQUIREMENTS_INCLUDE.match(line)
+
+            if match and '://' not in match.group(1):
+                pending.append(os.path.join(os.path.dirname(filename),
+                                            match.group(1)))
+
+    return result
+
+
+def requirements_hash():
+    """ Return the hashes of the current host requirements (files and
+        the files they include, Gemfile, role script and virtualenv Python
+        version), as computed now and as stored after the last successful
+        install (``None`` if never). Both come from one remote command,
+        once per session.
+
+        .. versionadded:: 5.18
+    """
+
+    key = (os.getpid(), env.host_string)
+
+    try:
+        return requirements_stamps[key]
+
+    except KeyError:
+        pass
+
+    filenames = [env.requirements_file]
+
+    if is_development_environment():
+        filenames.append(env.dev_requirements_file)
+
+    filenames = requirements_with_includes(filenames) + [env.gem_file]
+
+    role_name = get_current_role()
+
+    if role_name is not None:
+        filenames.append(os.path.join(env.requirements_dir,
+                                      role_name + '.sh'))
+
+    with cd(env.root):
+        with activate_venv():
+            output = run(u'echo SPARKS_REQUIREMENTS $({{ cat {0} 2>/dev/null; '
+                         u'python --version 2>&1; }} | sha1sum '
+                         u'| cut -d" " -f1) $(cat {1} 2>/dev/null)'.format(
+                             ' '.join(filenames), requirements_stamp_file()),
+                         quiet=True)
+
+    hashes = [None, None]
+
+    for line in output.splitlines():
+        if line.startswith('SPARKS_REQUIREMENTS '):
+            words = line.split()[1:]
+            hashes[:len(words)] = words[:2]
+
+    requirements_stamps[key] = hashes
+
+    return hashes
+
+
+def requirements_unchanged(upgrade=False, force=False):
+    """ Return ``True`` if the requirements of the current host did not
+        change since the last successful :func:`requirements` run, in
+        which case the whole requirements chain can be skipped. Always
+        ``False`` with :param:`upgrade` or :param:`force`.
+
+        .. versionadded:: 5.18
+    """
+
+    if upgrade or force:
+        return False
+
+    current, stored = requirements_hash()
+
+    return current is not None and current == stored
+
+
+@task
+def requirements_stamp_task(fast=False, upgrade=False, force=False):
+    """ Remember the requirements of the current host as installed.
+
+        .. versionadded:: 5.18
+    """
+
+    if requirements_unchanged(upgrade, force):
+        return
+
+    hashes = requirements_hash()
+
+    if hashes[0] is not None:
+        run('echo {0} > {1}'.format(hashes[0], requirements_stamp_file()),
+            quiet=QUIET)
+
+        hashes[1] = hashes[0]
+
+
 @task
-def pre_requirements_task(fast=False, upgrade=False):
+def pre_requirements_task(fast=False, upgrade=False, force=False):
 
     if is_local_environment():
         return
 
+    if requirements_unchanged(upgrade, force):
+        return
+
+    prefetch_requirements_paths()
+
     role_name = get_current_role()
 
     if role_name is None:
@@ -1115,7 +1385,7 @@ def pre_requirements_task(fast=False, upgrade=False):
     custom_script = os.path.join(env.root, env.requirements_dir,
                                  role_name + '.sh')
 
-    has_custom_script = exists(custom_script)
+    has_custom_script = remote_exists(custom_script)
 
     if not has_custom_script:
         return
@@ -1130,7 +1400,7 @@ def pre_requirements_task(fast=False, upgrade=False):
 
 
 @task
-def post_requirements_task(fast=False, upgrade=False):
+def post_requirements_task(fast=False, upgrade=False, force=False):
 
     #
     # TODO: factorize role_name and exists() with pre_requirements_task
@@ -1139,6 +1409,11 @@ def post_requirements_task(fast=False, upgrade=False):
     if is_local_environment():
         return
 
+    if requirements_unchanged(upgrade, force):
+        return
+
+    prefetch_requirements_paths()
+
     role_name = get_current_role()
 
     if role_name is None:
@@ -1148,7 +1423,7 @@ def post_requirements_task(fast=False, upgrade=False):
     custom_script = os.path.join(env.root, env.requirements_dir,
                                  role_name + '.sh')
 
-    has_custom_script = exists(custom_script)
+    has_custom_script = remote_exists(custom_script)
 
     if not has_custom_script:
         return
@@ -1162,7 +1437,240 @@ def post_requirements_task(fast=False, upgrade=False):
                 role_name, env.host_string), quiet=QUIET)
 
 
-def requirements_task(fast=False, upgrade=False):
+# ————————————————————————————————————————————————————————————— Wheelhouse
+
+
+def wheelhouse_builder():
+    """ Return where wheels should be built: ``None`` (wheelhouse disabled,
+        the default), ``'localhost'`` for the controller, or a host string.
+
+        It is set with ``env.sparks_options['wheelhouse']`` or the
+        ``SPARKS_WHEELHOUSE`` environment variable: ``True`` or
+        ``'localhost'`` for the controller, else the builder host string.
+        C extensions are built for the builder platform: when hosts
+        differ from the controller, use one of them (or a twin).
+
+        .. versionadded:: 5.18
+    """
+
+    builder = getattr(env, 'sparks_options', {}).get(
+        'wheelhouse', os.environ.get('SPARKS_WHEELHOUSE', None))
+
+    if not builder:
+        return None
+
+    if builder is True or builder.lower() in ('1', 'true', 'yes', ):
+        return 'localhost'
+
+    return builder
+
+
+def wheelhouse_requirements():
+    """ Return the local requirements files the wheelhouse is built for. """
+
+    files = [env.requirements_file]
+
+    if is_development_environment():
+        files.insert(0, env.dev_requirements_file)
+
+    return [filename for filename in files if os.path.exists(filename)]
+
+
+def wheelhouse_key(filenames):
+    """ Return a hash of the requirements :param:`filenames` contents. """
+
+    digest = hashlib.sha1()
+
+    for filename in filenames:
+        with open(filename, 'rb') as handle:
+            digest.update(filename.encode('utf-8') + b'\0' + handle.read())
+
+    return digest.hexdigest()[:16]
+
+
+def build_wheelhouse(filenames, key, builder):
+    """ Build the wheels of all :param:`filenames` requirements once, on
+        :param:`builder`, and return the local path of the wheelhouse
+        tarball. Parallel Fabric workers wait for the first one to build
+        it, then all of them (and the next deploys) reuse it, as long as
+        the requirements do not change.
+
+        On the controller, wheels are built with the current ``pip``. On a
+        remote builder, in the project virtualenv, which the caller must
+        have activated.
+
+        .. versionadded:: 5.18
+    """
+
+    wheelhouse = os.path.join(WHEELHOUSE_CACHE_DIR, env.project, key)
+    tarball    = wheelhouse + '.tar.gz'
+
+    if os.path.exists(tarball):
+        return tarball
+
+    if not os.path.isdir(wheelhouse):
+        os.makedirs(wheelhouse)
+
+    with open(wheelhouse + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        if os.path.exists(tarball):
+            return tarball
+
+        requirements = ' '.join('--requirement {0}'.format(filename)
+                                for filename in filenames)
+
+        LOGGER.info(u'Building the requirements wheelhouse on %s…', builder)
+
+        if builder == 'localhost':
+            # Fabric's local() honors the remote virtualenv prefix.
+            with settings(command_prefixes=[]):
+                local(u'pip wheel --wheel-dir {0} {1}'.format(
+                      wheelhouse, requirements), capture=QUIET)
+                local(u'tar -C {0} -czf {1}.tmp .'.format(wheelhouse,
+                      tarball), capture=QUIET)
+
+        else:
+            remote_dir = '/tmp/sparks-wheelhouse-{0}'.format(key)
+
+            with settings(host_string=builder):
+                run('mkdir -p {0}/wheels'.format(remote_dir), quiet=QUIET)
+
+                for filename in filenames:
+                    run('mkdir -p {0}/{1}'.format(remote_dir,
+                        os.path.dirname(filename) or '.'), quiet=QUIET)
+                    put(filename, os.path.join(remote_dir, filename))
+
+                with cd(remote_dir):
+                    run(u'pip install wheel && pip wheel '
+                        u'--wheel-dir wheels {0}'.format(requirements),
+                        quiet=QUIET)
+                    run('tar -C wheels -czf wheels.tar.gz .', quiet=QUIET)
+
+                get(os.path.join(remote_dir, 'wheels.tar.gz'), tarball + '.tmp')
+                remote_rm(remote_dir)
+
+        os.rename(tarball + '.tmp', tarball)
+
+    return tarball
+
+
+def remote_requirements_match(filenames):
+    """ Return ``True`` if the requirements :param:`filenames` of the
+        current host (in ``env.root``, as pulled from git) are the same
+        as the local ones the wheelhouse was built from.
+
+        .. versionadded:: 5.18
+    """
+
+    local_hashes = {}
+
+    for filename in filenames:
+        with open(filename, 'rb') as handle:
+            local_hashes[filename] = hashlib.sha1(handle.read()).hexdigest()
+
+    with cd(env.root):
+        output = run('sha1sum {0}'.format(' '.join(filenames)),
+                     quiet=True, warn_only=True)
+
+    remote_hashes = dict(reversed(line.split(None, 1)) for line
+                         in output.splitlines() if len(line.split()) == 2)
+
+    return remote_hashes == local_hashes
+
+
+def install_wheelhouse(command, filenames, key, tarball):
+    """ Send the wheelhouse :param:`tarball` to the current host (once per
+        requirements version) and install the requirements from it, without
+        any access to the packages index. Return ``False`` if the install
+        failed, eg. because the wheelhouse misses some packages.
+
+        The wheelhouse is extracted aside, and moved in place only when
+        complete: an interrupted transfer is redone at the next run.
+
+        .. versionadded:: 5.18
+    """
+
+    remote_wheelhouse = os.path.join(env.root, '.wheelhouse', key)
+
+    if not remote_exists(remote_wheelhouse):
+        temporary = '{0}.tmp-{1}'.format(remote_wheelhouse, os.getpid())
+
+        run('rm -rf {0} && mkdir -p {0}'.format(temporary), quiet=QUIET)
+        put(tarball, temporary + '.tar.gz')
+        run('tar -C {0} -xzf {0}.tar.gz && rm -f {0}.tar.gz '
+            '&& rm -rf {1} && mv {0} {1}'.format(temporary, remote_wheelhouse),
+            quiet=QUIET)
+
+        # Older wheelhouses are useless now.
+        run('find {0} -mindepth 1 -maxdepth 1 ! -name {1} -exec rm -rf {{}} +'
+            .format(os.path.dirname(remote_wheelhouse), key), quiet=QUIET)
+
+        invalidate_exists(remote_wheelhouse)
+
+    for filename in filenames:
+        result = run(u"{command} --no-index --find-links {wheelhouse} "
+                     u"--requirement {requirements_file}".format(
+                         command=command, wheelhouse=remote_wheelhouse,
+                         requirements_file=os.path.join(env.root, filename)),
+                     quiet=QUIET, warn_only=True)
+
+        if result.failed:
+            return False
+
+    return True
+
+
+def requirements_from_wheelhouse(command):
+    """ Install the PIP requirements via the wheelhouse, if enabled (see
+        :func:`wheelhouse_builder`). Return ``False`` if the classic way
+        should be used instead.
+
+        .. versionadded:: 5.18
+    """
+
+    builder = wheelhouse_builder()
+
+    if builder is None:
+        return False
+
+    filenames = wheelhouse_requirements()
+
+    if not filenames:
+        return False
+
+    if not remote_requirements_match(filenames):
+        LOGGER.warning(u'Requirements of %s differ from the local ones, '
+                       u'installing them from the index.', env.host_string)
+        return False
+
+    key = wheelhouse_key(filenames)
+
+    try:
+        tarball = build_wheelhouse(filenames, key, builder)
+
+    except (Exception, SystemExit) as exc:
+        # Fabric aborts with SystemExit when a command fails.
+        LOGGER.warning(u'Could not build the wheelhouse (%s), installing '
+                       u'requirements from the index.', exc)
+        return False
+
+    LOGGER.info('Checking requirements (from wheelhouse %s)…', key)
+
+    if not install_wheelhouse(command, filenames, key, tarball):
+        LOGGER.warning(u'Could not install the requirements of %s from the '
+                       u'wheelhouse, installing them from the index.',
+                       env.host_string)
+        return False
+
+    return True
+
+
+def requirements_task(fast=False, upgrade=False, force=False):
+
+    if requirements_unchanged(upgrade, force):
+        LOGGER.info('Requirements unchanged since last install, skipped.')
+        return
 
     # Thanks http://stackoverflow.com/a/9362082/654755
     if upgrade:
@@ -1173,32 +1681,37 @@ def requirements_task(fast=False, upgrade=False):
     command = command.format(sparks_env=sparks_djsettings_env_var(),
                              django_env=django_settings_env_var())
 
+    prefetch_requirements_paths()
+
     with cd(env.root):
 
         pip_cache = os.path.join(env.root, '.pipcache')
 
-        if not exists(pip_cache):
+        if not remote_exists(pip_cache):
             run('mkdir -p {0}'.format(pip_cache), quiet=QUIET)
+            invalidate_exists(pip_cache)
 
         with activate_venv():
 
-            if is_development_environment():
+            from_wheelhouse = requirements_from_wheelhouse(command)
+
+            if is_development_environment() and not from_wheelhouse:
 
                 LOGGER.info('Checking development requirements…')
 
                 dev_req = os.path.join(env.root, env.dev_requirements_file)
 
-                if exists(dev_req):
+                if remote_exists(dev_req):
                     run(u"{command} --download-cache {pip_cache} "
                         u"--requirement {requirements_file}".format(
                         command=command, requirements_file=dev_req,
                         pip_cache=pip_cache), quiet=QUIET)
 
-            LOGGER.info('Checking requirements…')
-
             req = os.path.join(env.root, env.requirements_file)
 
-            if exists(req):
+            if remote_exists(req) and not from_wheelhouse:
+                LOGGER.info('Checking requirements…')
+
                 run(u"{command} --download-cache {pip_cache} "
                     u" --requirement {requirements_file}".format(
                     command=command, requirements_file=req,
@@ -1208,7 +1721,7 @@ def requirements_task(fast=False, upgrade=False):
 
             req = os.path.join(env.root, env.gem_file)
 
-            if exists(req):
+            if remote_exists(req):
                 run(u"bundle install --gemfile={gemfile}".format(
                     gemfile=req), quiet=QUIET)
 
@@ -1216,21 +1729,27 @@ def requirements_task(fast=False, upgrade=False):
 
 
 @task(alias='req')
-def requirements(fast=False, upgrade=False):
+def requirements(fast=False, upgrade=False, force=False):
     """ Install PIP requirements (and dev-requirements).
 
         .. note:: :param:`fast` is not used yet, but exists for consistency
             with other fab tasks which handle it.
+
+        .. versionchanged:: in 5.18, the whole chain is skipped on hosts
+            where requirements files, Gemfile, role script and virtualenv
+            Python version did not change since the last successful run,
+            unless :param:`upgrade` or :param:`force` is set.
     """
 
     roles_to_run = list(set(all_roles))
 
     for req_task in (pre_requirements_task,
                      requirements_task,
-                     post_requirements_task):
+                     post_requirements_task,
+                     requirements_stamp_task):
 
         execute_or_not(req_task,
-                       fast=fast, upgrade=upgrade,
+                       fast=fast, upgrade=upgrade, force=force,
                        sparks_roles=roles_to_run)
 
 def get_project_envs_dir():
@@ -1379,27 +1898,291 @@ def git_update():
                    + ['beat', 'flower', 'shell'])
 
 
-@serial
+def git_pull_option(name, default):
+    """ Return the ``git_pull_<name>`` sparks option, or
+        the ``SPARKS_GIT_PULL_<NAME>`` environment variable. """
+
+    return getattr(env, 'sparks_options', {}).get(
+        'git_pull_' + name, os.environ.get(
+            'SPARKS_GIT_PULL_' + name.upper(), default))
+
+
+def git_pull_roles():
+
+    return ['web'] + worker_roles[:] + ['beat', 'flower', 'shell']
+
+
+def git_pull_concurrency():
+    """ Return how many hosts can pull at the same time: the
+        ``git_pull_task`` cap of :data:`sparks.fabric.task_pool_sizes`,
+        relative to the number of hosts which pull. """
+
+    nbhosts = len(merge_roles_hosts(dict((role, env.roledefs.get(role, []))
+                                         for role in git_pull_roles())))
+
+    return task_pool_size(git_pull_task, max(1, nbhosts))
+
+
+def git_cache_path(name):
+    """ Return the path of :param:`name` in :data:`GIT_CACHE_DIR`,
+        prefixed with the project name. """
+
+    try:
+        os.makedirs(GIT_CACHE_DIR)
+
+    except OSError:
+        # Already there, or created by another Fabric worker.
+        pass
+
+    return os.path.join(GIT_CACHE_DIR, '{0}-{1}'.format(
+                        getattr(env, 'project', 'sparks'), name))
+
+
+@contextmanager
+def git_pull_slot():
+    """ Hold one of the :func:`git_pull_concurrency` slots while pulling.
+
+        Slots are lock files on the controller, thus they are shared by
+        all the Fabric parallel workers (which are processes), even when
+        the task runs inside another parallel task like :func:`runable`,
+        where ``env.pool_size`` caps cannot apply.
+
+        .. versionadded:: 5.18
+    """
+
+    handles = [open(git_cache_path('pull-{0}.lock'.format(index)), 'w')
+               for index in range(git_pull_concurrency())]
+
+    try:
+        while True:
+            for handle in handles:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+                except IOError:
+                    continue
+
+                yield
+                return
+
+            time.sleep(random.uniform(0.1, 0.5))
+
+    finally:
+        # Closing the files releases the lock.
+        for handle in handles:
+            handle.close()
+
+
+def git_pull_retrying(command='git pull'):
+    """ Run :param:`command` in a :func:`git_pull_slot`, and retry it
+        after a random, growing delay when it fails because of a lock
+        or a connection problem (see :data:`GIT_PULL_TRANSIENT_ERRORS`).
+
+        Retries and the base delay are set with the ``git_pull_retries``
+        (default: 3) and ``git_pull_delay`` (in seconds, default: 2)
+        sparks options, or the ``SPARKS_GIT_PULL_RETRIES`` and
+        ``SPARKS_GIT_PULL_DELAY`` environment variables.
+
+        .. versionadded:: 5.18
+    """
+
+    retries = int(git_pull_option('retries', 3))
+    delay   = float(git_pull_option('delay', 2))
+
+    for attempt in range(retries + 1):
+        with git_pull_slot():
+            result = run(command, quiet=QUIET, warn_only=True)
+
+        if result.succeeded:
+            return result
+
+        if attempt == retries or not any(error in result for error
+                                         in GIT_PULL_TRANSIENT_ERRORS):
+            break
+
+        wait = random.uniform(0, delay * 2 ** attempt)
+
+        LOGGER.warning(u'%s failed on %s, retrying in %.1f seconds (%s/%s).',
+                       command, env.host_string, wait, attempt + 1, retries)
+
+        time.sleep(wait)
+
+    raise RuntimeError(u'{0} failed on {1}: {2}'.format(
+                       command, env.host_string, result))
+
+
+def git_remote_tip(branch):
+    """ Return the commit of ``origin/<branch>`` on the controller, after
+        fetching it from the central repository exactly once per fab
+        invocation (``env.sparks_run_id``), for all the Fabric workers.
+        Return ``None`` if the fetch failed. """
+
+    with open(git_cache_path('fetch.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        stamp = git_cache_path('fetch.stamp')
+
+        try:
+            with open(stamp) as handle:
+                run_id, status = handle.read().split()
+
+        except (IOError, OSError, ValueError):
+            run_id, status = None, None
+
+        if run_id != env.sparks_run_id:
+            with settings(command_prefixes=[], warn_only=True):
+                result = local('git fetch origin {0}'.format(branch),
+                               capture=QUIET)
+
+            status = 'failed' if result.failed else 'fetched'
+
+            with open(stamp, 'w') as handle:
+                handle.write('{0} {1}\n'.format(env.sparks_run_id, status))
+
+        if status == 'failed':
+            LOGGER.warning(u'Could not fetch origin/%s on the '
+                           u'controller.', branch)
+            return None
+
+    with settings(command_prefixes=[], warn_only=True):
+        return local('git rev-parse --verify --quiet refs/remotes/origin/{0}'
+                     .format(branch), capture=True).strip() or None
+
+
+def build_git_bundle(basis, branch, tip):
+    """ Create a bundle of the commits from :param:`basis` to :param:`tip`
+        (``origin/<branch>``) on the controller, once for all hosts at
+        :param:`basis`, and return its local path. Return ``None`` if
+        :param:`basis` is unknown locally or the bundle would be empty.
+
+        .. versionadded:: 5.18
+    """
+
+    bundle = git_cache_path('{0}-{1}.bundle'.format(basis[:12], tip[:12]))
+
+    if os.path.exists(bundle):
+        return bundle
+
+    with open(bundle + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        if os.path.exists(bundle):
+            return bundle
+
+        with settings(command_prefixes=[], warn_only=True):
+            if local('git cat-file -e {0}^{{commit}}'.format(basis),
+                     capture=True).failed:
+                return None
+
+            if local('git bundle create {0}.tmp {1}..refs/remotes/origin/{2}'
+                     .format(bundle, basis, branch), capture=True).failed:
+                return None
+
+        os.rename(bundle + '.tmp', bundle)
+
+    return bundle
+
+
+def git_pull_from_bundle():
+    """ Update the current host from a git bundle built on the controller
+        (see :func:`build_git_bundle`), sent over the SSH connection of
+        the host. Return ``False`` when it cannot be done, so the caller
+        can fall back to a classic pull.
+
+        .. versionadded:: 5.18
+    """
+
+    branch = get_git_branch()
+    tip    = git_remote_tip(branch)
+
+    if tip is None:
+        LOGGER.warning(u'No origin/%s on the controller, cannot bundle.',
+                       branch)
+        return False
+
+    current = run('git rev-parse HEAD', quiet=True, warn_only=True).strip()
+
+    if current == tip:
+        LOGGER.info(u'%s already at %s.', env.host_string, tip[:12])
+        return True
+
+    bundle = build_git_bundle(current, branch, tip)
+
+    if bundle is None:
+        return False
+
+    remote_bundle = os.path.join(env.root, '.git', os.path.basename(bundle))
+
+    put(bundle, remote_bundle)
+
+    result = run('git fetch --quiet {0} refs/remotes/origin/{1}:'
+                 'refs/remotes/origin/{1} && git merge --ff-only {2}; '
+                 'status=$?; rm -f {0}; exit $status'.format(
+                     remote_bundle, branch, tip),
+                 quiet=QUIET, warn_only=True)
+
+    if result.failed:
+        LOGGER.warning(u'Could not update %s from a bundle: %s',
+                       env.host_string, result)
+        return False
+
+    return True
+
+
 @task(alias='pull_task')
 def git_pull_task():
     """ Pull latest code from origin to remote,
         reload sparks settings if changes.
 
-        Serial task to avoid git lock conflicts on central repository.
+        Runs on a few hosts at a time (see ``sparks.fabric.task_pool_sizes``)
+        to avoid git lock conflicts on central repository.
+
+        .. versionchanged:: in 5.18, the task is not serial anymore.
+
+        .. versionchanged:: in 5.18, the concurrency cap is honored across
+            Fabric workers, and failed pulls are retried on lock and
+            connection errors (see :func:`git_pull_retrying`).
     """
 
     with cd(env.root):
-        run('git pull', quiet=QUIET)
+        git_pull_retrying()
+
+
+@task(alias='bundle_pull_task')
+def git_bundle_pull_task():
+    """ Update the remote code from a :program:`git bundle` sent by the
+        controller (see :func:`git_pull_from_bundle`), or pull it like
+        :func:`git_pull_task` when this is not possible.
+
+        The central repository is fetched only once, by the controller,
+        thus this task has no concurrency cap: all hosts are updated in
+        parallel. Fallback pulls still take a :func:`git_pull_slot`.
+
+        .. versionadded:: 5.18
+    """
+
+    with cd(env.root):
+        if not git_pull_from_bundle():
+            git_pull_retrying()
 
 
 @task(task_class=DjangoTask, aliases=('pull', ))
 def git_pull(filename=None, confirm=True):
-    """ Sparks wrapper task for :func:`git_pull_task`. """
+    """ Sparks wrapper task for :func:`git_pull_task`
+        or :func:`git_bundle_pull_task`. """
 
     # re-wrap the internal task via execute() to catch roledefs.
     # TODO: roles should be "__all__".except('db')
-    execute_or_not(git_pull_task, sparks_roles=['web'] + worker_roles[:]
-                   + ['beat', 'flower', 'shell'])
+    #
+    # With the ``git_pull_mode`` sparks option (or the
+    # SPARKS_GIT_PULL_MODE environment variable) set to ``bundle``,
+    # hosts are updated from a bundle, without hitting the central
+    # repository.
+    if git_pull_option('mode', 'pull') == 'bundle':
+        execute_or_not(git_bundle_pull_task, sparks_roles=git_pull_roles())
+
+    else:
+        execute_or_not(git_pull_task, sparks_roles=git_pull_roles())
 
 
 @task(alias='clean_task')
@@ -1724,6 +2507,190 @@ def django_manage(command, prefix=None, **kwargs):
                        quiet=QUIET, **kwargs)
 
 
+MANAGE_BATCH_MARKER = 'SPARKS_MANAGE_BATCH'
+
+# Runs management commands one after the other like manage.py would, in one
+# Python process (Django starts once). Each one gets its own output buffer
+# and, optionally, a canned answer for its questions. Stops at the first
+# failure and prints the marker and the base64 JSON results.
+MANAGE_BATCH_SCRIPT = r"""
+import sys
+import json
+import shlex
+import base64
+import traceback
+
+try:
+    from StringIO import StringIO
+
+except ImportError:
+    from io import StringIO
+
+import django
+
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.core.management import ManagementUtility
+
+
+class Answers(object):
+
+    def __init__(self, answer):
+        self.answer = answer + '\n'
+
+    def readline(self, *args):
+        return self.answer
+
+    read = readline
+
+
+streams = sys.stdin, sys.stdout, sys.stderr
+utility = ManagementUtility(['manage.py'])
+results = []
+
+for command, answer in json.loads({commands!r}):
+    argv   = ['manage.py'] + shlex.split(command) + {suffix!r}
+    output = StringIO()
+    status = 0
+
+    sys.stdout = sys.stderr = output
+
+    if answer is not None:
+        sys.stdin = Answers(answer)
+
+    try:
+        utility.fetch_command(argv[1]).run_from_argv(argv)
+
+    except SystemExit as exc:
+        status = exc.code if isinstance(exc.code, int) else int(bool(exc.code))
+
+    except Exception:
+        traceback.print_exc()
+        status = 1
+
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = streams
+
+    results.append({{'command': command, 'status': status,
+                    'output': output.getvalue()}})
+
+    if status:
+        break
+
+print({marker!r} + ' ' + base64.b64encode(
+      json.dumps(results).encode('utf-8')).decode('ascii'))
+"""
+
+
+def django_manage_batch(commands, prefix=None, warn_only=False):
+    """ Run many Django management commands in one remote Python process,
+        thus paying the Django start-up and the :class:`activate_venv`
+        dance only once, instead of once per :func:`django_manage` call.
+
+        :param commands: a list of commands, as for :func:`django_manage`
+            (eg. ``'syncdb --noinput'``). An item can also be a
+            ``(command, answer)`` tuple: :param:`answer` is then given to
+            all the questions the command asks (like ``yes answer |``
+            would do for a single command).
+
+        :param prefix: inserted at the start of the remote shell command,
+            as in :func:`django_manage`.
+
+        :param warn_only: if ``False`` (the default), a failed command
+            raises a :class:`RuntimeError` once its output is logged.
+
+        Commands run in order and the batch stops at the first one which
+        fails. Returns a list of ``{'command', 'status', 'output'}``
+        dicts, one per command that ran; ``status`` is ``0`` on success.
+
+        .. versionadded:: 5.18
+    """
+
+    commands = [(command, None) if isinstance(command, basestring)
+                else tuple(command) for command in commands]
+
+    script = MANAGE_BATCH_SCRIPT.format(
+        commands=json.dumps(commands), marker=MANAGE_BATCH_MARKER,
+        suffix=['--verbosity', '1', '--traceback'])
+
+    command = "{0}{1}{2}python -c 'import base64; " \
+        "exec(base64.b64decode(\"{3}\"))'".format(
+            prefix or '', sparks_djsettings_env_var(),
+            django_settings_env_var(),
+            base64.b64encode(script.encode('utf-8')).decode('ascii'))
+
+    with activate_venv():
+        with cd(env.root):
+            output = run(command, quiet=True, warn_only=True,
+                         combine_stderr=False)
+
+    results = None
+
+    for line in output.splitlines():
+        if line.startswith(MANAGE_BATCH_MARKER + ' '):
+            results = json.loads(base64.b64decode(
+                line.split(' ', 1)[1]).decode('utf-8'))
+
+    if results is None:
+        message = u'Django management batch failed on {0}: {1}'.format(
+            env.host_string, output.stderr or output)
+
+        if warn_only:
+            LOGGER.error(message)
+            return []
+
+        raise RuntimeError(message)
+
+    for result in results:
+        if result['status']:
+            LOGGER.error(u'%s failed on %s (status %s):\n%s',
+                         result['command'], env.host_string,
+                         result['status'], result['output'])
+
+        elif not QUIET:
+            LOGGER.info(u'%s on %s:\n%s', result['command'],
+                        env.host_string, result['output'])
+
+    if results and results[-1]['status'] and not warn_only:
+        raise RuntimeError(u'{0} failed on {1}.'.format(
+                           results[-1]['command'], env.host_string))
+
+    return results
+
+
+def compile_catalogs(languages, project_apps):
+    """ Compile the gettext catalogs of all :param:`languages` for the
+        project (or all :param:`project_apps` if the project has no
+        ``locale`` directory), in one remote Python process, without
+        booting Django. Unchanged catalogs are skipped. See
+        :mod:`sparks.django.msgfmt`.
+
+        .. versionadded:: 5.18
+    """
+
+    from . import msgfmt
+
+    arguments = json.dumps({
+        'locale_dirs': [os.path.join(env.project, 'locale')] + [
+            os.path.join(env.project, app, 'locale') for app in project_apps],
+        'languages': languages,
+        'first_only': True,
+    })
+
+    script = inspect.getsource(msgfmt) + '\nmain({0!r})\n'.format(arguments)
+
+    with cd(env.root):
+        output = run("python -c 'import base64; exec(base64.b64decode(\"{0}\"))'"
+                     .format(base64.b64encode(script.encode('utf-8'))
+                             .decode('ascii')), quiet=QUIET)
+
+    for line in output.splitlines():
+        if line.startswith(msgfmt.RESULT_MARKER):
+            LOGGER.info(u'Language files: %s.',
+                        line[len(msgfmt.RESULT_MARKER):].strip())
+
+
 @with_remote_configuration
 def handlemessages(remote_configuration=None, mode=None):
     """ Run the Django compilemessages management command.
@@ -1739,6 +2706,9 @@ def handlemessages(remote_configuration=None, mode=None):
         main Django LANGUAGE_CODE will show up in translations.
 
         .. note:: not a Fabric task, but a helper function.
+
+        .. versionchanged:: in 5.18, the ``compile`` mode does not run
+            Django anymore, see :func:`compile_catalogs`.
     """
 
     if mode is None:
@@ -1769,6 +2739,10 @@ def handlemessages(remote_configuration=None, mode=None):
                     in remote_configuration.django_settings.INSTALLED_APPS
                     if app.startswith('{0}.'.format(env.project))]
 
+    if mode == 'compile':
+        compile_catalogs(languages, project_apps)
+        return
+
     with activate_venv():
         with cd(env.root):
             with cd(env.project):
@@ -1975,18 +2949,225 @@ def migrate(args=None):
     execute_or_not(migrate_task, args=args, sparks_roles=('db', 'pg', ))
 
 
+def schema_stamp_file():
+    """ Return the remote file holding the hash of the schema sources
+        which were successfully synced and migrated, for the current
+        Django settings. """
+
+    return os.path.join(env.root, '.sparks-schema-{0}'.format(
+                        getattr(env, 'sparks_djsettings', None) or 'default'))
+
+
+def schema_hash():
+    """ Return the hashes of the database schema sources of the current
+        host, as computed now and as stored after the last successful
+        :func:`schema_task` (``None`` if never).
+
+        The sources are the project migrations, models and settings files,
+        plus the installed packages (third-party applications ship their
+        own migrations). Both hashes come from one shell command, without
+        booting Django, once per session.
+
+        .. versionadded:: 5.18
+    """
+
+    key = (os.getpid(), env.host_string)
+
+    try:
+        return schema_stamps[key]
+
+    except KeyError:
+        pass
+
+    with cd(env.root):
+        with activate_venv():
+            output = run(u'echo SPARKS_SCHEMA $({{ find {0} -type f \\( '
+                         u"-path '*/migrations/*.py' -o -name models.py "
+                         u"-o -path '*/models/*.py' -o -path '*/settings*.py' "
+                         u'\\) -exec sha1sum {{}} + | LC_ALL=C sort -k2; '
+                         u'pip freeze; echo {1}; }} 2>/dev/null | sha1sum '
+                         u'| cut -d" " -f1) $(cat {2} 2>/dev/null)'.format(
+                             env.project, sparks_djsettings_env_var().strip()
+                             or 'default', schema_stamp_file()),
+                         quiet=True)
+
+    hashes = [None, None]
+
+    for line in output.splitlines():
+        if line.startswith('SPARKS_SCHEMA '):
+            words = line.split()[1:]
+            hashes[:len(words)] = words[:2]
+
+    schema_stamps[key] = hashes
+
+    return hashes
+
+
+def schema_unchanged(force=False):
+    """ Return ``True`` if the database schema sources of the current host
+        did not change since the last successful :func:`schema_task`, in
+        which case syncdb, migrate and transmeta can be skipped. Always
+        ``False`` with :param:`force`.
+
+        .. versionadded:: 5.18
+    """
+
+    if force:
+        return False
+
+    current, stored = schema_hash()
+
+    return current is not None and current == stored
+
+
+@task(alias='schema_task')
+@with_remote_configuration
+def schema_task(remote_configuration=None, args=None, force=False):
+    """ Run syncdb, migrate and the transmeta sync, unless the schema
+        sources did not change since the last time they all succeeded
+        (see :func:`schema_hash`). Then remember them as applied.
+
+        The three commands run in one Django process, see
+        :func:`django_manage_batch`.
+
+        .. note:: the database itself is not inspected: if it was
+            restored or changed by other means, use :param:`force`.
+
+        .. versionadded:: 5.18
+    """
+
+    if args is None and schema_unchanged(force):
+        LOGGER.info('Database schema sources unchanged on %s, syncdb and '
+                    'migrate skipped.', env.host_string)
+        return
+
+    # See migrate_task() for the answers.
+    commands = ['syncdb --noinput', ('migrate ' + (args or ''), 'yes')]
+
+    if 'transmeta' in remote_configuration.django_settings.INSTALLED_APPS:
+        commands.append(('sync_transmeta_db', 'y'))
+
+    django_manage_batch(commands)
+
+    hashes = schema_hash()
+
+    if args is None and hashes[0] is not None:
+        run('echo {0} > {1}'.format(hashes[0], schema_stamp_file()),
+            quiet=QUIET)
+
+        hashes[1] = hashes[0]
+
+
+@task(task_class=DjangoTask)
+def schema(args=None, force=False):
+    """ The sparks wrapper for Fabric's schema_task. """
+
+    execute_or_not(schema_task, args=args, force=force,
+                   sparks_roles=('db', 'pg', ))
+
+
 @task(task_class=DjangoTask, alias='static')
-def collectstatic(fast=True):
-    """ The sparks wrapper for Fabric's collectstatic_task. """
+def collectstatic(fast=True, force=False):
+    """ The sparks wrapper for Fabric's collectstatic_task.
 
-    execute_or_not(collectstatic_task, fast=fast, sparks_roles=('web', ))
+    .. deprecated:: 5.18 :param:`fast` is ignored, see
+        :func:`collectstatic_task`.
+    """
+
+    execute_or_not(collectstatic_task, force=force, sparks_roles=('web', ))
+
+
+STATIC_MANIFEST_MARKER = 'SPARKS_STATIC_MANIFEST'
+STATIC_MANIFEST_FILE   = '.sparks-static-manifest'
+
+# Hashes all the files collectstatic would copy (found by the staticfiles
+# finders, the first one wins like in collectstatic), plus the settings that
+# change its output. Prints the marker, the new hash and the stored one.
+STATIC_MANIFEST_SCRIPT = r'''
+import os
+import hashlib
+
+import django
+from django.conf import settings
+
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.contrib.staticfiles.finders import get_finders
+
+found = {{}}
+
+for finder in get_finders():
+    for path, storage in finder.list(['CVS', '.*', '*~']):
+        prefixed = os.path.join(getattr(storage, 'prefix', None) or '', path)
+
+        if prefixed not in found:
+            found[prefixed] = storage.path(path)
+
+digest = hashlib.sha1(repr((settings.STATIC_URL, getattr(
+    settings, 'STATICFILES_STORAGE', None))).encode('utf-8'))
+
+for prefixed in sorted(found):
+    digest.update(prefixed.encode('utf-8') + b'\0')
+
+    with open(found[prefixed], 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+
+try:
+    with open(os.path.join(settings.STATIC_ROOT, {manifest!r})) as handle:
+        stored = handle.read().strip()
+
+except (IOError, OSError):
+    stored = ''
+
+print({marker!r} + ' ' + digest.hexdigest() + ' ' + stored)
+'''
+
+
+def static_manifest():
+    """ Return the hash of the static files sources of the current host, as
+        computed now and as stored after the last collectstatic (``None``
+        if never), in one remote Python run.
+
+        .. versionadded:: 5.18
+    """
+
+    command = "{0}{1}python -c 'import base64; exec(base64.b64decode(\"{2}\"))'"\
+        .format(sparks_djsettings_env_var(), django_settings_env_var(),
+                base64.b64encode(STATIC_MANIFEST_SCRIPT.format(
+                    manifest=STATIC_MANIFEST_FILE,
+                    marker=STATIC_MANIFEST_MARKER).encode('utf-8')
+                ).decode('ascii'))
+
+    with activate_venv():
+        with cd(env.root):
+            output = run(command, quiet=True, warn_only=True,
+                         combine_stderr=False)
+
+    for line in output.splitlines():
+        if line.startswith(STATIC_MANIFEST_MARKER + ' '):
+            words = line.split()[1:] + [None]
+            return words[0], words[1]
+
+    LOGGER.warning(u'Could not compute the static files manifest on %s.',
+                   env.host_string)
+
+    return None, None
 
 
 @with_remote_configuration
-def collectstatic_task(remote_configuration=None, fast=True):
+def collectstatic_task(remote_configuration=None, fast=True, force=False):
     """ Run the Django collectstatic management command.
 
-    If :param:`fast` is ``False``, the ``STATIC_ROOT`` will be erased first.
+    .. versionchanged:: in 5.18, skipped when the static files sources did
+        not change since the last run (see :func:`static_manifest`). When
+        they did, collectstatic copies only the modified files: the
+        ``STATIC_ROOT`` is not erased anymore when :param:`fast` is
+        ``False``. Use :param:`force` to erase and rebuild it completely.
+
+    .. deprecated:: 5.18 :param:`fast` does nothing anymore, it is kept
+        for compatibility with existing command lines and fabfiles.
     """
 
     if remote_configuration.django_settings.DEBUG:
@@ -1994,13 +3175,31 @@ def collectstatic_task(remote_configuration=None, fast=True):
                     env.host_string)
         return
 
-    if not fast:
+    static_root = remote_configuration.django_settings.STATIC_ROOT
+
+    if force:
         with cd(env.root):
-            run('rm -rf "{0}"'.format(
-                remote_configuration.django_settings.STATIC_ROOT), quiet=QUIET)
+            run('rm -rf "{0}"'.format(static_root), quiet=QUIET)
+
+    else:
+        current, stored = static_manifest()
+
+        if current is not None and current == stored:
+            LOGGER.info('Static files unchanged on %s, collectstatic skipped.',
+                        env.host_string)
+            return
 
     django_manage('collectstatic --noinput')
 
+    if force:
+        # Computed after the rebuild: the sources may have changed meanwhile.
+        current = static_manifest()[0]
+
+    if current is not None:
+        with cd(env.root):
+            run('echo {0} > "{1}"'.format(current, os.path.join(
+                static_root, STATIC_MANIFEST_FILE)), quiet=QUIET)
+
 
 # ••••••••••••••••••••••••••••••••••••••••••••••••••••••••• Direct-target tasks
 
@@ -2080,11 +3279,12 @@ def maintenance_mode(fast=True):
 def maintenance_mode_task(fast):
 
     with cd(env.root):
-        if exists('MAINTENANCE_MODE'):
+        if remote_exists('MAINTENANCE_MODE'):
             LOGGER.info('Already in maintenance mode, not restarting services.')
             return False
 
         run('touch MAINTENANCE_MODE', quiet=QUIET)
+        invalidate_exists('MAINTENANCE_MODE')
         return True
 
 
@@ -2106,8 +3306,8 @@ def operational_mode(fast=True):
 def operational_mode_task(fast):
 
     with cd(env.root):
-        if exists('MAINTENANCE_MODE'):
-            run('rm -f  MAINTENANCE_MODE', quiet=QUIET)
+        if remote_exists('MAINTENANCE_MODE'):
+            remote_rm('MAINTENANCE_MODE')
             return True
         else:
             LOGGER.info('Already in operational mode, not restarting services.')
@@ -2137,15 +3337,45 @@ def services_action(fast=False, action=None):
     # NOTE: 'web' is already done (just before)
     roles_to_act_on = worker_roles[:] + ['beat', 'flower', 'shell']
 
-    # Run this multiple time, for each role:
-    # each of them has a dedicated supervisor configuration,
-    # even when running on the same machine.
-    # Degrouping role execution ensures execute_or_not() gets an unique
-    # role for each host it will execute on. This is a limitation of the
-    # the execute_or_not() function.
-    for role in roles_to_act_on:
-        execute_or_not(service_action_worker_celery, fast=fast,
-                       action=action, sparks_roles=(role, ))
+    # Each role has a dedicated supervisor configuration, even when
+    # running on the same machine. Instead of one execute() pass per
+    # role, we group roles per host: hosts run in parallel, while the
+    # roles of a given host are handled one after the other.
+    host_roles = roles_by_host(roles_to_act_on)
+
+    if not host_roles:
+        LOGGER.debug('Not acting on services: no role(s) “%s” in '
+                     'current context.', ', '.join(roles_to_act_on))
+        return
+
+    if env.host_string:
+        # We are already running on one host (eg. via -H): just
+        # act on its roles, don't spread over the other hosts.
+        if env.host_string in host_roles:
+            service_action_roles_task(fast=fast, action=action,
+                                      host_roles=host_roles)
+        return
+
+    execute_in_batches(service_action_roles_task, fast=fast, action=action,
+                       host_roles=host_roles, hosts=host_roles.keys())
+
+
+@task(task_class=DjangoTask)
+def service_action_roles_task(fast=False, action=None, host_roles=None):
+    """ Run :func:`service_action_worker_celery` for each role of the
+        current host, sequentially. Used by :func:`services_action`.
+
+        :param host_roles: a ``dict`` of hosts to their list of roles,
+            as returned by :func:`sparks.fabric.roles_by_host`.
+
+        .. versionadded:: 5.18
+    """
+
+    for role in (host_roles or {}).get(env.host_string, []):
+        # Hosts are not picked via roles here, thus get_current_role()
+        # will find the role in env.sparks_current_role.
+        with settings(sparks_current_role=role):
+            service_action_worker_celery(fast=fast, action=action)
 
 
 @task(alias='restart')
@@ -2218,7 +3448,7 @@ def runable(fast=False, upgrade=False):
 
     compilemessages()  # already wraps execute_or_not()
 
-    collectstatic(fast=fast)
+    collectstatic()
 
     #
     # TODO: add 'mysql' and others.
@@ -2227,10 +3457,11 @@ def runable(fast=False, upgrade=False):
     if not fast:
         execute_or_not(createdb, sparks_roles=('db', 'pg', ))
 
-    # TODO: test if Django 1.7+, and don't run in this case.
-    execute_or_not(syncdb, sparks_roles=('db', 'pg', ))
-
-    migrate()  # already wraps execute_or_not()
+    # TODO: test if Django 1.7+, and don't run syncdb in this case.
+    #
+    # A full deploy always checks the database, a fast one skips
+    # syncdb and migrate if the schema sources did not change.
+    schema(force=not fast)  # already wraps execute_or_not()
 
 
 @task(aliases=('fast', 'fastdeploy', ))
@@ -2304,6 +3535,7 @@ def role(*roles):
         del roledefs[role]
 
     env.roledefs = roledefs
+    index_roledefs()
 
     # This special case requires a special patch ;-)
     if len(env.roledefs.get('beat', [])) == 0:
@@ -2359,6 +3591,8 @@ def pick(*machines):
                 new_hosts_for_role.append(machine)
         env.roledefs[role] = new_hosts_for_role
 
+    index_roledefs()
+
     # This special case requires a special patch ;-)
     if len(env.roledefs.get('beat', [])) == 0:
         sparks_options = getattr(env, 'sparks_options', {})
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Compile gettext catalogs (``.po`` → ``.mo``) without Django.
+
+This module is sent as-is to the remote side by
+:func:`sparks.django.fabfile.handlemessages` and run there with
+:func:`main`, in one Python process for all languages and applications.
+It must thus stay self-contained and compatible with Python 2 and 3.
+
+Catalogs whose ``.po`` file did not change since their last compilation
+(their hashes are kept in a ``.sparks-messages.json`` file in each
+``locale`` directory) are skipped. The others are compiled with
+:program:`msgfmt --check-format`, like Django's ``compilemessages`` does,
+or with the pure-Python :func:`compile_po` when :program:`msgfmt` is
+not installed.
+
+.. versionadded:: 5.18
+"""
+
+import os
+import ast
+import sys
+import json
+import array
+import struct
+import hashlib
+import subprocess
+
+MANIFEST_NAME = '.sparks-messages.json'
+RESULT_MARKER = 'SPARKS_MESSAGES'
+
+
+def unquote(string):
+    """ Return the UTF-8 bytes of a quoted PO string. """
+
+    return ast.literal_eval('u' + string).encode('utf-8')
+
+
+def parse_po(content):
+    """ Return the translated messages of the PO :param:`content` (a unicode
+        string) as a ``dict`` of ``.mo`` keys to values. Fuzzy and
+        untranslated entries are left out, like :program:`msgfmt` does,
+        except the header (empty ``msgid``), always kept: it holds the
+        charset and plural forms :mod:`gettext` needs. """
+
+    messages = {}
+    entry    = {}
+    state    = {'section': None, 'fuzzy': False}
+
+    def add():
+        msgstr = entry.get('msgstr', {})
+
+        if 'msgid' in entry and (not state['fuzzy'] or not entry['msgid']):
+            msgid = entry['msgid']
+
+            if 'msgid_plural' in entry:
+                msgid += b'\0' + entry['msgid_plural']
+                value  = b'\0'.join(msgstr[index] for index in sorted(msgstr))
+
+            else:
+                value = msgstr.get(0, b'')
+
+            if 'msgctxt' in entry:
+                msgid = entry['msgctxt'] + b'\x04' + msgid
+
+            if value.replace(b'\0', b''):
+                messages[msgid] = value
+
+        entry.clear()
+        state['section'] = None
+        state['fuzzy']   = False
+
+    for line in content.splitlines():
+        line = line.strip()
+
+        if not line:
+            continue
+
+        in_msgstr = isinstance(state['section'], tuple)
+
+        if in_msgstr and (line.startswith('#') or line.startswith('msgctxt')
+                          or line.startswith('msgid ')):
+            add()
+
+        if line.startswith('#'):
+            if line.startswith('#,') and 'fuzzy' in line:
+                state['fuzzy'] = True
+
+        elif line.startswith('msgctxt '):
+            state['section'] = 'msgctxt'
+            entry['msgctxt'] = unquote(line[8:])
+
+        elif line.startswith('msgid_plural '):
+            state['section'] = 'msgid_plural'
+            entry['msgid_plural'] = unquote(line[13:])
+
+        elif line.startswith('msgid '):
+            state['section'] = 'msgid'
+            entry['msgid'] = unquote(line[6:])
+
+        elif line.startswith('msgstr['):
+            index = int(line[7:line.index(']')])
+            state['section'] = ('msgstr', index)
+            entry.setdefault('msgstr', {})[index] = unquote(
+                line[line.index(']') + 1:].strip())
+
+        elif line.startswith('msgstr '):
+            state['section'] = ('msgstr', 0)
+            entry.setdefault('msgstr', {})[0] = unquote(line[7:])
+
+        elif line.startswith('"') and state['section'] is not None:
+            if in_msgstr:
+                entry['msgstr'][state['section'][1]] += unquote(line)
+
+            else:
+                entry[state['section']] += unquote(line)
+
+        else:
+            raise ValueError(u'unexpected PO line: {0}'.format(line))
+
+    if isinstance(state['section'], tuple):
+        add()
+
+    return messages
+
+
+def generate_mo(messages):
+    """ Return the binary ``.mo`` content of :param:`messages`. """
+
+    keys    = sorted(messages)
+    ids     = b''
+    strs    = b''
+    offsets = []
+
+    for key in keys:
+        offsets.append((len(ids), len(key), len(strs), len(messages[key])))
+        ids  += key + b'\0'
+        strs += messages[key] + b'\0'
+
+    keys_start   = 7 * 4 + 16 * len(keys)
+    values_start = keys_start + len(ids)
+    key_offsets   = []
+    value_offsets = []
+
+    for key_offset, key_length, value_offset, value_length in offsets:
+        key_offsets   += [key_length, key_offset + keys_start]
+        value_offsets += [value_length, value_offset + values_start]
+
+    table = array.array('i', key_offsets + value_offsets)
+    table = table.tobytes() if hasattr(table, 'tobytes') else table.tostring()
+
+    return struct.pack('Iiiiiii', 0x950412de, 0, len(keys), 7 * 4,
+                       7 * 4 + len(keys) * 8, 0, 0) + table + ids + strs
+
+
+def compile_po(po_path, mo_path):
+    """ Pure-Python :program:`msgfmt`. """
+
+    with open(po_path, 'rb') as handle:
+        messages = parse_po(handle.read().decode('utf-8'))
+
+    with open(mo_path, 'wb') as handle:
+        handle.write(generate_mo(messages))
+
+
+def has_msgfmt():
+
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        if os.access(os.path.join(directory, 'msgfmt'), os.X_OK):
+            return True
+
+    return False
+
+
+def compile_locale_dir(locale_dir, languages, use_msgfmt):
+    """ Compile the changed catalogs of :param:`languages` in
+        :param:`locale_dir`. Return ``(compiled, skipped, errors)``. """
+
+    manifest_path = os.path.join(locale_dir, MANIFEST_NAME)
+
+    try:
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+
+    except (IOError, OSError, ValueError):
+        manifest = {}
+
+    compiled, skipped, errors = 0, 0, []
+
+    for language in languages:
+        messages_dir = os.path.join(locale_dir, language, 'LC_MESSAGES')
+
+        if not os.path.isdir(messages_dir):
+            continue
+
+        for name in sorted(os.listdir(messages_dir)):
+            if not name.endswith('.po'):
+                continue
+
+            po_path  = os.path.join(messages_dir, name)
+            mo_path  = po_path[:-3] + '.mo'
+            key      = os.path.join(language, name)
+
+            with open(po_path, 'rb') as handle:
+                digest = hashlib.sha1(handle.read()).hexdigest()
+
+            if manifest.get(key) == digest and os.path.exists(mo_path):
+                skipped += 1
+                continue
+
+            try:
+                if use_msgfmt:
+                    process = subprocess.Popen(
+                        ['msgfmt', '--check-format', '-o', mo_path, po_path],
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                    output = process.communicate()
+
+                    if process.returncode:
+                        raise RuntimeError(output[1].decode('utf-8',
+                                                            'replace'))
+
+                else:
+                    compile_po(po_path, mo_path)
+
+            except Exception as exc:
+                errors.append(u'{0}: {1}'.format(po_path, exc))
+                manifest.pop(key, None)
+
+            else:
+                manifest[key] = digest
+                compiled += 1
+
+    if compiled or errors:
+        with open(manifest_path, 'w') as handle:
+            json.dump(manifest, handle)
+
+    return compiled, skipped, errors
+
+
+def main(arguments):
+    """ Compile the catalogs described by :param:`arguments`, a JSON
+        ``dict`` with ``locale_dirs`` and ``languages`` keys. If
+        ``first_only`` is true and the first locale directory exists,
+        it is compiled alone (like a project-wide ``locale`` directory
+        replaces the applications ones). """
+
+    arguments   = json.loads(arguments)
+    use_msgfmt  = has_msgfmt()
+    locale_dirs = arguments['locale_dirs']
+    compiled    = skipped = 0
+    errors      = []
+
+    if arguments.get('first_only', False) and locale_dirs \
+            and os.path.isdir(locale_dirs[0]):
+        locale_dirs = locale_dirs[:1]
+
+    for locale_dir in locale_dirs:
+        if not os.path.isdir(locale_dir):
+            continue
+
+        result = compile_locale_dir(locale_dir, arguments['languages'],
+                                    use_msgfmt)
+
+        compiled += result[0]
+        skipped  += result[1]
+        errors   += result[2]
+
+    for error in errors:
+        sys.stderr.write(error + '\n')
+
+    sys.stdout.write('{0} compiled={1} skipped={2} errors={3} '
+                     'msgfmt={4}\n'.format(RESULT_MARKER, compiled, skipped,
+                                           len(errors), use_msgfmt))
+
+    if errors:
+        sys.exit(1)
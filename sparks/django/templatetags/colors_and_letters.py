@@ -31,8 +31,6 @@ License along with sparks.  If not, see http://www.gnu.org/licenses/
 
 import re
 import logging
-import difflib
-import mistune
 
 from math import pow
 
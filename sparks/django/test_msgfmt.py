@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+""" Round-trip tests for :mod:`sparks.django.msgfmt`. """
+
+import os
+import shutil
+import gettext
+import tempfile
+import unittest
+
+from .msgfmt import compile_po
+
+PO_CONTENT = u'''# A catalog with a fuzzy header, like makemessages generates.
+#, fuzzy
+msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Plural-Forms: nplurals=2; plural=(n > 1);\\n"
+
+msgid "Hello"
+msgstr "Bonjour é"
+
+#, fuzzy
+msgid "Goodbye"
+msgstr "Au revoir"
+
+msgctxt "month"
+msgid "May"
+msgstr "Mai"
+
+msgid "one apple"
+msgid_plural "%d apples"
+msgstr[0] "une pomme"
+msgstr[1] "%d pommes"
+'''
+
+
+class CompilePoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.po_path   = os.path.join(self.directory, 'django.po')
+        self.mo_path   = os.path.join(self.directory, 'django.mo')
+
+        with open(self.po_path, 'wb') as handle:
+            handle.write(PO_CONTENT.encode('utf-8'))
+
+        compile_po(self.po_path, self.mo_path)
+
+        with open(self.mo_path, 'rb') as handle:
+            self.translations = gettext.GNUTranslations(handle)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def gettext(self, message):
+        translate = getattr(self.translations, 'ugettext',
+                            self.translations.gettext)
+        return translate(message)
+
+    def test_header_is_kept(self):
+        self.assertEqual(self.translations.info()['content-type'],
+                         'text/plain; charset=UTF-8')
+        self.assertEqual(self.translations.charset(), 'UTF-8')
+
+    def test_translations(self):
+        self.assertEqual(self.gettext(u'Hello'), u'Bonjour é')
+        self.assertEqual(self.gettext(u'Goodbye'), u'Goodbye')
+
+    def test_context_and_plurals(self):
+        self.assertEqual(self.gettext(u'month\x04May'), u'Mai')
+
+        ngettext = getattr(self.translations, 'ungettext',
+                           self.translations.ngettext)
+
+        self.assertEqual(ngettext(u'one apple', u'%d apples', 1),
+                         u'une pomme')
+        self.assertEqual(ngettext(u'one apple', u'%d apples', 2),
+                         u'%d pommes')
+
+
+if __name__ == '__main__':
+    unittest.main()
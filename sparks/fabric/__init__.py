@@ -4,28 +4,18 @@ from __future__ import print_function
 import sys
 import os
 import re
-import ast
+import posixpath
+import time
+import json
+import zlib
+import base64
+import math
 import string
 import random
 import logging
-import platform
 import functools
-try:
-    import cPickle as pickle
-except:
-    import pickle
-
-try:
-    # The fast Python 2.7.x module
-    import cStringIO as StringIO
-except:
-    try:
-        # Python 2.x fallback
-        from StringIO import StringIO
-    except ImportError:
-        # Python 3.x
-        from io import StringIO
-
+import threading
+from contextlib import contextmanager
 from ..foundations.classes import SimpleObject
 
 from . import nofabric
@@ -36,12 +26,16 @@ try:
     from fabric.api              import run as fabric_run
     from fabric.api              import sudo as fabric_sudo
     from fabric.api              import local as fabric_local
-    from fabric.operations       import get, put
-    from fabric.context_managers import prefix, cd, lcd, hide
+    from fabric.operations       import get
+    from fabric.operations       import put as fabric_put
+    from fabric.context_managers import prefix, cd, lcd, hide, settings
     from fabric.colors           import cyan
+    from fabric.utils            import abort
 
     # imported from utils
     from fabric.contrib.files    import exists  # NOQA
+    from fabric.contrib.files    import upload_template as \
+        fabric_upload_template
 
     # used in sparks submodules, not directly here. Thus the # NOQA.
     from fabric.api              import task  # NOQA
@@ -65,6 +59,11 @@ try:
     #
 
     def run(*args, **kwargs):
+        queued = queue_in_batch('run', args, kwargs)
+
+        if queued is not None:
+            return queued
+
         if is_localhost(env.host_string):
             return nofabric.run(*args, **kwargs)
 
@@ -79,12 +78,35 @@ try:
             return fabric_local(*args, **kwargs)
 
     def sudo(*args, **kwargs):
+        queued = queue_in_batch('sudo', args, kwargs)
+
+        if queued is not None:
+            return queued
+
         if is_localhost(env.host_string):
             return nofabric.sudo(*args, **kwargs)
 
         else:
             return fabric_sudo(*args, **kwargs)
 
+    # These write on the remote side: forget what we knew there.
+    # See remote_exists().
+
+    def put(local_path=None, remote_path=None, *args, **kwargs):
+        try:
+            return fabric_put(local_path, remote_path, *args, **kwargs)
+
+        finally:
+            invalidate_exists(remote_path)
+
+    def upload_template(filename, destination, *args, **kwargs):
+        try:
+            return fabric_upload_template(filename, destination,
+                                          *args, **kwargs)
+
+        finally:
+            invalidate_exists(destination)
+
 except ImportError:
     # If fabric is not available, this means we are imported from 1nstall.py,
     # or more generaly fabric is not installed.
@@ -101,9 +123,35 @@ except ImportError:
 DEBUG = bool(os.environ.get('SPARKS_DEBUG', False))
 QUIET = not DEBUG and not bool(os.environ.get('SPARKS_VERBOSE', True))
 LOGGER = logging.getLogger(__name__)
-remote_configuration = None
 local_configuration  = None
 
+# In lazy mode, importing sparks has no side effect at all: the logging
+# is configured at first decorated call instead of at import time.
+LAZY = bool(os.environ.get('SPARKS_LAZY', False))
+logging_configured = False
+
+# SFTP sessions reuse and connection counters, see sparks.fabric.connections.
+REUSE_CONNECTIONS = not os.environ.get('SPARKS_NO_CONNECTION_REUSE', False)
+
+# One configuration per host, for the whole session. See get_configuration().
+configurations       = {}
+configurations_locks = {}
+configurations_lock  = threading.Lock()
+
+# Remote hosts facts (OS, release, architecture, home…) almost never change.
+# They are cached locally between `fab` runs. Set the TTL (in seconds) to 0
+# to disable the cache completely.
+FACTS_CACHE_DIR = os.path.expanduser(os.environ.get('SPARKS_FACTS_CACHE_DIR',
+                                                    '~/.cache/sparks/facts'))
+FACTS_CACHE_TTL = int(os.environ.get('SPARKS_FACTS_TTL', 86400))
+
+# Remote Django settings are the same on all hosts of an environment, for a
+# given git revision. In serial mode, they are fetched once and shared, in
+# memory only: they hold secrets (database passwords, broker credentials…)
+# which must not end up on the controller disk.
+# See RemoteConfiguration.get_django_settings().
+shared_django_settings = {}
+
 all_roles = [
     'web', 'proxy',
     'db', 'memcache', 'mysql',
@@ -163,6 +211,20 @@ for worker_type, worker_name in (
 
 worker_roles = [r for r in all_roles if r.startswith('worker')]
 
+# Concurrency caps of tasks that should not run on all hosts at once,
+# as a number of hosts or a percentage of the hosts the task runs on.
+# See `task_pool_size()`.
+task_pool_sizes = {
+    # Don't hammer the central repository.
+    'git_pull_task': 4,
+
+    # Keep most of the fleet serving while restarting.
+    'service_action_nginx': '25%',
+    'service_action_webserver_gunicorn': '25%',
+    'service_action_worker_celery': '25%',
+    'service_action_roles_task': '25%',
+}
+
 
 # ===================================================== Fabric helper functions
 
@@ -181,22 +243,87 @@ def custom_roles():
     return custom_roles
 
 
+def build_roles_index(roledefs):
+    """ Return a tuple ``(hosts_roles, roles_hosts)`` of two ``dict``:
+        hosts to the ``set`` of their roles, and roles to the
+        ``frozenset`` of their hosts.
+
+        .. versionadded:: 5.18
+    """
+
+    hosts_roles = {}
+    roles_hosts = {}
+
+    for role, hosts in roledefs.items():
+        roles_hosts[role] = frozenset(hosts)
+
+        for host in hosts:
+            hosts_roles.setdefault(host, set()).add(role)
+
+    return hosts_roles, roles_hosts
+
+
+def index_roledefs():
+    """ (Re-)build the roles index of the current ``env.roledefs``.
+
+        Call it after any in-place change of ``env.roledefs``;
+        :func:`set_roledefs_and_parallel`, and the ``role`` and ``pick``
+        tasks of :mod:`sparks.django.fabfile` already do it.
+
+        .. versionadded:: 5.18
+    """
+
+    env.sparks_roles_index = (env.roledefs, len(env.roledefs),
+                              build_roles_index(env.roledefs))
+
+    return env.sparks_roles_index[2]
+
+
+def get_roles_index():
+    """ Return the ``(hosts_roles, roles_hosts)`` index of ``env.roledefs``
+        (see :func:`build_roles_index`), building it if needed.
+
+        The index is rebuilt if ``env.roledefs`` was replaced or
+        if roles were added or removed since the last build.
+
+        .. versionadded:: 5.18
+    """
+
+    index = env.get('sparks_roles_index', None)
+
+    if index is None or index[0] is not env.roledefs \
+            or index[1] != len(env.roledefs):
+        return index_roledefs()
+
+    return index[2]
+
+
 def non_empty_roles(roles):
     """ Keep only non-empty roles. """
 
-    non_empty = []
+    roles_hosts = get_roles_index()[1]
+
+    return [role for role in roles if roles_hosts.get(role)]
+
 
-    # LOGGER.debug(u'__all__ is: %s', env.roledefs.get('__all__'))
-    # LOGGER.debug(u'roles is: %s', roles)
+def roles_by_host(roles):
+    """ Return a ``dict`` of hosts to the list of their roles, for
+        the non-empty roles in :param:`roles`. The roles lists keep
+        the :param:`roles` order.
 
-    for role in roles:
-        if env.roledefs.get(role, []) != []:
-            non_empty.append(role)
+        .. versionadded:: 5.18
+    """
+
+    hosts_roles = {}
 
-        # else:
-        #     LOGGER.debug(u'Role %s has no host, removing.', role)
+    for role in non_empty_roles(roles):
+        for host in env.roledefs[role]:
+            hosts_roles.setdefault(host, [])
 
-    return non_empty
+            if role not in hosts_roles[host]:
+                hosts_roles[host].append(role)
+
+    return hosts_roles
 
 
 def execute_or_not(task, *args, **kwargs):
@@ -250,9 +377,10 @@ def execute_or_not(task, *args, **kwargs):
         if non_empty:
 
             should_run = False
+            host_roles = get_roles_index()[0].get(env.host_string, ())
 
             for role in non_empty:
-                if env.host_string in env.roledefs[role]:
+                if role in host_roles:
                     should_run = True
 
                     if not hasattr(env.host_string, 'role') \
@@ -294,7 +422,7 @@ def execute_or_not(task, *args, **kwargs):
             LOGGER.debug(u'One-shot mode: execute(%s, *%s, **%s)',
                          task, args, kwargs)
 
-            return execute(task, *args, **kwargs)
+            return execute_in_batches(task, *args, **kwargs)
 
         else:
             LOGGER.debug('Not executing %s(%s, %s): no role(s) “%s” in '
@@ -318,7 +446,162 @@ def merge_roles_hosts(roledefs):
     return sorted(list(merged))
 
 
-def set_roledefs_and_parallel(roledefs, parallel=False):
+def get_task_name(task):
+    """ Return the function name of a Fabric task, whatever its class. """
+
+    # WrappedCallableTask stores the function in `wrapped`, DjangoTask
+    # and other custom classes in `func`; Fabric's own `name` is not
+    # reliable (it's 'undefined' for custom task classes).
+    for attr_name in ('wrapped', 'func', ):
+        task = getattr(task, attr_name, task)
+
+    return getattr(task, '__name__', str(task))
+
+
+def hosts_count_from_option(value, nbhosts):
+    """ Convert a pool or batch size option to a number of hosts (>= 1).
+
+        :param value: an integer, or a percentage string like ``'25%'``,
+            relative to :param:`nbhosts`.
+
+        .. versionadded:: 5.18
+    """
+
+    value = str(value).strip()
+
+    if value.endswith('%'):
+        count = int(math.ceil(nbhosts * float(value[:-1]) / 100.0))
+
+    else:
+        count = int(value)
+
+    return max(1, min(count, nbhosts))
+
+
+def parallel_maximum():
+    """ Return the maximum pool size for parallel executions.
+
+        It can be forced via the ``SPARKS_PARALLEL_MAX`` environment
+        variable. Else, it is computed from the local machine resources:
+        4 Fabric processes per CPU core, without using more than one
+        eighth of the allowed open files (each SSH connection needs some),
+        and never less than 10, the historical sparks value.
+
+        .. versionadded:: 5.18
+    """
+
+    try:
+        maximum = int(os.environ['SPARKS_PARALLEL_MAX'])
+
+    except (KeyError, ValueError):
+        pass
+
+    else:
+        return 10 if maximum < 2 else maximum
+
+    import multiprocessing
+
+    maximum = multiprocessing.cpu_count() * 4
+
+    try:
+        import resource
+
+    except ImportError:
+        # Not on an Unix system.
+        pass
+
+    else:
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+        if soft_limit > 0:
+            maximum = min(maximum, soft_limit // 8)
+
+    return max(10, maximum)
+
+
+def task_pool_size(task, nbhosts):
+    """ Return the pool size to use for running :param:`task` on
+        :param:`nbhosts` hosts: the smallest of ``env.pool_size``
+        and the task concurrency cap, if any.
+
+        Caps are defined in :data:`task_pool_sizes` and can be
+        overriden or extended via ``env.sparks_options['pool_sizes']``,
+        a ``dict`` of task names to integers or percentages.
+
+        .. versionadded:: 5.18
+    """
+
+    pool_size = env.pool_size or nbhosts
+
+    pool_sizes = task_pool_sizes.copy()
+    pool_sizes.update(getattr(env, 'sparks_options', {}).get('pool_sizes', {}))
+
+    cap = pool_sizes.get(get_task_name(task), None)
+
+    if cap is not None:
+        pool_size = min(pool_size, hosts_count_from_option(cap, nbhosts))
+
+    return max(1, min(pool_size, nbhosts))
+
+
+def execute_in_batches(task, *args, **kwargs):
+    """ Run Fabric's ``execute()``, honoring per-task concurrency caps
+        (see :func:`task_pool_size`) and the rolling-batch mode (see
+        :func:`set_roledefs_and_parallel`).
+
+        In rolling-batch mode, hosts are split in batches which are run
+        one after the other; a batch starts only when the previous one
+        is complete. A failure in a batch aborts the whole execution,
+        like Fabric does, thus next batches are not touched.
+
+        Returns the merged ``execute()`` results of all batches.
+
+        .. versionadded:: 5.18
+    """
+
+    hosts = kwargs.get('hosts', None)
+
+    if hosts is None:
+        hosts = merge_roles_hosts(dict((role, env.roledefs.get(role, []))
+                                       for role in kwargs.get('roles', [])))
+
+    else:
+        hosts = sorted(set(hosts))
+
+    nbhosts = len(hosts)
+    batch   = env.get('sparks_batch', None)
+
+    if not env.parallel or nbhosts < 2:
+        return execute(task, *args, **kwargs)
+
+    with settings(pool_size=task_pool_size(task, nbhosts)):
+        if not batch:
+            return execute(task, *args, **kwargs)
+
+        batch_size = hosts_count_from_option(batch, nbhosts)
+
+        if batch_size >= nbhosts:
+            return execute(task, *args, **kwargs)
+
+        results = {}
+        excluded = list(kwargs.pop('exclude_hosts', []))
+
+        for index in range(0, nbhosts, batch_size):
+            batch_hosts = hosts[index:index + batch_size]
+
+            LOGGER.info(u'Running %s on batch %s/%s: %s.',
+                        get_task_name(task), index // batch_size + 1,
+                        int(math.ceil(float(nbhosts) / batch_size)),
+                        u', '.join(batch_hosts))
+
+            results.update(execute(task, *args, exclude_hosts=excluded + [
+                host for host in hosts if host not in batch_hosts
+            ], **kwargs))
+
+        return results
+
+
+def set_roledefs_and_parallel(roledefs, parallel=False, batch=None):
     """ Define a sparks-compatible but Fabric-happy ``env.roledefs``.
         It's just a shortcut to avoid doing the repetitive:
 
@@ -338,25 +621,39 @@ def set_roledefs_and_parallel(roledefs, parallel=False):
         count merged hosts and set parallel to this number. It defaults
         to ``False`` (no parallel execution).
 
-        .. note:: the pool size is always clamped to 10 hosts to avoid making
-            your machine and network suffer. If you ever would like to raise
-            this maximum value, just set your shell environment
-            variable ``SPARKS_PARALLEL_MAX`` to any integer value you want,
-            and don't ever rant.
+        .. note:: the pool size is always clamped to a maximum, computed
+            from your local machine resources (see :func:`parallel_maximum`)
+            to avoid making your machine and network suffer. If you ever
+            would like to force this maximum value, just set your shell
+            environment variable ``SPARKS_PARALLEL_MAX`` to any integer
+            value you want, and don't ever rant.
+
+        Some tasks have their own concurrency cap, see
+        :func:`task_pool_size`.
+
+        Set :param:`batch` to an integer or a percentage (eg. ``'25%'``)
+        to enable the rolling-batch mode: each task will run on hosts by
+        batches of this size, one batch after the other. Use it to
+        deploy large fleets without taking all of them down at once.
 
         .. versionadded:: new in version 2.0.
 
         .. versionchanged:: in version 2.1, this method was named
             after ``set_roledefs_and_roles_or_hosts``, but the whole process
             was still under design.
+
+        .. versionchanged:: in version 5.18, the pool size is computed from
+            the ``__all__`` role instead of ``env.hosts``, the default
+            maximum is not fixed to 10 anymore and the :param:`batch`
+            argument was added.
     """
 
-    maximum = int(os.environ.get('SPARKS_PARALLEL_MAX', 10))
+    setup_connections()
 
-    if maximum < 2:
-        maximum = 10
+    maximum = parallel_maximum()
 
     env.roledefs = roledefs
+    env.sparks_batch = batch
 
     # LOGGER.debug(u'Fabric roledefs set to: %s', env.roledefs)
 
@@ -375,12 +672,14 @@ def set_roledefs_and_parallel(roledefs, parallel=False):
         '__all__': merge_roles_hosts(env.roledefs),
     })
 
+    index_roledefs()
+
     LOGGER.debug(u'set_roledefs_and_parallel(): role “__all__” includes %s',
                  u', '.join(env.roledefs['__all__']))
 
     if parallel is True:
         env.parallel = True
-        nbhosts = len(set(env.hosts))
+        nbhosts = len(env.roledefs['__all__']) or len(set(env.hosts)) or 1
         env.pool_size = maximum if nbhosts > maximum else nbhosts
 
     else:
@@ -445,308 +744,953 @@ def worker_information_from_role(role):
     return '', ''
 
 
-# ================================================ general-purpose Fabric tasks
+# ============================================================ Commands batching
 
-try:
-    @task
-    def get_dir_with_sudo(remote_path, local_path=None):
+# The batch of the current thread, see batch().
+batch_state = threading.local()
 
-        with cd(remote_path):
-            source_basename = os.path.basename(remote_path)
+# run() / sudo() keyword arguments a batch knows how to honor. Calls with
+# any other argument are run immediately (after the queued ones).
+BATCHABLE_KWARGS = set(('quiet', 'warn_only', 'user', 'pty', ))
 
-            print('Downloading {0}:{1}…'.format(env.host_string, remote_path),
-                  end='')
-            sys.stdout.flush()
 
-            save_file_name = '../{0}-copy-{1}.tar.gz'.format(
-                source_basename, generate_random_name())
-            while exists(save_file_name):
-                save_file_name = '../{0}-copy-{1}.tar.gz'.format(
-                    source_basename, generate_random_name())
+class BatchResult(object):
+    """ Lazy result of a batched :func:`run` or :func:`sudo` call.
 
-            # chmod will allow get() to succeed, provided the
-            # user has correct access to full containing path…
-            sudo("tar -czf '{0}' . ; chmod 644 '{0}'".format(save_file_name),
-                 quiet=True)
+        It behaves like Fabric's ``_AttributeString`` (``.succeeded``,
+        ``.failed``, ``.return_code``, string comparisons and operations…).
+        Using it before the end of the batch runs the queued commands
+        immediately, thus code depending on a previous result still works
+        as expected, it just doesn't get the batching benefit.
 
-            with hide('running', 'stdout', 'stderr'):
-                downloaded = get(save_file_name, local_path)[0]
+        .. versionadded:: 5.18
+    """
 
-            sudo('rm -f "{0}"'.format(save_file_name), quiet=True)
+    def __init__(self, commands_batch):
+        self._batch  = commands_batch
+        self._result = None
 
-            local_dirname, local_basename = downloaded.rsplit(os.sep, 1)
+    def _resolve(self):
+        if self._result is None:
+            self._batch.flush()
 
-            local_full_name = os.path.join(local_dirname, source_basename)
+        return self._result
 
-            with lcd(local_dirname):
-                with hide('running', 'stdout', 'stderr'):
-                    local('mkdir -p "{0}"'.format(source_basename))
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
 
-                    with lcd(source_basename):
-                        local('tar -xzf "../{0}"'.format(local_basename))
+        return getattr(self._resolve(), name)
 
-                    local('rm -f "{0}"'.format(local_basename))
+    def __str__(self):
+        return str(self._resolve())
 
-                print('into {1} directory.'.format(remote_path,
-                      local_full_name))
+    def __unicode__(self):
+        return unicode(self._resolve())
 
-                return local_full_name
+    def __repr__(self):
+        return repr(self._resolve())
 
-    @task
-    def put_dir_with_sudo(local_path, remote_path):
-        # TODO: implement remote_path=None & return remote_path
+    def __eq__(self, other):
+        return self._resolve() == other
 
-        with lcd(local_path):
-            source_basename = os.path.basename(local_path)
+    def __ne__(self, other):
+        return self._resolve() != other
 
-            print('Uploading {0} to {1}:{2}…'.format(local_path,
-                  env.host_string, remote_path), end='')
-            sys.stdout.flush()
+    def __hash__(self):
+        return hash(self._resolve())
 
-            save_file_name = '../{0}-copy-{1}.tar.gz'.format(
-                source_basename, generate_random_name())
-            while os.path.exists(save_file_name):
-                save_file_name = '../{0}-copy-{1}.tar.gz'.format(
-                    source_basename, generate_random_name())
+    def __nonzero__(self):
+        return bool(self._resolve())
 
-            with hide('running', 'stdout', 'stderr'):
-                local("tar -czf '{0}' . ".format(save_file_name))
+    __bool__ = __nonzero__
 
-            remote_dirname, remote_basename = remote_path.rsplit(os.sep, 1)
+    def __len__(self):
+        return len(self._resolve())
 
-            with hide('running', 'stdout', 'stderr'):
-                put(save_file_name, remote_dirname, use_sudo=True)
-                local('rm -f "{0}"'.format(save_file_name))
+    def __iter__(self):
+        return iter(self._resolve())
 
-            with cd(remote_dirname):
-                with hide('running', 'stdout', 'stderr'):
-                    sudo('mkdir -p "{0}"'.format(remote_basename))
+    def __contains__(self, item):
+        return item in self._resolve()
 
-                    with cd(remote_basename):
-                        sudo('tar -xzf "{0}"'.format(save_file_name))
-                        sudo('rm -f "{0}"'.format(save_file_name))
+    def __getitem__(self, key):
+        return self._resolve()[key]
 
-                print(' done.')
+    def __add__(self, other):
+        return self._resolve() + other
 
-except NameError:
-    # Fabric is not yet installed. Don't crash. Happens during the first setup.
-    pass
+    def __radd__(self, other):
+        return other + self._resolve()
 
+    def __mod__(self, other):
+        return self._resolve() % other
 
-# =================================================== Remote system information
 
-def is_localhost(hostname):
-    return hostname in ('localhost', 'localhost.localdomain',
-                        '127.0.0.1', '127.0.1.1', '::1')
+class CommandsBatch(object):
+    """ A queue of remote commands, sent as one shell script per host
+        and per ``run`` / ``sudo`` (and sudo user) sequence.
 
+        Each command runs in its own sub-shell, in the ``cd()``
+        and ``prefix()`` context it was queued in. Its output and exit
+        code are delimited in the script output by a random marker.
+        Like with Fabric, a failing command aborts the script (and the
+        Fabric run), unless it was queued with ``warn_only`` or ``quiet``.
 
-def is_local_environment():
+        .. versionadded:: 5.18
+    """
 
-    is_local = env.environment == 'local' or (
-        env.environment == 'test'
-            and is_localhost(env.host_string))
+    def __init__(self):
+        self.queue  = []
+        self.marker = 'SPARKS_BATCH_' + generate_random_name()
 
-    return is_local
+    def run(self, command, **kwargs):
+        return self.add('run', command, kwargs)
 
+    def sudo(self, command, **kwargs):
+        return self.add('sudo', command, kwargs)
 
-def is_development_environment():
+    def add(self, kind, command, kwargs):
+        """ Queue :param:`command` and return its :class:`BatchResult`. """
 
-    is_development = (is_local_environment()
-                      or env.environment in ('test', 'development', 'preview'))
+        prefixes = list(env.command_prefixes)
 
-    return is_development
+        if env.cwd:
+            prefixes.insert(0, 'cd %s >/dev/null' % env.cwd)
 
+        result = BatchResult(self)
 
-def is_production_environment():
+        self.queue.append({
+            'kind': kind,
+            'command': command,
+            'script': ' && '.join(prefixes + [command]),
+            'host_string': env.host_string,
+            'user': kwargs.get('user', None) if kind == 'sudo' else None,
+            'quiet': kwargs.get('quiet', False),
+            'warn_only': kwargs.get('warn_only', False)
+            or kwargs.get('quiet', False) or env.warn_only,
+            'result': result,
+        })
 
-    is_production = (not is_development_environment()
-                     and env.environment in ('production', 'real'))
+        return result
 
-    return is_production
+    def flush(self):
+        """ Run all queued commands. """
 
+        queue, self.queue = self.queue, []
+        group = []
 
-class ConfigurationMixin(object):
-    """ Common methods to Remote & Local configuration classes. """
+        try:
+            for item in queue:
+                if group and (item['kind'], item['user'],
+                              item['host_string']) != (
+                        group[0]['kind'], group[0]['user'],
+                        group[0]['host_string']):
+                    self.run_group(group)
+                    group = []
 
-    def __getattr__(self, key):
-        """ This lazy getter will allow to load the Django settings after
-            Fabric and the project fabfile has initialized `env`. Doing
-            elseway leads to cycle dependancy KeyErrors. """
+                group.append(item)
 
-        if key == 'django_settings':
-            try:
-                self.get_django_settings()
+            if group:
+                self.run_group(group)
 
-            except ImportError:
-                raise AttributeError(u'%s Django settings could not be '
-                                     u'loaded.' % ('Remote' if 'Remote'
-                                                   in self.__class__.__name__
-                                                   else 'Local'))
+        finally:
+            # After an abort(), commands that never ran still need a result.
+            for item in queue:
+                if item['result']._result is None:
+                    self.set_result(item, '', None)
 
-            return self.django_settings
+    def set_result(self, item, stdout, return_code):
 
-    @property
-    def is_osx(self):
-        return self.mac is not None
+        result = nofabric._AttributeString(stdout)
+        result.command      = item['command']
+        result.real_command = item['script']
+        result.return_code  = return_code
+        result.stderr       = ''
+        result.succeeded    = return_code == 0
+        result.failed       = not result.succeeded
 
-    @property
-    def is_arch(self):
-        return self.lsb and self.lsb.ID == 'arch'
+        item['result']._result = result
 
-    @property
-    def is_bsd(self):
-        return self.bsd is not None
+    def run_group(self, group):
 
-    @property
-    def is_freebsd(self):
-        return self.bsd and self.bsd.ID == 'FreeBSD'
+        kind        = group[0]['kind']
+        host_string = group[0]['host_string']
+        lines       = []
 
-    @property
-    def is_ubuntu(self):
-        return self.lsb and self.lsb.ID.lower() == 'ubuntu'
+        for index, item in enumerate(group):
+            lines.extend((
+                '( %s )' % item['script'],
+                '__sparks_rc=$?',
+                'echo; echo "%s %s $__sparks_rc"' % (self.marker, index),
+            ))
 
-    @property
-    def is_debian(self):
-        return self.lsb and self.lsb.ID.lower() == 'debian'
+            if not item['warn_only']:
+                lines.append('[ $__sparks_rc -eq 0 ] || exit $__sparks_rc')
 
-    @property
-    def is_deb(self):
-        return self.lsb and self.lsb.ID.lower() in ('ubuntu', 'debian',)
+        script = '\n'.join(lines)
+        kwargs = {'quiet': True}
 
-    @property
-    def release_formatted(self):
+        if kind == 'sudo' and group[0]['user']:
+            kwargs['user'] = group[0]['user']
 
-        if self.mac:
-            return u'Apple OSX {0}'.format(self.mac.release)
+        if is_localhost(host_string):
+            runner = nofabric.run
+            script = "sh -c '%s'" % script.replace("'", "'\\''")
 
-        if self.lsb:
-            return u'{0} {1}'.format(self.lsb.ID.title(), self.lsb.RELEASE)
+            if kind == 'sudo':
+                script = 'sudo %s%s' % ('-u %s ' % kwargs['user']
+                                        if 'user' in kwargs else '', script)
 
-        if self.bsd:
-            return u'{0} {1}'.format(self.bsd.ID, self.bsd.RELEASE)
+        else:
+            runner = fabric_sudo if kind == 'sudo' else fabric_run
 
-    @property
-    def vm_formatted(self):
-        return ('VMWare '
-                if self.is_vmware
-                else 'Parallels '
-                ) if self.is_vm else ''
+        LOGGER.debug(u'Running %s batched commands on %s.',
+                     len(group), host_string)
 
+        with settings(host_string=host_string, cwd='', command_prefixes=[]):
+            output = runner(script, **kwargs)
 
-class RemoteConfiguration(ConfigurationMixin):
-    """ Define an easy to use object with remote machine configuration. """
+        outputs = {}
+        buffer  = []
+
+        for line in output.splitlines():
+            line = line.rstrip('\r')
+
+            if line.startswith(self.marker + ' '):
+                index, return_code = line[len(self.marker) + 1:].split()
+                outputs[int(index)] = ('\n'.join(buffer).strip(),
+                                       int(return_code))
+                buffer = []
+
+            else:
+                buffer.append(line)
+
+        for index, item in enumerate(group):
+            self.set_result(item, *outputs.get(index, ('', None)))
+
+        # Only once all results are known: abort() could be caught.
+        for item in group:
+            result = item['result']._result
+
+            if not item['quiet'] and result.return_code is not None:
+                print(u'[%s] %s: %s' % (host_string, kind, item['command']))
+
+                for line in result.splitlines():
+                    print(u'[%s] out: %s' % (host_string, line))
+
+            if result.failed and not item['warn_only']:
+                abort(u'%s() received nonzero return code %s while '
+                      u'executing!\n\nRequested: %s\n\n%s' % (
+                          kind, result.return_code, item['command'], result))
+
+
+def current_batch():
+    """ Return the :class:`CommandsBatch` of the current thread, if any. """
+
+    return getattr(batch_state, 'current', None)
+
+
+def queue_in_batch(kind, args, kwargs):
+    """ Queue a :func:`run` / :func:`sudo` call in the current batch, if any
+        and if its arguments are batchable. Return its result, or ``None``
+        if the call must run immediately. """
+
+    commands = current_batch()
+
+    if commands is None:
+        return None
+
+    if len(args) != 1 or set(kwargs) - BATCHABLE_KWARGS:
+        # Keep the order: run the queued commands first.
+        commands.flush()
+        return None
+
+    return commands.add(kind, args[0], kwargs)
+
+
+@contextmanager
+def batch():
+    """ Queue the :func:`run` and :func:`sudo` calls of the ``with``
+        block, and send them to the remote host in one round trip,
+        at the end of the block (or earlier, when a result is used)::
+
+            with batch():
+                for source, destination in links:
+                    symlink(source, destination)
+
+        Calls return lazy :class:`BatchResult` instances. Only the sparks
+        :func:`run` and :func:`sudo` wrappers are batched, Fabric's own
+        functions and ``exists()`` still run immediately. Nested batches
+        join the outer one.
+
+        .. versionadded:: 5.18
+    """
+
+    commands = current_batch()
+
+    if commands is not None:
+        yield commands
+        return
+
+    commands = CommandsBatch()
+    batch_state.current = commands
+
+    try:
+        yield commands
+
+    finally:
+        batch_state.current = None
+        commands.flush()
+
+
+# ======================================================= Remote helper agent
+
+
+def get_agent(host_string=None):
+    """ Return the remote helper agent of :param:`host_string` (default:
+        ``env.host_string``), or ``None`` if it is disabled or unavailable.
+        See :mod:`sparks.fabric.agent`.
+
+        .. versionadded:: 5.18
+    """
+
+    try:
+        from . import agent
+
+    except ImportError:
+        # No Fabric, probably running from 1nstall.
+        return None
+
+    return agent.get_agent(host_string)
+
+
+# ================================================= Remote paths existence cache
+
+# (pid, host_string) -> {path: bool}. Per process: Fabric parallel workers
+# must not trust what their parent knew, nor the opposite.
+exists_cache = {}
+
+EXISTS_MARKER = 'SPARKS_EXISTS:'
+
+
+def exists_cache_key(path):
+    """ Return :param:`path`, made absolute with the current ``cd()``. """
+
+    if env.cwd and not path.startswith(('/', '~', '$', )):
+        return posixpath.join(env.cwd, path)
+
+    return path
+
+
+def host_exists_cache(host_string=None):
+
+    return exists_cache.setdefault((os.getpid(),
+                                    host_string or env.host_string), {})
+
+
+def prefetch_exists(paths, use_sudo=False):
+    """ Ask the current host which of :param:`paths` exist, in one round
+        trip, and remember the answers for :func:`remote_exists`. Paths
+        already known are not asked again.
+
+        The remote helper agent answers when it is available (and
+        :param:`use_sudo` is not set), else a shell loop does.
+
+        .. versionadded:: 5.18
+    """
+
+    cache   = host_exists_cache()
+    unknown = []
+
+    for path in paths:
+        key = exists_cache_key(path)
+
+        if key not in cache and key not in unknown:
+            unknown.append(key)
+
+    if not unknown:
+        return
+
+    helper = None if use_sudo else get_agent()
+
+    if helper is not None:
+        from .agent import RemoteAgentError
+
+        try:
+            stats = helper.call('stat', paths=unknown)
+
+        except RemoteAgentError as exc:
+            LOGGER.warning(u'%s, falling back to a shell test.', exc)
+
+        else:
+            for key in unknown:
+                cache[key] = stats[key] is not None
+
+            return
+
+    # Same test as Fabric's exists(), for all paths at once.
+    command = '; '.join(
+        'test -e "$(echo {0})" && echo {1}1 || echo {1}0'.format(
+            key, EXISTS_MARKER) for key in unknown)
+
+    with settings(cwd=''):
+        output = (sudo if use_sudo else run)(command, quiet=True)
+
+    answers = [line.strip()[-1] for line in output.splitlines()
+               if line.strip().startswith(EXISTS_MARKER)]
+
+    if len(answers) != len(unknown):
+        LOGGER.warning(u'Could not prefetch existence of %s on %s.',
+                       u', '.join(unknown), env.host_string)
+        return
+
+    for key, answer in zip(unknown, answers):
+        cache[key] = answer == '1'
+
+
+def invalidate_exists(*paths):
+    """ Forget what :func:`remote_exists` knows about :param:`paths` and
+        everything under them on the current host, or everything if no
+        path is given. Sparks' own writers (:func:`put`,
+        :func:`upload_template`, :func:`remote_rm` and :func:`remote_mv`)
+        call it; call it yourself after other remote changes.
+
+        .. versionadded:: 5.18
+    """
+
+    cache = host_exists_cache()
+
+    if not paths:
+        cache.clear()
+        return
+
+    for path in paths:
+        if not path:
+            continue
+
+        key = exists_cache_key(path)
+
+        for cached in list(cache):
+            if cached == key or cached.startswith(key.rstrip('/') + '/'):
+                del cache[cached]
+
+
+def remote_exists(path, use_sudo=False):
+    """ Fabric's ``exists()``, with answers cached per host for the whole
+        session (see :func:`prefetch_exists` and :func:`invalidate_exists`).
+        The remote helper agent answers when it is available.
+
+        .. versionadded:: 5.18
+    """
+
+    key   = exists_cache_key(path)
+    cache = host_exists_cache()
+
+    if key not in cache:
+        prefetch_exists([path], use_sudo=use_sudo)
+
+    try:
+        return cache[key]
+
+    except KeyError:
+        return exists(path, use_sudo=use_sudo)
+
+
+def remote_rm(path, use_sudo=False):
+    """ ``rm -rf`` :param:`path` on the current host, keeping
+        :func:`remote_exists` up to date.
+
+        .. versionadded:: 5.18
+    """
+
+    path = exists_cache_key(path)
+
+    try:
+        return (sudo if use_sudo else run)('rm -rf {0}'.format(path),
+                                           quiet=QUIET)
+
+    finally:
+        invalidate_exists(path)
+
+
+def remote_mv(source, destination, use_sudo=False):
+    """ ``mv`` :param:`source` to :param:`destination` on the current host,
+        keeping :func:`remote_exists` up to date.
+
+        .. versionadded:: 5.18
+    """
+
+    source      = exists_cache_key(source)
+    destination = exists_cache_key(destination)
+
+    try:
+        return (sudo if use_sudo else run)('mv {0} {1}'.format(
+                                           source, destination), quiet=QUIET)
+
+    finally:
+        invalidate_exists(source, destination)
+
+
+# ================================================ general-purpose Fabric tasks
+
+try:
+    @task
+    def get_dir_with_sudo(remote_path, local_path=None):
+
+        with cd(remote_path):
+            source_basename = os.path.basename(remote_path)
+
+            print('Downloading {0}:{1}…'.format(env.host_string, remote_path),
+                  end='')
+            sys.stdout.flush()
+
+            save_file_name = '../{0}-copy-{1}.tar.gz'.format(
+                source_basename, generate_random_name())
+            while exists(save_file_name):
+                save_file_name = '../{0}-copy-{1}.tar.gz'.format(
+                    source_basename, generate_random_name())
+
+            # chmod will allow get() to succeed, provided the
+            # user has correct access to full containing path…
+            sudo("tar -czf '{0}' . ; chmod 644 '{0}'".format(save_file_name),
+                 quiet=True)
+
+            with hide('running', 'stdout', 'stderr'):
+                downloaded = get(save_file_name, local_path)[0]
+
+            sudo('rm -f "{0}"'.format(save_file_name), quiet=True)
+
+            local_dirname, local_basename = downloaded.rsplit(os.sep, 1)
+
+            local_full_name = os.path.join(local_dirname, source_basename)
+
+            with lcd(local_dirname):
+                with hide('running', 'stdout', 'stderr'):
+                    local('mkdir -p "{0}"'.format(source_basename))
+
+                    with lcd(source_basename):
+                        local('tar -xzf "../{0}"'.format(local_basename))
+
+                    local('rm -f "{0}"'.format(local_basename))
+
+                print('into {1} directory.'.format(remote_path,
+                      local_full_name))
+
+                return local_full_name
+
+    @task
+    def put_dir_with_sudo(local_path, remote_path):
+        # TODO: implement remote_path=None & return remote_path
+
+        with lcd(local_path):
+            source_basename = os.path.basename(local_path)
+
+            print('Uploading {0} to {1}:{2}…'.format(local_path,
+                  env.host_string, remote_path), end='')
+            sys.stdout.flush()
+
+            save_file_name = '../{0}-copy-{1}.tar.gz'.format(
+                source_basename, generate_random_name())
+            while os.path.exists(save_file_name):
+                save_file_name = '../{0}-copy-{1}.tar.gz'.format(
+                    source_basename, generate_random_name())
+
+            with hide('running', 'stdout', 'stderr'):
+                local("tar -czf '{0}' . ".format(save_file_name))
+
+            remote_dirname, remote_basename = remote_path.rsplit(os.sep, 1)
+
+            with hide('running', 'stdout', 'stderr'):
+                put(save_file_name, remote_dirname, use_sudo=True)
+                local('rm -f "{0}"'.format(save_file_name))
+
+            with cd(remote_dirname):
+                with hide('running', 'stdout', 'stderr'):
+                    sudo('mkdir -p "{0}"'.format(remote_basename))
+
+                    with cd(remote_basename):
+                        sudo('tar -xzf "{0}"'.format(save_file_name))
+                        sudo('rm -f "{0}"'.format(save_file_name))
+
+                print(' done.')
+
+    @task
+    def refresh_facts(everything=False):
+        """ Forget the cached facts of the current host (or of all hosts
+            with ``refresh_facts:everything=True``), and probe it again.
+
+            .. versionadded:: 5.18
+        """
+
+        clear_cached_facts(None if everything else env.host_string)
+
+        with configurations_lock:
+            if everything:
+                configurations.clear()
+
+            else:
+                configurations.pop(env.host_string, None)
+
+        if env.host_string:
+            get_configuration(env.host_string)
+
+except NameError:
+    # Fabric is not yet installed. Don't crash. Happens during the first setup.
+    pass
+
+
+# =================================================== Remote system information
+
+# Gathers everything sparks needs to know about a host, in one shot, into
+# the `facts` dict. It runs
+# on the remote side with whatever `python` is there: keep it compatible
+# with Python 2.6+ and 3.x, and only use the standard library.
+HOST_PROBE_MARKER = 'SPARKS_FACTS:'
+HOST_PROBE_SCRIPT = r'''
+import os
+import sys
+import json
+import platform
+import subprocess
+
+
+def output_of(*command):
+    try:
+        return subprocess.Popen(command, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE).communicate()[0]
+    except OSError:
+        return b''
+
+facts = {
+    'user': os.environ.get('USER', ''),
+    'home': os.environ.get('HOME', '') or os.path.expanduser('~'),
+    'system': platform.system(),
+    'platform': platform.platform(),
+    'release': platform.release(),
+    'uname': list(os.uname()),
+    'python': list(sys.version_info[:3]),
+    'distro': ['', '', ''],
+    'mac_ver': None,
+    'is_parallel': b'prl_fs' in output_of('mount'),
+    'cpu_count': None,
+    'memory': None,
+}
+
+if not facts['user']:
+    import pwd
+    facts['user'] = pwd.getpwuid(os.getuid()).pw_name
+
+if facts['system'] == 'Linux':
+    try:
+        facts['distro'] = list(platform.linux_distribution())
+    except AttributeError:
+        # Removed in Python 3.8.
+        pass
+
+    if not facts['distro'][0] and os.path.exists('/etc/os-release'):
+        os_release = {}
+        for line in open('/etc/os-release'):
+            if '=' in line:
+                key, value = line.strip().split('=', 1)
+                os_release[key] = value.strip('"\'')
+        facts['distro'] = [os_release.get('ID', ''),
+                           os_release.get('VERSION_ID', ''),
+                           os_release.get('VERSION_CODENAME', '')]
+
+elif facts['system'] == 'Darwin':
+    facts['mac_ver'] = list(platform.mac_ver())
+
+try:
+    import multiprocessing
+    facts['cpu_count'] = multiprocessing.cpu_count()
+except (ImportError, NotImplementedError):
+    pass
+
+try:
+    facts['memory'] = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+except (AttributeError, ValueError, OSError):
+    try:
+        facts['memory'] = int(output_of('sysctl', '-n', 'hw.memsize'
+                                        if facts['system'] == 'Darwin'
+                                        else 'hw.physmem'))
+    except ValueError:
+        pass
+'''
+
+# The script is shipped base64-encoded to avoid any shell quoting nightmare.
+# Locally, LocalConfiguration just exec()s it and picks up `facts`.
+HOST_PROBE_COMMAND = "python -c 'import base64; exec(base64.b64decode(\"{0}\"))'"\
+    .format(base64.b64encode((HOST_PROBE_SCRIPT + "print('{0}' + json.dumps("
+             "facts))\n".format(HOST_PROBE_MARKER)).encode('utf-8')
+             ).decode('ascii'))
+
+
+# Only the settings sparks reads are sent back, JSON-encoded, compressed and
+# base64-encoded on stdout. Projects can ask for more keys in
+# `env.sparks_options['remote_django_settings']`.
+DJANGO_SETTINGS_KEYS = (
+    'DATABASES', 'BASE_ROOT', 'STATIC_ROOT', 'LANGUAGES', 'LANGUAGE_CODE',
+    'INSTALLED_APPS', 'BROKER_URL', 'DEBUG',
+)
+DJANGO_SETTINGS_MARKER = 'SPARKS_DJANGO_SETTINGS:'
+DJANGO_SETTINGS_SCRIPT = r'''
+import json
+import zlib
+import base64
+from django.conf import settings
+
+settings._setup()
+
+exported = dict((key, getattr(settings, key))
+                for key in {keys!r} if hasattr(settings, key))
+
+# default: lazy translations and other objects are sent as strings.
+print({marker!r} + base64.b64encode(zlib.compress(json.dumps(
+      exported, default=lambda value: u'%s' % (value, )).encode('utf-8')
+      )).decode('ascii'))
+'''
+
+
+def remote_django_settings_command():
+    """ Return the shell command that prints the remote Django settings
+        needed by sparks (see :data:`DJANGO_SETTINGS_KEYS`).
+
+        .. versionadded:: 5.18
+    """
+
+    keys = DJANGO_SETTINGS_KEYS + tuple(getattr(env, 'sparks_options', {}).get(
+        'remote_django_settings', ()))
+
+    return "python -c 'import base64; exec(base64.b64decode(\"{0}\"))'".format(
+        base64.b64encode(DJANGO_SETTINGS_SCRIPT.format(
+            keys=keys, marker=DJANGO_SETTINGS_MARKER).encode('utf-8')
+        ).decode('ascii'))
+
+
+def facts_cache_filename(host_string):
+    """ Return the local facts cache file name for :param:`host_string`. """
+
+    return os.path.join(FACTS_CACHE_DIR, '{0}.json'.format(
+                        re.sub(r'[^\w.@-]+', '_', host_string)))
+
+
+def read_cache_file(filename, ttl):
+    """ Return the JSON content of :param:`filename`, or ``None`` if it
+        doesn't exist, is older than :param:`ttl` seconds or is unreadable.
+
+        .. versionadded:: 5.18
+    """
+
+    if ttl <= 0:
+        return None
+
+    try:
+        if time.time() - os.path.getmtime(filename) > ttl:
+            return None
+
+        with open(filename) as f:
+            return json.load(f)
+
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_cache_file(filename, data):
+    """ Store :param:`data` as JSON in :param:`filename`.
+
+        The file is written atomically, parallel Fabric runs can
+        write the same file without corrupting it.
+
+        .. versionadded:: 5.18
+    """
+
+    temp_filename = '{0}.{1}'.format(filename, os.getpid())
+
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+
+        with open(temp_filename, 'w') as f:
+            json.dump(data, f)
+
+        os.rename(temp_filename, filename)
+
+    except (IOError, OSError):
+        LOGGER.warning(u'Could not write cache file %s.', filename)
+
+
+def get_cached_facts(host_string):
+    """ Return the cached facts of :param:`host_string` as a ``dict``,
+        or ``None`` if they are not cached, expired or unreadable.
+
+        .. versionadded:: 5.18
+    """
+
+    return read_cache_file(facts_cache_filename(host_string), FACTS_CACHE_TTL)
+
+
+def set_cached_facts(host_string, facts):
+    """ Store :param:`facts` in the local cache for :param:`host_string`.
+
+        .. versionadded:: 5.18
+    """
+
+    if FACTS_CACHE_TTL > 0:
+        write_cache_file(facts_cache_filename(host_string), facts)
+
+
+def get_shared_django_settings(cache_key):
+    """ Return the exported Django settings ``dict`` shared under
+        :param:`cache_key`, or ``None`` if nobody fetched them yet
+        in the current process.
+
+        .. versionadded:: 5.18
+    """
+
+    with configurations_lock:
+        return shared_django_settings.get(cache_key, None)
+
+
+def set_shared_django_settings(cache_key, exported):
+    """ Share the exported Django settings ``dict`` under
+        :param:`cache_key`, in memory.
+
+        .. versionadded:: 5.18
+    """
+
+    with configurations_lock:
+        shared_django_settings[cache_key] = exported
+
+
+def clear_cached_facts(host_string=None):
+    """ Remove the cached facts of :param:`host_string`, or of all hosts
+        if ``None``.
+
+        .. versionadded:: 5.18
+    """
+
+    if host_string is None:
+        try:
+            filenames = [os.path.join(FACTS_CACHE_DIR, name)
+                         for name in os.listdir(FACTS_CACHE_DIR)
+                         if name.endswith('.json')]
+
+        except OSError:
+            filenames = []
+
+    else:
+        filenames = [facts_cache_filename(host_string)]
+
+    for filename in filenames:
+        try:
+            os.unlink(filename)
+
+        except OSError:
+            pass
+
+
+def is_localhost(hostname):
+    return hostname in ('localhost', 'localhost.localdomain',
+                        '127.0.0.1', '127.0.1.1', '::1')
+
+
+def is_local_environment():
+
+    is_local = env.environment == 'local' or (
+        env.environment == 'test'
+            and is_localhost(env.host_string))
+
+    return is_local
+
+
+def is_development_environment():
+
+    is_development = (is_local_environment()
+                      or env.environment in ('test', 'development', 'preview'))
+
+    return is_development
+
+
+def is_production_environment():
+
+    is_production = (not is_development_environment()
+                     and env.environment in ('production', 'real'))
+
+    return is_production
 
-    def __init__(self, host_string):
 
-        self.host_string = host_string
+class ConfigurationMixin(object):
+    """ Common methods to Remote & Local configuration classes. """
 
-        # No need to `deactivate` for this calls, it's pure shell.
-        self.user, self.tilde = run('echo "${USER},${HOME}"',
-                                    quiet=not DEBUG).strip().split(',')
+    def __getattr__(self, key):
+        """ This lazy getter will allow to load the Django settings after
+            Fabric and the project fabfile has initialized `env`. Doing
+            elseway leads to cycle dependancy KeyErrors. """
 
-        self.get_platform()
-        self.get_uname()
-        self.get_virtual_machine()
+        if key == 'django_settings':
+            try:
+                self.get_django_settings()
 
-        if not QUIET:
-            print('Remote is {release} {host} {vm}{arch}, user '
-                  '{user} in {home}.'.format(
-                  release=self.release_formatted,
-                  host=cyan(self.uname.nodename),
-                  vm=self.vm_formatted,
-                  arch=self.uname.machine,
-                  user=cyan(self.user),
-                  home=self.tilde,
-                  ))
+            except ImportError:
+                raise AttributeError(u'%s Django settings could not be '
+                                     u'loaded.' % ('Remote' if 'Remote'
+                                                   in self.__class__.__name__
+                                                   else 'Local'))
 
-    def reload(self):
-        """ This methods just reloads the remote Django settings, because
-            anything else is very unlikely to have changed. """
+            return self.django_settings
 
-        self.get_django_settings()
+    def set_facts(self, facts):
+        """ Fill the configuration attributes (``user``, ``tilde``, ``lsb``,
+            ``mac``, ``bsd``, ``uname``, ``is_vm``…) from a facts ``dict``,
+            as returned by :data:`HOST_PROBE_SCRIPT`.
 
-    def get_platform(self):
-        # Be sure we don't get stuck in a virtualenv for free.
-        with prefix('deactivate >/dev/null 2>&1 || true'):
-            out = run("python -c 'from __future__ import print_function; "
-                      "import platform; "
-                      "print(platform.system())'",
-                      quiet=not DEBUG, combine_stderr=False)
+            .. versionadded:: 5.18
+        """
+
+        self.facts = facts
+
+        self.user  = facts['user']
+        self.tilde = facts['home']
 
         self.lsb = None
         self.mac = None
         self.bsd = None
 
-        out = out.strip().lower()
+        system = facts['system'].lower()
 
-        if out == u'linux':
-            distro = run("python -c 'from __future__ import print_function; "
-                         "import platform; "
-                         "print(\",\".join(platform.linux_distribution()))'",
-                         quiet=not DEBUG,
-                         combine_stderr=False).strip().split(',')
+        if system == u'linux':
+            distro = facts['distro']
 
             if distro[0].lower() in ('debian', 'ubuntu'):
-
                 self.lsb          = SimpleObject()
                 self.lsb.ID       = distro[0]
                 self.lsb.RELEASE  = distro[1]
                 self.lsb.CODENAME = distro[2]
 
             elif distro[0].lower() == 'arch' or (
-                distro == ('', '', '')
-                    and 'ARCH' in platform.platform()):
+                    distro == ['', '', '']
+                    and 'ARCH' in facts['platform']):
                 # http://bugs.python.org/issue12214
                 # is implemented only for Python 3.3+.
                 self.lsb          = SimpleObject()
                 self.lsb.ID       = 'arch'
-                self.lsb.RELEASE  = platform.release()
+                self.lsb.RELEASE  = facts['release']
                 self.lsb.CODENAME = 'ArchLinux'
 
             else:
                 raise RuntimeError(u'Unsupported Linux distro {1} on {0}, '
                                    u'please get in touch with 1flow/sparks '
                                    u'developers.'.format(
-                                   self.host_string, distro[0]))
-
-        elif out == u'darwin':
+                                       self.host_string, distro[0]))
 
-            # Be sure we don't get stuck in a virtualenv for free.
-            with prefix('deactivate >/dev/null 2>&1 || true'):
-                out = run("python -c 'from __future__ import print_function; "
-                          "import platform; "
-                          "print(platform.mac_ver())'", quiet=not DEBUG,
-                          combine_stderr=False)
+        elif system == u'darwin':
+            self.mac = SimpleObject(from_dict=dict(zip(
+                                    ('release', 'version', 'machine'),
+                                    facts['mac_ver'])))
 
-            try:
-                for line in out.splitlines():
-                    if line.startswith("('"):
-                        self.mac = SimpleObject(from_dict=dict(zip(
-                                                ('release', 'version',
-                                                 'machine'),
-                                                ast.literal_eval(line))))
-                        break
-
-            except SyntaxError:
-                # something went very wrong,
-                # none of the detection methods worked.
-                raise RuntimeError(u'Cannot determine platform of {0}, '
-                                   u'platform.mac_ver() reported nothing '
-                                   u'usable:\n{1}'.format(self.host_string,
-                                   out))
-            else:
-                if self.mac is None:
-                    raise RuntimeError(u'Cannot determine platform of {0}, '
-                                       u'platform.mac_ver() reported nothing '
-                                       u'usable:\n{1}'.format(self.host_string,
-                                       out))
-
-        elif out == u'freebsd':
-            release = run("python -c 'from __future__ import print_function; "
-                         "import platform; "
-                         "print(platform.release())'",
-                         quiet=not DEBUG,
-                         combine_stderr=False).strip()
+        elif system == u'freebsd':
+            release = facts['release']
 
             self.bsd = SimpleObject()
             self.bsd.ID = 'FreeBSD'
@@ -758,51 +1702,208 @@ class RemoteConfiguration(ConfigurationMixin):
         else:
             raise RuntimeError(u'Unsupported platform {1} on {0}, please '
                                u'get in touch with 1flow/sparks '
-                               u'developers.'.format(self.host_string, out))
-
-    def get_uname(self):
-        # Be sure we don't get stuck in a virtualenv for free.
-        with prefix('deactivate >/dev/null 2>&1 || true'):
-            out = run("python -c 'from __future__ import print_function; "
-                      "import os; print(os.uname())'",
-                      quiet=not DEBUG, combine_stderr=False)
+                               u'developers.'.format(self.host_string, system))
 
-        self.uname = None
-
-        for line in out.splitlines():
-            if line.startswith("('"):
-                self.uname = SimpleObject(from_dict=dict(zip(
-                                          ('sysname', 'nodename', 'release',
-                                          'version', 'machine'),
-                                          ast.literal_eval(line))))
-                break
-
-            # Python 3.x (tested on ArchLinux 20140826)
-            if line.startswith("posix.uname_result("):
-                self.uname = SimpleObject(from_dict=ast.literal_eval(
-                                          'dict' + line[18:]))
-                break
-
-        if self.uname is None:
-            raise RuntimeError(u'cannot determine uname of {0}, '
-                               u'os.uname() reported nothing usable:\n'
-                               u'{1}'.format(self.host_string, out))
+        self.uname = SimpleObject(from_dict=dict(zip(
+                                  ('sysname', 'nodename', 'release',
+                                   'version', 'machine'),
+                                  facts['uname'])))
 
         self.hostname = self.uname.nodename
 
-    def get_virtual_machine(self):
+        self.cpu_count = facts.get('cpu_count')
+        self.memory    = facts.get('memory')
+
         # TODO: implement me (and under OSX too).
         self.is_vmware = False
 
         # NOTE: this test could fail in VMs where nothing is mounted from
         # the host. In my own configs, this never occurs, but who knows.
         # TODO: check this works under OSX too, or enhance the test.
-        self.is_parallel = run('mount | grep prl_fs', quiet=not DEBUG,
-                               warn_only=True, combine_stderr=False).succeeded
+        self.is_parallel = facts['is_parallel']
 
         self.is_vm = self.is_parallel or self.is_vmware
 
-    def get_django_settings(self):
+    @property
+    def is_osx(self):
+        return self.mac is not None
+
+    @property
+    def is_arch(self):
+        return self.lsb and self.lsb.ID == 'arch'
+
+    @property
+    def is_bsd(self):
+        return self.bsd is not None
+
+    @property
+    def is_freebsd(self):
+        return self.bsd and self.bsd.ID == 'FreeBSD'
+
+    @property
+    def is_ubuntu(self):
+        return self.lsb and self.lsb.ID.lower() == 'ubuntu'
+
+    @property
+    def is_debian(self):
+        return self.lsb and self.lsb.ID.lower() == 'debian'
+
+    @property
+    def is_deb(self):
+        return self.lsb and self.lsb.ID.lower() in ('ubuntu', 'debian',)
+
+    @property
+    def release_formatted(self):
+
+        if self.mac:
+            return u'Apple OSX {0}'.format(self.mac.release)
+
+        if self.lsb:
+            return u'{0} {1}'.format(self.lsb.ID.title(), self.lsb.RELEASE)
+
+        if self.bsd:
+            return u'{0} {1}'.format(self.bsd.ID, self.bsd.RELEASE)
+
+    @property
+    def vm_formatted(self):
+        return ('VMWare '
+                if self.is_vmware
+                else 'Parallels '
+                ) if self.is_vm else ''
+
+
+class RemoteConfiguration(ConfigurationMixin):
+    """ Define an easy to use object with remote machine configuration. """
+
+    def __init__(self, host_string):
+
+        self.host_string = host_string
+
+        facts = get_cached_facts(host_string)
+
+        if facts is None:
+            facts = self.probe()
+            set_cached_facts(host_string, facts)
+
+        self.set_facts(facts)
+
+        if not QUIET:
+            print('Remote is {release} {host} {vm}{arch}, user '
+                  '{user} in {home}.'.format(
+                  release=self.release_formatted,
+                  host=cyan(self.uname.nodename),
+                  vm=self.vm_formatted,
+                  arch=self.uname.machine,
+                  user=cyan(self.user),
+                  home=self.tilde,
+                  ))
+
+    def reload(self):
+        """ This methods just reloads the remote Django settings, because
+            anything else is very unlikely to have changed. """
+
+        self.get_django_settings(use_shared=False)
+
+    def probe(self):
+        """ Run :data:`HOST_PROBE_SCRIPT` on the remote side and return
+            the facts it gathered, as a ``dict``.
+
+            Everything comes back in one :func:`run` call, eg. one SSH
+            round trip instead of one per question asked to the host.
+
+            .. versionadded:: 5.18
+        """
+
+        # Be sure we don't get stuck in a virtualenv for free.
+        with prefix('deactivate >/dev/null 2>&1 || true'):
+            out = run(HOST_PROBE_COMMAND, quiet=not DEBUG,
+                      combine_stderr=False)
+
+        # Login shells can echo things (motd, profile scripts…),
+        # we only want our own line.
+        for line in out.splitlines():
+            if line.startswith(HOST_PROBE_MARKER):
+                try:
+                    return json.loads(line[len(HOST_PROBE_MARKER):])
+
+                except ValueError:
+                    break
+
+        raise RuntimeError(u'Cannot determine platform of {0}, the host '
+                           u'probe reported nothing usable:\n{1}'.format(
+                               self.host_string, out))
+
+    def django_settings_cache_key(self):
+        """ Return the key under which the remote Django settings can be
+            shared with other hosts of the same environment, or ``None``
+            if they must be fetched for this host only.
+
+            The key is made of ``env.project``, ``env.environment``,
+            ``env.sparks_djsettings``, ``env.environment_vars`` and the
+            remote git ``HEAD``. Set ``per_host_django_settings`` in
+            ``env.sparks_options`` to ``True`` (all hosts) or to a list
+            of hosts whose settings differ (eg. host-specific settings
+            files), to opt out.
+
+            Always ``None`` in parallel mode: each host runs in its own
+            forked process, which has nothing to share with the others.
+
+            .. versionadded:: 5.18
+        """
+
+        if env.parallel:
+            return None
+
+        per_host = getattr(env, 'sparks_options', {}).get(
+            'per_host_django_settings', False)
+
+        if per_host is True or self.host_string in (per_host or ()):
+            return None
+
+        with cd(env.root if hasattr(env, 'root') else ''):
+            revision = run('git rev-parse HEAD', quiet=not DEBUG,
+                           warn_only=True, combine_stderr=False)
+
+        if revision.failed or not revision.strip():
+            return None
+
+        return u'|'.join((
+            env.project,
+            getattr(env, 'environment', ''),
+            getattr(env, 'sparks_djsettings', ''),
+            u' '.join(getattr(env, 'environment_vars', ())),
+            revision.strip().splitlines()[-1],
+        ))
+
+    def get_django_settings(self, use_shared=True):
+        """ Load the remote Django settings, or re-use those fetched from
+            another host of the same environment at the same git revision
+            (see :meth:`django_settings_cache_key`).
+
+            .. versionchanged:: 5.18 added the sharing across hosts
+                (in serial mode only) and the :param:`use_shared` parameter.
+        """
+
+        cache_key = self.django_settings_cache_key()
+
+        exported = get_shared_django_settings(cache_key) \
+            if cache_key and use_shared else None
+
+        if exported is None:
+            exported = self.fetch_django_settings()
+
+            if cache_key:
+                set_shared_django_settings(cache_key, exported)
+
+        self.django_settings = SimpleObject(from_dict=exported)
+
+    def fetch_django_settings(self):
+        """ Run the remote Python that exports the Django settings, and
+            return them as a ``dict``. Raises :class:`ImportError` if
+            they could not be loaded.
+
+            .. versionadded:: 5.18
+        """
 
         # transform the supervisor syntax to shell syntax.
         env_generic = ' '.join(env.environment_vars) \
@@ -816,51 +1917,39 @@ class RemoteConfiguration(ConfigurationMixin):
             ' DJANGO_SETTINGS_MODULE="{0}.settings"'.format(env.project)
 
         # Here, we *NEED* to be in the virtualenv, to get the django code.
-        # NOTE: this code is kind of weak, it will fail if settings include
-        # complex objects, but we hope it's not.
 
         prefix_cmd = 'workon {0}'.format(env.virtualenv) \
             if hasattr(env, 'virtualenv') else ''
 
-        pickled_settings = StringIO.StringIO()
-
         with prefix(prefix_cmd):
             with cd(env.root if hasattr(env, 'root') else ''):
-                # NOTE: this doesn't work with “ with open(…) as f: ”, even
-                # though I would have greatly prefered this modern version…
-                out = run(("{0}{1}{2} python -c 'import cPickle as pickle; "
-                          "from django.conf import settings; "
-                          "settings._setup(); "
-                          "f=open(\"__django_settings__.pickle\", "
-                          "\"w\"); pickle.dump(settings._wrapped, f, "
-                          "pickle.HIGHEST_PROTOCOL); f.close()'").format(
-                          env_generic, env_sparks, env_django_settings),
+                out = run('{0}{1}{2} {3}'.format(
+                          env_generic, env_sparks, env_django_settings,
+                          remote_django_settings_command()),
                           quiet=not DEBUG, warn_only=True, combine_stderr=False)
 
                 if out.succeeded:
-                    get('__django_settings__.pickle',
-                        pickled_settings)
-                    run('rm -f __django_settings__.pickle',
-                        quiet=not DEBUG)
-
-                    try:
-                        self.django_settings = pickle.loads(
-                            pickled_settings.getvalue())
-
-                    except:
-                        LOGGER.exception('Cannot load remote django settings!')
-
-                    pickled_settings.close()
-
-                else:
-                    LOGGER.warning(('Could not load remote Django settings '
-                                   'for project "{0}" (which should be '
-                                   'located in "{1}", with env. {2}{3}'
-                                   ')').format(
-                                   env.project,
-                                   env.root if hasattr(env, 'root') else '~',
-                                   env_generic, env_sparks))
-                    raise ImportError
+                    for line in out.splitlines():
+                        if line.startswith(DJANGO_SETTINGS_MARKER):
+                            try:
+                                return json.loads(zlib.decompress(
+                                    base64.b64decode(line[len(
+                                        DJANGO_SETTINGS_MARKER):])
+                                ).decode('utf-8'))
+
+                            except:
+                                LOGGER.exception('Cannot load remote '
+                                                 'django settings!')
+                                raise ImportError
+
+                LOGGER.warning(('Could not load remote Django settings '
+                               'for project "{0}" (which should be '
+                               'located in "{1}", with env. {2}{3}'
+                               ')').format(
+                               env.project,
+                               env.root if hasattr(env, 'root') else '~',
+                               env_generic, env_sparks))
+                raise ImportError
 
 
 class LocalConfiguration(ConfigurationMixin):
@@ -869,88 +1958,28 @@ class LocalConfiguration(ConfigurationMixin):
         This class doesn't use fabric, it's used to bootstrap the local
         machine when it's empty and doesn't have fabric installed yet.
 
+        Facts are gathered at first attribute access, not at instanciation:
+        importing sparks must not spawn any process. ``uname`` and
+        ``hostname`` come from :func:`os.uname` only, they don't trigger
+        the full probe.
+
         .. warning:: this class won't probably play well in a virtualenv.
             Unlike the :class:`RemoteConfiguration` class, I don't think
             it's pertinent and wanted to :program:`deactivate` first.
+
+        .. versionchanged:: 5.18 facts are loaded lazily, via the same
+            :data:`HOST_PROBE_SCRIPT` as remote hosts.
      """
     def __init__(self, host_string=None):
 
         self.host_string = host_string or 'localhost'
 
-        system = platform.system().lower()
-
-        self.lsb = None
-        self.mac = None
-        self.bsd = None
-
-        if system == 'linux':
-            distro = platform.linux_distribution()
-
-            if distro[0].lower() in ('debian', 'ubuntu'):
-                self.lsb          = SimpleObject()
-                self.lsb.ID       = distro[0]
-                self.lsb.RELEASE  = distro[1]
-                self.lsb.CODENAME = distro[2]
-
-            elif distro[0].lower() == 'arch' or (
-                    distro == ('', '', '') and 'ARCH' in platform.platform()):
-                # http://bugs.python.org/issue12214
-                # is implemented only for Python 3.3+.
-                self.lsb          = SimpleObject()
-                self.lsb.ID       = 'arch'
-                self.lsb.RELEASE  = platform.release()
-                self.lsb.CODENAME = 'ArchLinux'
-
-            else:
-                raise RuntimeError(u'Unsupported Linux distro {1} on '
-                                   u'localhost, please get in touch with '
-                                   u'1flow/sparks developers.'.format(
-                                       distro[0]))
-
-        elif system == 'darwin':
-            self.mac    = SimpleObject(from_dict=dict(zip(
-                                       ('release', 'version', 'machine'),
-                                       platform.mac_ver())))
-
-        elif system == u'freebsd':
-            release = platform.release()
-
-            self.bsd = SimpleObject()
-            self.bsd.ID = 'FreeBSD'
-            self.bsd.RELEASE = release
-            self.bsd.VERSION = release.split('-')[0]
-            self.bsd.MAJOR   = int(self.bsd.VERSION.split('.')[0])
-            self.bsd.MINOR   = int(self.bsd.VERSION.split('.')[1])
-
-        else:
-            raise RuntimeError(u'Unsupported platform {0} on localhost, '
-                               u'please get in touch with 1flow/sparks '
-                               u'developers.'.format(system))
-
-        self.uname = SimpleObject(from_dict=dict(zip(
-                                  ('sysname', 'nodename', 'release',
-                                  'version', 'machine'),
-                                  os.uname())))
-
-        self.hostname = self.uname.nodename
-
-        self.user, self.tilde = nofabric.local('echo "${USER},${HOME}"',
-                                               ).strip().split(',')
-
-        # TODO: implement me (and under OSX too).
-        self.is_vmware = False
-
-        # NOTE: this test could fail in VMs where nothing is mounted from
-        # the host. In my own configs, this never occurs, but who knows.
-        # TODO: check this works under OSX too, or enhance the test.
-        self.is_parallel = nofabric.local('mount | grep prl_fs').succeeded
-
-        self.is_vm = self.is_parallel or self.is_vmware
-
     def __getattr__(self, key):
         """ This lazy getter will allow to load the Django settings after
             Fabric and the project fabfile has initialized `env`. Doing
-            elseway leads to cycle dependancy KeyErrors. """
+            elseway leads to cycle dependancy KeyErrors.
+
+            It also loads the local facts on first access. """
 
         if key == 'django_settings':
             try:
@@ -962,6 +1991,25 @@ class LocalConfiguration(ConfigurationMixin):
 
             return self.django_settings
 
+        if key.startswith('__'):
+            raise AttributeError(key)
+
+        if key in ('uname', 'hostname'):
+            self.uname = SimpleObject(from_dict=dict(zip(
+                                      ('sysname', 'nodename', 'release',
+                                       'version', 'machine'),
+                                      os.uname())))
+            self.hostname = self.uname.nodename
+
+            return getattr(self, key)
+
+        if 'facts' not in self.__dict__:
+            namespace = {}
+            exec(HOST_PROBE_SCRIPT, namespace)
+            self.set_facts(namespace['facts'])
+
+            return getattr(self, key)
+
     def get_django_settings(self):
 
         # Set the environment exactly how it should be for runserver.
@@ -1027,17 +2075,15 @@ def with_remote_configuration(func):
 
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
-        global remote_configuration
-        if remote_configuration is None:
-            try:
-                remote_configuration = find_configuration_type(env.host_string)
-            except NameError:
-                # no 'env', probably running from 1nstall.
-                remote_configuration = find_configuration_type('localhost')
+        setup_logging()
+        setup_connections()
+
+        try:
+            host_string = env.host_string
 
-        elif remote_configuration.host_string != env.host_string:
-            # host changed: fabric is running the same task on another host.
-            remote_configuration = find_configuration_type(env.host_string)
+        except NameError:
+            # no 'env', probably running from 1nstall.
+            host_string = 'localhost'
 
         # Insert remote_configuration directly in kwargs.
         # This avoids the following error:
@@ -1045,7 +2091,7 @@ def with_remote_configuration(func):
         #    for keyword argument 'remote_configuration'
         # at the price of some overwriting. We just hope that no-one
         # will have the bad idea of naming his KWargs the same.
-        kwargs['remote_configuration'] = remote_configuration
+        kwargs['remote_configuration'] = get_configuration(host_string)
 
         return func(*args, **kwargs)
 
@@ -1056,44 +2102,133 @@ def with_local_configuration(func):
 
     @functools.wraps(func)
     def wrapped(*args, **kwargs):
-        global local_configuration
+        setup_logging()
+
+        return func(*args, local_configuration=get_local_configuration(),
+                    **kwargs)
+
+    return wrapped
+
+
+def get_local_configuration():
+    """ Return the :class:`LocalConfiguration` instance of the session,
+        creating it at first call. """
+
+    global local_configuration
+
+    with configurations_lock:
         if local_configuration is None:
             local_configuration = LocalConfiguration()
 
-        return func(*args, local_configuration=local_configuration, **kwargs)
+    return local_configuration
 
-    return wrapped
+
+def get_configuration(host_string):
+    """ Return the configuration of :param:`host_string` from the session
+        registry, probing the host only the first time it is asked for.
+
+        All localhost aliases share the :class:`LocalConfiguration`
+        instance. The registry is thread-safe: two threads asking for the
+        same host will wait for one probe instead of running two. In Fabric
+        parallel mode, each forked process has its own copy of the registry;
+        hosts probed in children are found in the facts cache afterwards.
+
+        .. versionadded:: 5.18
+    """
+
+    if is_localhost(host_string):
+        return get_local_configuration()
+
+    if not host_string:
+        # Fabric will prompt for a host, don't register anything.
+        return find_configuration_type(host_string)
+
+    with configurations_lock:
+        try:
+            return configurations[host_string]
+
+        except KeyError:
+            host_lock = configurations_locks.setdefault(host_string,
+                                                        threading.Lock())
+
+    with host_lock:
+        # Another thread could have probed the host while we were waiting.
+        configuration = configurations.get(host_string, None)
+
+        if configuration is None:
+            configuration = find_configuration_type(host_string)
+
+            with configurations_lock:
+                configurations[host_string] = configuration
+
+    return configuration
 
 
 def find_configuration_type(hostname):
 
     if is_localhost(hostname):
-        return LocalConfiguration()
+        return LocalConfiguration(hostname)
 
     else:
         return RemoteConfiguration(hostname)
 
 
-if os.environ.get('SPARKS_PARAMIKO_VERBOSE', False):
-    paramiko_logging_level = logging.WARNING
-else:
-    # but please, no paramiko, it's just flooding my terminal.
-    paramiko_logging_level = logging.ERROR
+def setup_logging():
+    """ Configure the logging for sparks and Fabric runs. Called at import
+        time, or at first decorated call in lazy mode (see ``LAZY``). """
 
-if DEBUG:
-    sparks_logging_level = logging.DEBUG
+    global logging_configured
 
-elif QUIET:
-    sparks_logging_level = logging.WARNING
+    if logging_configured:
+        return
 
-else:
-    sparks_logging_level = logging.INFO
+    logging_configured = True
 
-logging.basicConfig(
-    format='%(asctime)s %(name)s[%(levelname)s] %(message)s',
-    level=sparks_logging_level
-)
-logging.getLogger('paramiko').setLevel(paramiko_logging_level)
+    if os.environ.get('SPARKS_PARAMIKO_VERBOSE', False):
+        paramiko_logging_level = logging.WARNING
+    else:
+        # but please, no paramiko, it's just flooding my terminal.
+        paramiko_logging_level = logging.ERROR
+
+    if DEBUG:
+        sparks_logging_level = logging.DEBUG
+
+    elif QUIET:
+        sparks_logging_level = logging.WARNING
+
+    else:
+        sparks_logging_level = logging.INFO
+
+    logging.basicConfig(
+        format='%(asctime)s %(name)s[%(levelname)s] %(message)s',
+        level=sparks_logging_level
+    )
+    logging.getLogger('paramiko').setLevel(paramiko_logging_level)
+
+
+def setup_connections():
+    """ Install the SSH connections reuse layer, unless disabled via
+        ``SPARKS_NO_CONNECTION_REUSE``. Called at first decorated call
+        or by :func:`set_roledefs_and_parallel`.
+
+        .. versionadded:: 5.18
+    """
+
+    if not REUSE_CONNECTIONS:
+        return
+
+    try:
+        from . import connections
+
+    except ImportError:
+        # No Fabric, probably running from 1nstall.
+        return
+
+    connections.install()
+
+
+if not LAZY:
+    setup_logging()
 
-if local_configuration is None:
-    local_configuration = LocalConfiguration()
+# Cheap: local facts are gathered at first attribute access.
+local_configuration = LocalConfiguration()
@@ -0,0 +1,393 @@
+# -*- coding: utf8 -*-
+"""
+Long-lived remote helper agent.
+
+Instead of one SSH round trip (a new channel and a new shell) per question
+asked to a remote host (``exists()``, ``diff``, ``dpkg -l | grep``…),
+sparks can start a small Python helper on the remote side, over a single
+channel, and send it JSON requests, one per line. Many requests can be
+sent at once with :meth:`RemoteAgent.call_many`; they are answered in the
+same round trip.
+
+Operations (see :data:`AGENT_SCRIPT`):
+
+- ``stat(paths)``: ``{path: {isdir, isfile, islink, size, mode, mtime}}``,
+  or ``None`` for missing paths (symlinks are followed, like ``test -e``;
+  ``~`` and ``$VARIABLES`` are expanded in all paths, like ``exists()``);
+- ``hash(paths, algorithm='sha1')``: ``{path: hexdigest or None}``;
+- ``read(path)`` / ``write(path, content, mode=None)``: base64 contents;
+- ``compare(path, content)``: ``True`` if the remote file has exactly
+  this (base64) content;
+- ``listdir(path)``, ``getenv(names)``, ``which(names)``;
+- ``packages(names=None, states=('installed', ))``: dpkg packages in
+  these states (eg. ``config-files`` for removed ones) and their version.
+
+The agent runs as the SSH user, in a login shell, like ``run()``. It
+is enabled with ``env.sparks_options['remote_agent'] = True`` or the
+``SPARKS_REMOTE_AGENT`` environment variable. When it is disabled or
+cannot start (eg. no Python on the remote side), :func:`get_agent`
+returns ``None`` and callers fall back to plain commands.
+
+On localhost, the agent is a local sub-process.
+
+.. versionadded:: 5.18
+"""
+
+import os
+import json
+import base64
+import hashlib
+import logging
+import subprocess
+
+from fabric import state
+from fabric.api import env
+
+from . import is_localhost
+
+LOGGER = logging.getLogger(__name__)
+
+ENABLED = bool(os.environ.get('SPARKS_REMOTE_AGENT', False))
+
+AGENT_READY_MARKER = 'SPARKS_AGENT_READY'
+
+AGENT_SCRIPT = '''
+import os
+import sys
+import json
+import stat
+import base64
+import hashlib
+import subprocess
+
+
+def expand(path):
+    return os.path.expanduser(os.path.expandvars(path))
+
+
+def op_stat(paths):
+    result = {}
+
+    for path in paths:
+        full_path = expand(path)
+
+        try:
+            infos = os.stat(full_path)
+
+        except OSError:
+            result[path] = None
+
+        else:
+            result[path] = {
+                'isdir': stat.S_ISDIR(infos.st_mode),
+                'isfile': stat.S_ISREG(infos.st_mode),
+                'islink': os.path.islink(full_path),
+                'size': infos.st_size,
+                'mode': stat.S_IMODE(infos.st_mode),
+                'mtime': infos.st_mtime,
+            }
+
+    return result
+
+
+def file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+
+    with open(expand(path), 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def op_hash(paths, algorithm='sha1'):
+    result = {}
+
+    for path in paths:
+        try:
+            result[path] = file_digest(path, algorithm)
+
+        except (IOError, OSError):
+            result[path] = None
+
+    return result
+
+
+def op_read(path):
+    try:
+        with open(expand(path), 'rb') as handle:
+            return base64.b64encode(handle.read()).decode('ascii')
+
+    except (IOError, OSError):
+        return None
+
+
+def op_write(path, content, mode=None):
+    path = expand(path)
+    temporary = '%s.sparks-%s' % (path, os.getpid())
+
+    with open(temporary, 'wb') as handle:
+        handle.write(base64.b64decode(content))
+
+    if mode is not None:
+        os.chmod(temporary, mode)
+
+    os.rename(temporary, path)
+    return True
+
+
+def op_compare(path, content):
+    try:
+        with open(expand(path), 'rb') as handle:
+            return handle.read() == base64.b64decode(content)
+
+    except (IOError, OSError):
+        return False
+
+
+def op_listdir(path):
+    try:
+        return sorted(os.listdir(expand(path)))
+
+    except OSError:
+        return None
+
+
+def op_getenv(names):
+    return dict((name, os.environ.get(name)) for name in names)
+
+
+def op_which(names):
+    result = {}
+
+    for name in names:
+        result[name] = None
+
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            candidate = os.path.join(directory, name)
+
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                result[name] = candidate
+                break
+
+    return result
+
+
+def op_packages(names=None, states=('installed', )):
+    try:
+        process = subprocess.Popen(
+            ['dpkg-query', '-W', '-f', '${Package}\\t${Status}\\t${Version}\\n'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    except OSError:
+        return None
+
+    output = process.communicate()[0].decode('utf-8', 'replace')
+    packages = {}
+
+    for line in output.splitlines():
+        try:
+            name, status, version = line.split('\\t')
+
+        except ValueError:
+            continue
+
+        if status.rsplit(' ', 1)[-1] in states:
+            packages[name] = version
+
+    if names is not None:
+        return dict((name, packages.get(name)) for name in names)
+
+    return packages
+
+
+OPERATIONS = dict((name[3:], function)
+                  for name, function in list(globals().items())
+                  if name.startswith('op_'))
+
+sys.stdout.write('%s\\n' % MARKER)
+sys.stdout.flush()
+
+for line in iter(sys.stdin.readline, ''):
+    request = json.loads(line)
+    response = {'id': request['id']}
+
+    try:
+        response['result'] = OPERATIONS[request['op']](
+            **request.get('args', {}))
+
+    except Exception as exc:
+        response['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+
+    sys.stdout.write(json.dumps(response) + '\\n')
+    sys.stdout.flush()
+'''.replace('MARKER', repr(AGENT_READY_MARKER))
+
+AGENT_COMMAND = "python -c 'import base64; exec(base64.b64decode(\"{0}\"))'"\
+    .format(base64.b64encode(AGENT_SCRIPT.encode('utf-8')).decode('ascii'))
+
+# (pid, host_string) -> RemoteAgent, or None when the agent could not start.
+agents = {}
+
+
+class RemoteAgentError(RuntimeError):
+    """ Raised when the agent fails to start or to answer a request. """
+
+    pass
+
+
+class RemoteAgent(object):
+    """ A sparks helper agent running on :param:`host_string`. """
+
+    def __init__(self, host_string):
+        self.host_string = host_string
+        self.process     = None
+        self.channel     = None
+        self.requests    = 0
+
+    def start(self):
+
+        command = "{0} '{1}'".format(env.shell,
+                                     AGENT_COMMAND.replace("'", "'\\''"))
+
+        if is_localhost(self.host_string):
+            self.process = subprocess.Popen(command, shell=True,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.PIPE)
+            self.stdin  = self.process.stdin
+            self.stdout = self.process.stdout
+
+        else:
+            transport = state.connections[self.host_string].get_transport()
+
+            self.channel = transport.open_session()
+            self.channel.exec_command(command)
+            self.stdin  = self.channel.makefile('wb')
+            self.stdout = self.channel.makefile('rb')
+
+        # Login shells can echo things (motd, profile scripts…).
+        for index in range(1000):
+            line = self.stdout.readline()
+
+            if not line:
+                break
+
+            if line.decode('utf-8', 'replace').strip() == AGENT_READY_MARKER:
+                LOGGER.debug(u'Remote agent started on %s.', self.host_string)
+                return
+
+        self.close()
+
+        raise RemoteAgentError(u'Remote agent could not start on {0}.'.format(
+                               self.host_string))
+
+    def call_many(self, requests):
+        """ Send all :param:`requests` (a list of ``(operation, kwargs)``
+            tuples) at once, and return the list of their results. """
+
+        first_id = self.requests
+        self.requests += len(requests)
+
+        self.stdin.write(b''.join(
+            json.dumps({'id': first_id + index, 'op': operation,
+                        'args': kwargs}).encode('utf-8') + b'\n'
+            for index, (operation, kwargs) in enumerate(requests)))
+        self.stdin.flush()
+
+        responses = []
+
+        for index in range(len(requests)):
+            line = self.stdout.readline()
+
+            if not line:
+                self.close()
+
+                # Next get_agent() calls will use plain commands.
+                agents[(os.getpid(), self.host_string)] = None
+
+                raise RemoteAgentError(u'Remote agent on {0} exited.'.format(
+                                       self.host_string))
+
+            responses.append(json.loads(line.decode('utf-8')))
+
+        # Raise only once all responses are read, to stay in sync.
+        for response in responses:
+            if 'error' in response:
+                raise RemoteAgentError(u'Remote agent on {0}: {1}.'.format(
+                                       self.host_string, response['error']))
+
+        return [response['result'] for response in responses]
+
+    def call(self, operation, **kwargs):
+        """ Send one request and return its result. """
+
+        return self.call_many([(operation, kwargs)])[0]
+
+    def close(self):
+
+        for stream in ('stdin', 'stdout', ):
+            try:
+                getattr(self, stream).close()
+
+            except Exception:
+                pass
+
+        if self.process is not None:
+            self.process.wait()
+
+        if self.channel is not None:
+            self.channel.close()
+
+    # ———————————————————————————————————————————————————— Convenience methods
+
+    def exists(self, path):
+        return self.call('stat', paths=[path])[path] is not None
+
+    def same_content(self, path, local_filename):
+        """ Return ``True`` if remote :param:`path` has the same content
+            as the local file :param:`local_filename`. """
+
+        with open(local_filename, 'rb') as handle:
+            content = handle.read()
+
+        remote = self.call('hash', paths=[path])[path]
+
+        return remote == hashlib.sha1(content).hexdigest()
+
+
+def agent_enabled():
+
+    return ENABLED or getattr(env, 'sparks_options', {}).get('remote_agent',
+                                                             False)
+
+
+def get_agent(host_string=None):
+    """ Return the :class:`RemoteAgent` of :param:`host_string` (default:
+        ``env.host_string``), starting it if needed. Return ``None`` if
+        the agent is disabled or could not start on this host. """
+
+    if not agent_enabled():
+        return None
+
+    host_string = host_string or env.host_string
+    key = (os.getpid(), host_string)
+
+    try:
+        return agents[key]
+
+    except KeyError:
+        pass
+
+    agent = RemoteAgent(host_string)
+
+    try:
+        agent.start()
+
+    except Exception as exc:
+        LOGGER.warning(u'Remote agent unavailable on %s (%s), using plain '
+                       u'commands.', host_string, exc)
+        agent = None
+
+    agents[key] = agent
+
+    return agent
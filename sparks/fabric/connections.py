@@ -0,0 +1,157 @@
+# -*- coding: utf8 -*-
+"""
+SSH connections reuse for sparks and Fabric.
+
+Fabric already keeps one authenticated transport per host for the whole
+session (``fabric.state.connections``), but each ``put()`` / ``get()``
+opens a new SFTP session, and nothing tells how many channels a deploy
+really opens. Once :func:`install` is called (sparks does it via
+:func:`sparks.fabric.setup_connections`):
+
+- SFTP sessions are kept open and reused by ``put()`` and ``get()``
+  (and thus ``upload_template()``), per host and per process;
+- transports and channels are counted, see :func:`connection_stats`.
+
+Fabric connects through paramiko, which cannot share OpenSSH master
+sockets (``ControlMaster``): the authenticated transport it keeps per
+host is the equivalent here.
+
+Set the ``SPARKS_NO_CONNECTION_REUSE`` environment variable to disable
+all of this.
+
+.. note:: in parallel mode, Fabric clears its connection cache in each
+    sub-process, thus transports are reused only within a task.
+
+.. versionadded:: 5.18
+"""
+
+import os
+import atexit
+import logging
+
+from fabric import state, operations, sftp
+from fabric.api import env
+
+LOGGER = logging.getLogger(__name__)
+
+stats = {
+    'transports_opened': 0,
+    'transports_reused': 0,
+    'channels_opened': 0,
+    'sftp_opened': 0,
+    'sftp_reused': 0,
+}
+
+# (pid, host_string) -> paramiko SFTPClient. The pid keeps forked
+# Fabric parallel workers from using the sessions of their parent.
+sftp_clients = {}
+
+installed = False
+original_default_channel = None
+
+
+def connection_stats():
+    """ Return a copy of the connections counters of the current process. """
+
+    return stats.copy()
+
+
+def count_transport(host_string):
+    """ Count a transport as opened or reused, depending on Fabric's
+        connection cache. Must be called before using the transport. """
+
+    if host_string in state.connections:
+        stats['transports_reused'] += 1
+
+    else:
+        stats['transports_opened'] += 1
+
+
+def counting_default_channel():
+    """ Fabric's ``default_channel()``, used by ``run()`` and ``sudo()``,
+        with counters. """
+
+    count_transport(env.host_string)
+
+    channel = original_default_channel()
+
+    stats['channels_opened'] += 1
+
+    return channel
+
+
+def get_sftp(host_string):
+    """ Return an SFTP session on :param:`host_string`, reusing the
+        previous one if it is still alive on the current transport. """
+
+    count_transport(host_string)
+
+    client    = state.connections[host_string]
+    transport = client.get_transport()
+    key       = (os.getpid(), host_string)
+    ftp       = sftp_clients.get(key, None)
+
+    if ftp is not None:
+        channel = ftp.get_channel()
+
+        if not channel.closed and channel.get_transport() is transport \
+                and transport.is_active():
+            stats['sftp_reused'] += 1
+            return ftp
+
+    ftp = client.open_sftp()
+    sftp_clients[key] = ftp
+    stats['sftp_opened'] += 1
+
+    return ftp
+
+
+def close_sftp_sessions():
+    """ Close the SFTP sessions opened by the current process. """
+
+    pid = os.getpid()
+
+    for key in [key for key in sftp_clients if key[0] == pid]:
+        try:
+            sftp_clients.pop(key).close()
+
+        except Exception:
+            # The transport is probably already gone.
+            pass
+
+
+class ReusedSFTP(sftp.SFTP):
+    """ Fabric's SFTP helper, on a reused SFTP session. """
+
+    def __init__(self, host_string):
+        self.ftp = get_sftp(host_string)
+
+    def close(self):
+        # Fabric closes the session after each put() / get().
+        # Keep it open for the next one.
+        pass
+
+
+def log_connection_stats():
+
+    if any(stats.values()):
+        LOGGER.debug(u'SSH connections: %s.', u', '.join(
+            u'%s=%s' % (key, value) for key, value in sorted(stats.items())))
+
+
+def install():
+    """ Make Fabric reuse SFTP sessions and count connections. Idempotent. """
+
+    global installed, original_default_channel
+
+    if installed:
+        return
+
+    installed = True
+
+    original_default_channel = operations.default_channel
+    operations.default_channel = counting_default_channel
+    operations.SFTP = ReusedSFTP
+
+    atexit.register(log_connection_stats)
+    atexit.register(close_sftp_sessions)
@@ -13,7 +13,7 @@ from fabric.contrib.files    import contains, append, exists, sed
 from fabric.context_managers import cd, lcd, settings, hide
 from fabric.colors           import yellow, cyan
 
-from sparks.fabric import QUIET
+from sparks.fabric import QUIET, batch
 from .. import pkg, version as sparks_version
 from .utils import (with_remote_configuration,  # dsh_to_roledefs,
                     tilde, symlink, dotfiles)
@@ -364,20 +364,23 @@ def sys_default_services(remote_configuration=None):
 def sys_admin_pkgs(remote_configuration=None):
     """ Install some sysadmin related applications. """
 
-    pkg.pkg_add(('wget', 'multitail', ))
+    pkgs = ('wget', 'multitail', )
+    gems = ()
 
     if remote_configuration.is_osx:
         # See https://github.com/mperham/lunchy
-        pkg.gem_add(('lunchy', ))
+        gems = ('lunchy', )
 
     elif remote_configuration.lsb:
-        pkg.pkg_add(('fail2ban', 'acl', 'attr',
-                    'colordiff', 'telnet', 'psmisc', 'host',
-                     'duply', 'ncftp', 'arptables', 'iptables', ))
+        pkgs += ('fail2ban', 'acl', 'attr',
+                 'colordiff', 'telnet', 'psmisc', 'host',
+                 'duply', 'ncftp', 'arptables', 'iptables', )
 
     else:
         raise NotImplementedError('implement sysadmin pkgs for BSD.')
 
+    pkg.apply(pkg.plan(pkgs, gem=gems))
+
 
 @task
 @with_remote_configuration
@@ -551,7 +554,7 @@ def dev_pil(virtualenv=None, remote_configuration=None):
         # not to pollute the base host system.
         if confirm('Create symlinks in /usr/lib?', default=False):
 
-            with cd('/usr/lib'):
+            with cd('/usr/lib'), batch():
                 # TODO: check it works (eg. it suffices
                 # to correctly build PIL via PIP).
                 for libname in ('libjpeg', 'libfreetype', 'libz'):
@@ -866,6 +869,8 @@ def dev(remote_configuration=None):
 
     LOGGER.info('Checking dev():base components…')
 
+    base_pkgs = old_pkgs = ()
+
     if remote_configuration.is_osx:
         # On OSX:
         #    - ruby & gem are already installed.
@@ -873,25 +878,25 @@ def dev(remote_configuration=None):
         #     - virtualenv* come only via PIP.
         #    - git-flow-avh brings small typing enhancements.
 
-        pkg.pkg_add(('git-flow-avh', 'ack', 'python', ))
+        base_pkgs = ('git-flow-avh', 'ack', 'python', )
 
     elif remote_configuration.is_freebsd:
         # NOTE: git-flow doesn't seem to have a port
         # on FreeBSD (searched on 9.2, 20140821).
-        pkg.pkg_add(('ack', 'python', ))
+        base_pkgs = ('ack', 'python', )
 
     elif remote_configuration.is_deb:
         # On Ubuntu, `ack` is `ack-grep`.
-        pkg.pkg_add(('git-flow', 'ack-grep', 'python-pip', ))
+        base_pkgs = ('git-flow', 'ack-grep', 'python-pip', )
 
         # Remove eventually DEB installed old packages (see just after).
-        pkg.pkg_del(('python-virtualenv', 'virtualenvwrapper', ))
+        old_pkgs = ('python-virtualenv', 'virtualenvwrapper', )
 
     elif remote_configuration.is_arch:
         # gitflow-git is in AUR (via yaourt),
         # thus not yet automatically installed.
         # Arch has no Python 2.x by default.
-        pkg.pkg_add(('ack', 'python2', 'python2-pip', ))
+        base_pkgs = ('ack', 'python2', 'python2-pip', )
 
     # ——————————————————————————————————————————————————————— Python virtualenv
 
@@ -941,20 +946,21 @@ def dev(remote_configuration=None):
 
     # Gettext is used nearly everywhere, and Django
     # {make,compile}messages commands need it.
-    pkg.pkg_add(('gettext', ))
+    build_pkgs = ('gettext', )
 
     if remote_configuration.is_arch:
-        pkg.pkg_add(('gcc', 'make', 'autogen', 'autoconf'))
+        build_pkgs += ('gcc', 'make', 'autogen', 'autoconf')
 
     elif remote_configuration.is_freebsd:
-        pkg.pkg_add(('gcc48', 'gmake', 'autogen', 'autoconf'))
+        build_pkgs += ('gcc48', 'gmake', 'autogen', 'autoconf')
 
     elif remote_configuration.is_deb:
-        pkg.pkg_add(('build-essential', 'python-all-dev', ))
+        build_pkgs += ('build-essential', 'python-all-dev', )
 
-    pkg.pkg_add(py3_pkgs)
-    pkg.pip2_add(('git-up', 'virtualenvwrapper', ))
-    pkg.pip3_add(('virtualenvwrapper', ))
+    # One inventory read and one transaction per package manager.
+    pkg.apply(pkg.plan(base_pkgs + py3_pkgs + build_pkgs, remove=old_pkgs,
+                       pip2=('git-up', 'virtualenvwrapper', ),
+                       pip3=('virtualenvwrapper', )))
 
 
 # --------------------------------------------------- Databases recipes
@@ -1452,17 +1458,19 @@ def mydotfiles(overwrite=False, locally=False, remote_configuration=None):
 
     with cd(tilde()):
 
-        symlink('Dropbox/bin', 'bin', overwrite=overwrite, locally=locally)
-        symlink('Dropbox/configuration/virtualenvs', '.virtualenvs',
-                overwrite=overwrite, locally=locally)
-
-        for filename in ('dsh', 'ssh', 'ackrc', 'bashrc', 'fabricrc',
-                         'gitconfig', 'gitignore', 'dupload.conf',
-                         'multitailrc'):
-            symlink(dotfiles('dot.%s' % filename),
-                    os.path.join(tilde(), '.%s' % filename),
+        # One round trip for all symlinks.
+        with batch():
+            symlink('Dropbox/bin', 'bin', overwrite=overwrite, locally=locally)
+            symlink('Dropbox/configuration/virtualenvs', '.virtualenvs',
                     overwrite=overwrite, locally=locally)
 
+            for filename in ('dsh', 'ssh', 'ackrc', 'bashrc', 'fabricrc',
+                             'gitconfig', 'gitignore', 'dupload.conf',
+                             'multitailrc'):
+                symlink(dotfiles('dot.%s' % filename),
+                        os.path.join(tilde(), '.%s' % filename),
+                        overwrite=overwrite, locally=locally)
+
         if not remote_configuration.is_osx:
             if not exists('.config'):
                 local('mkdir .config', capture=QUIET) \
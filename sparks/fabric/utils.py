@@ -3,7 +3,7 @@
 import os
 import logging
 
-from . import with_remote_configuration, exists, local, run
+from . import with_remote_configuration, local, run
 
 LOGGER = logging.getLogger(__name__)
 
@@ -57,19 +57,23 @@ def dsh_to_roledefs():
 
 
 def symlink(source, destination, overwrite=False, locally=False):
+    """ Symlink :param:`destination` to :param:`source`, unless it
+        already exists (or whatever it is if :param:`overwrite` is set).
 
-    rm_prefix = ''
-
-    if exists(destination):
-        if overwrite:
-            rm_prefix = 'rm -rf "%s"; ' % destination
+        .. versionchanged:: in 5.18, the existence test is done in the
+            same remote command, making it batchable
+            (see :func:`sparks.fabric.batch`).
+    """
 
-        else:
-            return
+    if overwrite:
+        command = 'rm -rf "%s"; ln -sf "%s" "%s"' % (destination,
+                                                    source, destination)
 
-    command = '%s ln -sf "%s" "%s"' % (rm_prefix, source, destination)
+    else:
+        command = '[ -e "%s" ] || ln -sf "%s" "%s"' % (destination,
+                                                       source, destination)
 
-    local(command) if locally else run(command)
+    return local(command) if locally else run(command)
 
 
 # ========================================================== User configuration
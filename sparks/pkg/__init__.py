@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
-from ..fabric import with_remote_configuration, task
+from ..fabric import with_remote_configuration, task, env
+from ..fabric.utils import list_or_split
 
-from .pip import (pip_perms,
+from .common import unique
+
+from .pip import (pip_perms, pip_perms_once,
                   pip2_usable, pip2_is_installed, pip2_add, pip2_search,
                   pip3_usable, pip3_is_installed, pip3_add, pip3_search, )
 
@@ -27,6 +30,27 @@ from .other import (npm_is_installed, npm_add, npm_search,
 # ------------------------------------------ Generic package management
 
 
+@with_remote_configuration
+def pkg_manager(remote_configuration=None):
+    """ Return the name of the system package manager of the current host:
+        ``arch``, ``apt``, ``pkgng`` or ``brew``.
+
+        .. versionadded:: 5.18
+    """
+
+    if remote_configuration.is_arch:
+        return 'arch'
+
+    elif remote_configuration.lsb:
+        return 'apt'
+
+    elif remote_configuration.is_bsd:
+        return 'pkgng'
+
+    else:
+        return 'brew'
+
+
 @with_remote_configuration
 def pkg_is_installed(pkg, remote_configuration=None):
 
@@ -76,19 +100,22 @@ def pkg_del(pkgs, remote_configuration=None):
 
 
 @with_remote_configuration
-def pkg_update(remote_configuration=None):
+def pkg_update(force=False, remote_configuration=None):
+    """ .. versionchanged:: in 5.18, skipped when packages lists are fresh,
+            unless :param:`force` is ``True``. See :func:`apt_update`.
+    """
 
     if remote_configuration.is_arch:
-        return arch_update()
+        return arch_update(force=force)
 
     elif remote_configuration.lsb:
-        return apt_update()
+        return apt_update(force=force)
 
     elif remote_configuration.is_bsd:
-        return pkgng_update()
+        return pkgng_update(force=force)
 
     else:
-        return brew_update()
+        return brew_update(force=force)
 
 
 @with_remote_configuration
@@ -112,8 +139,11 @@ def pkg_upgrade(remote_configuration=None):
 
 @task
 @with_remote_configuration
-def update(remote_configuration=None):
+def update(force=False, remote_configuration=None):
     """ Refresh all package management tools data (packages lists, receipes…).
+
+        .. versionchanged:: in 5.18, skipped when packages lists are fresh,
+            unless :param:`force` is set.
     """
 
     # TODO:
@@ -123,16 +153,16 @@ def update(remote_configuration=None):
     #gem_update()
 
     if remote_configuration.is_arch:
-        return arch_update()
+        return arch_update(force=bool(force))
 
     elif remote_configuration.lsb:
-        return apt_update()
+        return apt_update(force=bool(force))
 
     elif remote_configuration.is_bsd:
-        return pkgng_update()
+        return pkgng_update(force=bool(force))
 
     else:
-        return brew_update()
+        return brew_update(force=bool(force))
 
 
 @task
@@ -157,3 +187,117 @@ def upgrade(update=False, remote_configuration=None):
 
     else:
         return brew_upgrade()
+
+
+# ================================================ Packages convergence
+
+# name -> (is_installed, add, delete). The system packages come first, they
+# can bring the other managers (python-pip, npm, ruby…), see apply().
+MANAGERS = (
+    ('arch', (arch_is_installed, arch_add, arch_del, )),
+    ('apt', (apt_is_installed, apt_add, apt_del, )),
+    ('pkgng', (pkgng_is_installed, pkgng_add, pkgng_del, )),
+    ('brew', (brew_is_installed, brew_add, brew_del, )),
+    ('pip2', (pip2_is_installed, pip2_add, None, )),
+    ('pip3', (pip3_is_installed, pip3_add, None, )),
+    ('npm', (npm_is_installed, npm_add, None, )),
+    ('gem', (gem_is_installed, gem_add, None, )),
+)
+
+
+class PackagesPlan(object):
+    """ The packages to remove and to install on one host, per package
+        manager, as computed by :func:`plan`. Evaluates to ``False``
+        when the host is already up to date.
+
+        .. versionadded:: 5.18
+    """
+
+    def __init__(self, host_string):
+        self.host_string = host_string
+        self.install     = {}
+        self.remove      = {}
+
+    def __nonzero__(self):
+        return any(self.install.values()) or any(self.remove.values())
+
+    __bool__ = __nonzero__
+
+    def __str__(self):
+
+        lines = []
+
+        for manager, functions in MANAGERS:
+            for action, pkgs in (('remove', self.remove.get(manager)),
+                                 ('install', self.install.get(manager))):
+                if pkgs:
+                    lines.append('{0}: {1} {2}'.format(
+                                 manager, action, ' '.join(pkgs)))
+
+        return '\n'.join(lines) or 'nothing to do'
+
+
+def plan(pkgs=None, remove=None, pip2=None, pip3=None, npm=None, gem=None):
+    """ Compute what is needed on the current host to have the system
+        packages :param:`pkgs` and the Python/NodeJS/Ruby packages
+        :param:`pip2`, :param:`pip3`, :param:`npm`, :param:`gem`
+        installed, and the system packages :param:`remove` removed.
+
+        Each package manager reads its full inventory once per session,
+        then nothing else runs on the host. Give the result to
+        :func:`apply`::
+
+            pkg.apply(pkg.plan(('git', 'make', ), pip2=('cython', )))
+
+        .. versionadded:: 5.18
+    """
+
+    system = pkg_manager()
+    result = PackagesPlan(env.host_string)
+    lookup = dict(MANAGERS)
+
+    for manager, pkgs, wanted in (
+        (system, remove, False),
+        (system, pkgs, True),
+        ('pip2', pip2, True),
+        ('pip3', pip3, True),
+        ('npm', npm, True),
+        ('gem', gem, True),
+    ):
+        if not pkgs:
+            continue
+
+        is_installed = lookup[manager][0]
+
+        # NOTE: pip*_is_installed() returns None when PIP is not yet
+        # installed; the packages are planned, apply() checks again.
+        delta = [pkg for pkg in unique(list_or_split(pkgs))
+                 if bool(is_installed(pkg)) != wanted]
+
+        if delta:
+            (result.install if wanted else result.remove)[manager] = delta
+
+    return result
+
+
+def apply(plan, dry_run=False):
+    """ Run :param:`plan` (see :func:`plan`): for each package manager,
+        one transaction for the removals, then one for the installs.
+        System packages come first. PIP permissions are restored once.
+
+        With :param:`dry_run`, just print the plan.
+
+        .. versionadded:: 5.18
+    """
+
+    if dry_run:
+        print('{0}:\n{1}'.format(plan.host_string, plan))
+        return
+
+    with pip_perms_once():
+        for manager, (is_installed, add, delete) in MANAGERS:
+            if plan.remove.get(manager):
+                delete(plan.remove[manager])
+
+            if plan.install.get(manager):
+                add(plan.install[manager])
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
-from ..fabric import QUIET, sudo, exists, with_remote_configuration
+import os
+import logging
+
+from ..fabric import (QUIET, run, sudo, exists, env,
+                      with_remote_configuration, get_agent)
 from ..fabric.utils import list_or_split
-from .common import is_installed, search
+from .common import (search, get_inventory, forget_inventory,
+                     unique, update_max_age)
+
+LOGGER = logging.getLogger(__name__)
 
 
 # ---------------------------------------------- APT package management
@@ -10,6 +17,25 @@ from .common import is_installed, search
 APT_CMD = ("DEBIAN_PRIORITY=critical DEBIAN_FRONTEND=noninteractive "
            "apt-get -o Dpkg::Options::='--force-confold'")
 
+# Written after each successful `apt-get update`, with the hash of the
+# APT sources. Its modification time tells how fresh the indexes are.
+APT_UPDATE_STAMP = '/var/lib/apt/lists/.sparks-update-stamp'
+APT_FRESH_MARKER = 'SPARKS_APT_INDEXES_FRESH'
+
+# No single quote in there, it runs via `sh -c '…'`.
+APT_UPDATE_SCRIPT = (
+    'sources=$(cat /etc/apt/sources.list /etc/apt/sources.list.d/* '
+    '2>/dev/null | md5sum | cut -d" " -f1); '
+    'if [ -f {stamp} ] && [ "$(cat {stamp})" = "$sources" ] '
+    '&& [ $(( $(date +%s) - $(stat -c %Y {stamp}) )) -lt {max_age} ]; '
+    'then echo {marker}; '
+    'else apt-get -qq update && echo $sources > {stamp}; fi'
+)
+
+# (pid, host_string) -> state of the APT indexes in the session:
+# 'refresh' (sources were added, see ppa()), 'fresh' or 'upgraded'.
+apt_indexes = {}
+
 
 @with_remote_configuration
 def apt_usable(remote_configuration=None):
@@ -17,50 +43,185 @@ def apt_usable(remote_configuration=None):
     return remote_configuration.is_deb
 
 
+def apt_read_inventory():
+    """ Return the installed packages of the current host, as a ``dict`` of
+        names to versions, in one :program:`dpkg-query` call. Removed
+        packages with their configuration left (“rc”) count as installed.
+
+        .. versionadded:: 5.18
+    """
+
+    states = ('installed', 'config-files', )
+    helper = get_agent()
+
+    if helper is not None:
+        from ..fabric.agent import RemoteAgentError
+
+        try:
+            packages = helper.call('packages', states=states)
+
+        except RemoteAgentError as exc:
+            LOGGER.warning(u'%s, falling back to dpkg-query.', exc)
+
+        else:
+            # None when the agent could not run dpkg-query itself.
+            if packages is not None:
+                return packages
+
+    output = run("dpkg-query -W -f='${Package}\\t${Status}\\t${Version}\\n'",
+                 quiet=True)
+    packages = {}
+
+    for line in output.splitlines():
+        try:
+            name, status, version = line.strip('\r\n').split('\t')
+
+        except ValueError:
+            continue
+
+        if status.rsplit(' ', 1)[-1] in states:
+            packages[name] = version
+
+    return packages
+
+
+def apt_inventory(refresh=False):
+    """ Return the installed packages of the current host, read once per
+        session (see :func:`sparks.pkg.common.get_inventory`).
+
+        .. versionadded:: 5.18
+    """
+
+    return get_inventory('apt', apt_read_inventory, refresh=refresh)
+
+
 def apt_is_installed(pkg):
-    """ Return ``True`` if a given package is installed via APT/dpkg. """
+    """ Return ``True`` if a given package is installed via APT/dpkg.
+
+        .. versionchanged:: in 5.18, answered by :func:`apt_inventory`.
+    """
+
+    return pkg in apt_inventory()
+
+
+def apt_update(force=False, max_age=None):
+    """ Update APT packages list.
+
+        .. versionchanged:: in 5.18, the update is skipped if the lists
+            were updated less than :param:`max_age` seconds ago (default:
+            :func:`sparks.pkg.common.update_max_age`) and the APT sources
+            did not change since. This is checked remotely at each call,
+            thus sources written by any means (eg. a file dropped in
+            :file:`/etc/apt/sources.list.d/`) trigger the update. Return
+            ``True`` if the update really happened.
+    """
 
-    # OMG, this is so ugly. but `dpkg -l %s` will answer
-    # 'un <package> uninstalled' + exit 0 if not installed.
-    return is_installed('dpkg -l | grep -E "^(ii|rc)  %s "' % pkg)
+    key = (os.getpid(), env.host_string)
 
+    if max_age is None:
+        max_age = update_max_age()
 
-def apt_update():
-    """ Update APT packages list. """
+    output = sudo("sh -c '%s'" % APT_UPDATE_SCRIPT.format(
+                  stamp=APT_UPDATE_STAMP, marker=APT_FRESH_MARKER,
+                  max_age=0 if force else max_age), quiet=QUIET)
 
-    sudo('apt-get -qq update', quiet=QUIET)
+    if APT_FRESH_MARKER in output:
+        LOGGER.debug(u'APT indexes are fresh on %s, not updated.',
+                     env.host_string)
+
+        if apt_indexes.get(key) != 'upgraded':
+            apt_indexes[key] = 'fresh'
+
+        return False
+
+    apt_indexes[key] = 'fresh'
+
+    return True
+
+
+def apt_refresh_if_needed():
+    """ Update APT packages lists if sources were added in this session.
+
+        .. versionadded:: 5.18
+    """
+
+    if apt_indexes.get((os.getpid(), env.host_string)) == 'refresh':
+        apt_update()
 
 
 def apt_upgrade():
-    """ Upgrade outdated Debian packages. """
+    """ Upgrade outdated Debian packages.
+
+        .. versionchanged:: in 5.18, skipped if already done in this
+            session and the packages lists were not updated since.
+    """
+
+    apt_refresh_if_needed()
+
+    key = (os.getpid(), env.host_string)
+
+    if apt_indexes.get(key) == 'upgraded':
+        return
 
     # create a line "force-confold" in `/etc/dpkg/dpkg.cfg`.
     # Or, just:
 
     sudo(APT_CMD + ' -q -u dist-upgrade --yes --force-yes', quiet=QUIET)
 
+    apt_indexes[key] = 'upgraded'
+    forget_inventory('apt')
+
 
 def apt_add(pkgs):
-    for pkg in list_or_split(pkgs):
-        if not apt_is_installed(pkg):
-            sudo(APT_CMD + ' -q install --yes --force-yes %s' % pkg,
-                 quiet=QUIET)
+    """ Install the missing packages of :param:`pkgs`.
+
+        .. versionchanged:: in 5.18, all of them in one transaction.
+    """
+
+    inventory = apt_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        apt_refresh_if_needed()
+
+        sudo(APT_CMD + ' -q install --yes --force-yes %s' % ' '.join(missing),
+             quiet=QUIET)
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def apt_del(pkgs):
-    for pkg in list_or_split(pkgs):
-        if apt_is_installed(pkg):
-            sudo(APT_CMD + ' -q remove --purge --yes --force-yes %s' % pkg,
-                 quiet=QUIET)
+    """ Remove (and purge) the installed packages of :param:`pkgs`.
+
+        .. versionchanged:: in 5.18, all of them in one transaction.
+    """
+
+    inventory = apt_inventory()
+    installed = unique(pkg for pkg in list_or_split(pkgs) if pkg in inventory)
+
+    if installed:
+        sudo(APT_CMD + ' -q remove --purge --yes --force-yes %s'
+             % ' '.join(installed), quiet=QUIET)
+
+        for pkg in installed:
+            inventory.pop(pkg, None)
 
 
 def ppa(src):
+    """ Add an APT repository.
+
+        .. versionchanged:: in 5.18, the packages lists are not updated
+            immediately, but before the next install or upgrade. Thus
+            adding many repositories costs only one update.
+    """
 
     # This package contains `add-apt-repository`…
     apt_add(('python-software-properties', ))
 
     sudo('add-apt-repository -y "%s"' % src, quiet=QUIET)
-    apt_update()
+
+    apt_indexes[(os.getpid(), env.host_string)] = 'refresh'
 
 
 def key(key):
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from ..fabric import QUIET, sudo, exists, with_remote_configuration
+from ..fabric import QUIET, run, sudo, exists, with_remote_configuration
 from ..fabric.utils import list_or_split
-from .common import is_installed, search
+from .common import (search, get_inventory, unique,
+                     once_per_session, )
 
 
 # ---------------------------------------------- APT package management
@@ -16,14 +17,48 @@ def arch_usable(remote_configuration=None):
     return remote_configuration.lsb and remote_configuration.lsb.ID == 'arch'
 
 
+def arch_read_inventory():
+    """ Return the installed packages and their version, in one call.
+
+        .. versionadded:: 5.18
+    """
+
+    packages = {}
+
+    for line in run('%s -Q' % ARCH_CMD, quiet=True).splitlines():
+        try:
+            name, version = line.split()
+
+        except ValueError:
+            continue
+
+        packages[name] = version
+
+    return packages
+
+
+def arch_inventory(refresh=False):
+    """ .. versionadded:: 5.18 """
+
+    return get_inventory('arch', arch_read_inventory, refresh=refresh)
+
+
 def arch_is_installed(pkg):
-    """ Return ``True`` if a given package is installed. """
+    """ Return ``True`` if a given package is installed.
 
-    return is_installed('%s -Qs "%s" | grep "/%s "' % (ARCH_CMD, pkg, pkg))
+        .. versionchanged:: in 5.18, answered by :func:`arch_inventory`.
+    """
 
+    return pkg in arch_inventory()
 
+
+@once_per_session
 def arch_update():
-    """ Update packages list. """
+    """ Update packages list.
+
+        .. versionchanged:: in 5.18, once per session (see
+            :func:`sparks.pkg.common.once_per_session`).
+    """
 
     sudo('%s -Sy' % ARCH_CMD, quiet=QUIET)
 
@@ -38,17 +73,32 @@ def arch_upgrade():
 
 
 def arch_add(pkgs):
-    for pkg in list_or_split(pkgs):
-        if not arch_is_installed(pkg):
-            sudo(ARCH_CMD + ' -S --noconfirm --noprogressbar --force %s' % pkg,
-                 quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one transaction for all packages. """
+
+    inventory = arch_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        sudo(ARCH_CMD + ' -S --noconfirm --noprogressbar --force %s'
+             % ' '.join(missing), quiet=QUIET)
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def arch_del(pkgs):
-    for pkg in list_or_split(pkgs):
-        if arch_is_installed(pkg):
-            sudo(ARCH_CMD + ' -Rs --noconfirm --noprogressbar --force %s' % pkg,
-                 quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one transaction for all packages. """
+
+    inventory = arch_inventory()
+    installed = unique(pkg for pkg in list_or_split(pkgs) if pkg in inventory)
+
+    if installed:
+        sudo(ARCH_CMD + ' -Rs --noconfirm --noprogressbar --force %s'
+             % ' '.join(installed), quiet=QUIET)
+
+        for pkg in installed:
+            inventory.pop(pkg, None)
+
 
 def arch_search(pkgs):
     for pkg in list_or_split(pkgs):
@@ -2,7 +2,8 @@
 
 from ..fabric import run, with_remote_configuration
 from ..fabric.utils import list_or_split
-from .common import is_installed, search
+from .common import (search, get_inventory, unique,
+                     once_per_session, )
 
 
 # --------------------------------------------- Brew package management
@@ -14,11 +15,39 @@ def brew_usable(remote_configuration=None):
     return remote_configuration.is_osx
 
 
+def brew_read_inventory():
+    """ Return the installed formulas and their versions, in one call.
+
+        .. versionadded:: 5.18
+    """
+
+    packages = {}
+
+    for line in run('brew list --versions', quiet=True).splitlines():
+        try:
+            name, versions = line.split(None, 1)
+
+        except ValueError:
+            continue
+
+        packages[name] = versions
+
+    return packages
+
+
+def brew_inventory(refresh=False):
+    """ .. versionadded:: 5.18 """
+
+    return get_inventory('brew', brew_read_inventory, refresh=refresh)
+
+
 def brew_is_installed(pkg):
     """ Return ``True`` if a given application is installed via Brew (on OSX).
+
+        .. versionchanged:: in 5.18, answered by :func:`brew_inventory`.
     """
 
-    return is_installed('brew list %s >/dev/null 2>&1' % pkg)
+    return pkg in brew_inventory()
 
 
 def brew_add(pkgs):
@@ -32,21 +61,40 @@ def brew_add(pkgs):
                 FORCE_UNSAFE_CONFIGURE=1 in environment to bypass this check)
             See `config.log' for more details
             READ THIS: https://github.com/mxcl/homebrew/wiki/troubleshooting
+
+        .. versionchanged:: in 5.18, one ``brew install`` for all packages.
     """
 
-    for pkg in list_or_split(pkgs):
-        if not brew_is_installed(pkg):
-            run('FORCE_UNSAFE_CONFIGURE=1 brew install %s' % pkg)
+    inventory = brew_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        run('FORCE_UNSAFE_CONFIGURE=1 brew install %s' % ' '.join(missing))
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def brew_del(pkgs):
-    for pkg in list_or_split(pkgs):
-        if brew_is_installed(pkg):
-            run('brew remove %s' % pkg)
+    """ .. versionchanged:: in 5.18, one ``brew remove`` for all packages. """
 
+    inventory = brew_inventory()
+    installed = unique(pkg for pkg in list_or_split(pkgs) if pkg in inventory)
 
+    if installed:
+        run('brew remove %s' % ' '.join(installed))
+
+        for pkg in installed:
+            inventory.pop(pkg, None)
+
+
+@once_per_session
 def brew_update():
-    """ Update Homebrew formulas. """
+    """ Update Homebrew formulas.
+
+        .. versionchanged:: in 5.18, once per session (see
+            :func:`sparks.pkg.common.once_per_session`).
+    """
 
     run('brew update')
 
@@ -1,6 +1,22 @@
 # -*- coding: utf-8 -*-
 
-from ..fabric import sudo
+import os
+import functools
+
+from ..fabric import env, sudo
+
+
+# (pid, host_string, manager) -> {package: version}. The installed packages
+# of each host are read once per session and process, see get_inventory().
+inventories = {}
+
+# Package indexes refreshed less than this number of seconds ago are not
+# refreshed again (see apt_update()). Can be overriden per project with
+# env.sparks_options['pkg_update_max_age'].
+UPDATE_MAX_AGE = int(os.environ.get('SPARKS_PKG_UPDATE_MAX_AGE', 3600))
+
+# (pid, host_string, function name) of the updates already done.
+updated = set()
 
 
 # ========================================== Package management helpers
@@ -20,3 +36,65 @@ def is_installed(test_installed_command):
 def search(search_command):
 
     return sudo(search_command, quiet=True)
+
+
+def get_inventory(manager, reader, refresh=False):
+    """ Return the installed packages of the current host for
+        :param:`manager`, as a ``dict`` of names to versions. The
+        :param:`reader` callable is run only at first call (or if
+        :param:`refresh` is ``True``), then the inventory is kept for
+        the session; package managers helpers update it when they
+        install or remove packages.
+
+        .. versionadded:: 5.18
+    """
+
+    key = (os.getpid(), env.host_string, manager)
+
+    if refresh or key not in inventories:
+        inventories[key] = reader()
+
+    return inventories[key]
+
+
+def unique(pkgs):
+    """ Return :param:`pkgs` without duplicates, in the same order. """
+
+    seen = set()
+
+    return [pkg for pkg in pkgs if not (pkg in seen or seen.add(pkg))]
+
+
+def forget_inventory(manager):
+    """ Make the next :func:`get_inventory` call read the inventory of
+        :param:`manager` again on the current host (eg. after an upgrade).
+
+        .. versionadded:: 5.18
+    """
+
+    inventories.pop((os.getpid(), env.host_string, manager), None)
+
+
+def update_max_age():
+    """ .. versionadded:: 5.18 """
+
+    return int(getattr(env, 'sparks_options', {}).get('pkg_update_max_age',
+                                                      UPDATE_MAX_AGE))
+
+
+def once_per_session(func):
+    """ Run the decorated packages indexes update only once per host and
+        session, unless it is called with ``force=True``.
+
+        .. versionadded:: 5.18
+    """
+
+    @functools.wraps(func)
+    def wrapped(force=False):
+        key = (os.getpid(), env.host_string, func.__name__)
+
+        if force or key not in updated:
+            func()
+            updated.add(key)
+
+    return wrapped
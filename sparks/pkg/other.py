@@ -1,24 +1,60 @@
 # -*- coding: utf-8 -*-
 
-from ..fabric import QUIET, run, sudo
+import re
+
+from ..fabric import QUIET, run, sudo, env
 from ..fabric.utils import list_or_split
-from .common import is_installed, search
+from .common import search, get_inventory, unique
 
 # ---------------------------------------------- NPM package management
 
 # TODO: npm_usable
 
 
+def npm_read_inventory():
+    """ Return the NodeJS packages of the current directory tree (at any
+        depth, like ``npm list`` shows them) and their version.
+
+        .. versionadded:: 5.18
+    """
+
+    # Lines are “/path/node_modules/name:name@version[:…]”.
+    return dict(re.findall(r':(@?[^:@\s]+)@([^:\s]+)',
+                           run('npm list --parseable --long 2>/dev/null',
+                               quiet=True)))
+
+
+def npm_inventory(refresh=False):
+    """ NPM installs in the current directory, thus there is one
+        inventory per remote directory.
+
+        .. versionadded:: 5.18
+    """
+
+    return get_inventory('npm:%s' % (env.cwd or '~'), npm_read_inventory,
+                         refresh=refresh)
+
+
 def npm_is_installed(pkg):
-    """ Return ``True`` if a given NodeJS package is installed. """
+    """ Return ``True`` if a given NodeJS package is installed.
+
+        .. versionchanged:: in 5.18, answered by :func:`npm_inventory`.
+    """
 
-    return is_installed("npm list -i %s | grep ' %s@'" % (pkg, pkg))
+    return pkg in npm_inventory()
 
 
 def npm_add(pkgs):
-    for pkg in list_or_split(pkgs):
-        if not npm_is_installed(pkg):
-            run('npm install %s' % pkg, quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one ``npm install`` for all packages. """
+
+    inventory = npm_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        run('npm install %s' % ' '.join(missing), quiet=QUIET)
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def npm_search(pkgs):
@@ -32,16 +68,42 @@ def npm_search(pkgs):
 # TODO: gem_usable
 
 
+def gem_read_inventory():
+    """ Return the installed gems and their versions, in one call.
+
+        .. versionadded:: 5.18
+    """
+
+    return dict(re.findall(r'^(\S+) \((.*)\)\s*$',
+                           run('gem list --local', quiet=True), re.M))
+
+
+def gem_inventory(refresh=False):
+    """ .. versionadded:: 5.18 """
+
+    return get_inventory('gem', gem_read_inventory, refresh=refresh)
+
+
 def gem_is_installed(pkg):
-    """ Return ``True`` if a given Ruby gem is installed. """
+    """ Return ``True`` if a given Ruby gem is installed.
+
+        .. versionchanged:: in 5.18, answered by :func:`gem_inventory`.
+    """
 
-    return is_installed('gem list -i %s' % pkg)
+    return pkg in gem_inventory()
 
 
 def gem_add(pkgs):
-    for pkg in list_or_split(pkgs):
-        if not gem_is_installed(pkg):
-            run('gem install %s' % pkg, quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one ``gem install`` for all gems. """
+
+    inventory = gem_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        run('gem install %s' % ' '.join(missing), quiet=QUIET)
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def gem_search(pkgs):
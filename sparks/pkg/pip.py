@@ -1,13 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import os
+import re
 import logging
 
-from ..fabric import task, sudo, QUIET, green, run, cd
+from contextlib import contextmanager
+
+from ..fabric import task, sudo, QUIET, green, run, cd, env, get_agent
 from ..fabric.utils import list_or_split
-from .common import silent_sudo, is_installed, search
+from .common import silent_sudo, search, get_inventory, unique
 
 LOGGER = logging.getLogger(__name__)
 
+# (pid, host_string, executable names) -> PIP executable found.
+pip_executables = {}
+
+# pid -> [nesting level, permissions to restore], see pip_perms_once().
+deferred_perms = {}
+
 
 # ---------------------------------------------- PIP package management
 
@@ -27,53 +37,176 @@ def pip_perms(verbose=True):
                 '| sudo xargs -0 -n 1024 chmod u+rwx,g+rx,o+rx')
 
 
+@contextmanager
+def pip_perms_once():
+    """ Defer the :func:`pip_perms` runs of PIP installs made in the
+        ``with`` block, and restore permissions only once at the end::
+
+            with pip_perms_once():
+                pip2_add(('git-up', ))
+                pip3_add(('virtualenvwrapper', ))
+
+        .. versionadded:: 5.18
+    """
+
+    state = deferred_perms.setdefault(os.getpid(), [0, False])
+    state[0] += 1
+
+    try:
+        yield
+
+    finally:
+        state[0] -= 1
+
+        if state[0] == 0 and state[1]:
+            state[1] = False
+            pip_perms()
+
+
+def __pip_restore_perms():
+
+    state = deferred_perms.get(os.getpid(), None)
+
+    if state is not None and state[0]:
+        state[1] = True
+
+    else:
+        pip_perms()
+
+
 def __pip_find_executable_internal(executable_names=None):
+    """ Return the first of :param:`executable_names` found in the remote
+        ``$PATH``, or ``None``. The result is kept for the session.
+
+        .. versionchanged:: in 5.18, one round trip for all names, memoized.
+    """
 
     if executable_names is None:
         raise ValueError('Must provide PIP executable names as list or tuple!')
 
-    # run() hangs the 3rd time when called from `contrib/pkgmgr.py`.
-    #print('lookup pip3 in %s' % remote_configuration)
+    key = (os.getpid(), env.host_string, tuple(executable_names))
+
+    try:
+        return pip_executables[key]
+
+    except KeyError:
+        pass
+
+    helper   = get_agent()
+    pip_exec = None
+
+    if helper is not None:
+        from ..fabric.agent import RemoteAgentError
+
+        try:
+            found = helper.call('which', names=list(executable_names))
+
+        except RemoteAgentError as exc:
+            LOGGER.warning(u'%s, falling back to a shell lookup.', exc)
+            helper = None
+
+        else:
+            pip_exec = next((name for name in executable_names
+                             if found.get(name)), None)
 
-    for pip_exec in executable_names:
-        if run('which %s' % pip_exec, quiet=True, warn_only=True).succeeded:
-            return pip_exec
+    if helper is None:
+        # run() hangs the 3rd time when called from `contrib/pkgmgr.py`,
+        # thus lookup all names in one call.
+        output = run('for pip in %s; do command -v $pip >/dev/null '
+                     '&& echo $pip && break; done; true'
+                     % ' '.join(executable_names), quiet=True).strip()
 
-    return None
+        pip_exec = output.splitlines()[-1].strip() if output else None
+
+    if pip_exec not in executable_names:
+        # Not remembered: PIP can be installed later in the session.
+        return None
+
+    pip_executables[key] = pip_exec
+
+    return pip_exec
+
+
+def __pip_normalize(name):
+    """ PEP 503 name normalization, like PIP when comparing names. """
+
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def __pip_inventory(pip):
+    """ Return the packages installed via :param:`pip` on the current host,
+        from one :program:`pip freeze` run per session.
+
+        .. versionadded:: 5.18
+    """
+
+    def read_freeze():
+        packages = {}
+
+        for line in silent_sudo('%s freeze' % pip).splitlines():
+            line = line.strip()
+
+            if not line or line.startswith(('#', '-')):
+                continue
+
+            if '==' in line:
+                name, version = line.split('==', 1)
+
+            elif ' @ ' in line:
+                name, version = line.split(' @ ', 1)
+
+            else:
+                continue
+
+            packages[__pip_normalize(name.strip())] = version.strip()
+
+        return packages
+
+    return get_inventory('pip:' + pip, read_freeze)
 
 
 def __pip_is_installed_internal(pkg, py3=False):
-    """ Return ``True`` if a given Python module is installed via PIP. """
+    """ Return ``True`` if a given Python module is installed via PIP.
+
+        .. versionchanged:: in 5.18, answered by one ``pip freeze``
+            snapshot per interpreter and host.
+    """
 
     pip = pip3_find_executable() if py3 else pip2_find_executable()
 
     if pip is None:
         return
 
-    return is_installed("%s freeze | grep -i '%s=='" % (pip, pkg))
+    return __pip_normalize(pkg) in __pip_inventory(pip)
 
 
 def __pip_add_internal(pkgs, py3=False):
+    """ .. versionchanged:: in 5.18, install all missing packages in
+            one PIP run. """
 
     pip = pip3_find_executable() if py3 else pip2_find_executable()
 
     if pip is None:
         return
 
+    inventory = __pip_inventory(pip)
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if __pip_normalize(pkg) not in inventory)
+
+    if not missing:
+        return
+
     # Go to a neutral location before PIP tries to "mkdir build"
     # WARNING: this could be vulnerable to symlink attack when we
     # force unlink of hard-coded build/, but in this case PIP is
     # vulnerable during the install phase too :-/
     with cd('/var/tmp'):
-        installed = False
-        for pkg in list_or_split(pkgs):
-            if not __pip_is_installed_internal(pkg, py3=py3):
-                sudo("%s install -U %s " % (pip, pkg))
-                installed = True
-
-        if installed:
-            silent_sudo('rm -rf build')
-            pip_perms()
+        sudo("%s install -U %s " % (pip, ' '.join(missing)))
+
+        inventory.update((__pip_normalize(pkg), None) for pkg in missing)
+
+        silent_sudo('rm -rf build')
+        __pip_restore_perms()
 
 
 def __pip_search_internal(pkgs, py3=False):
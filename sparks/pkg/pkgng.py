@@ -38,9 +38,10 @@
 
 """
 
-from ..fabric import sudo, with_remote_configuration, QUIET
+from ..fabric import run, sudo, with_remote_configuration, QUIET
 from ..fabric.utils import list_or_split
-from .common import is_installed, search
+from .common import (search, get_inventory, unique,
+                     once_per_session, )
 
 
 # --------------------------------------------- Brew package management
@@ -67,26 +68,75 @@ def pkgng_usable(remote_configuration=None):
     return True
 
 
+def pkgng_read_inventory():
+    """ Return the installed packages and their version, in one call.
+        Packages are indexed by name and by origin (eg. ``lang/gcc``),
+        like ``pkg info`` accepts both.
+
+        .. versionadded:: 5.18
+    """
+
+    packages = {}
+
+    for line in run("pkg query '%n %o %v'", quiet=True).splitlines():
+        try:
+            name, origin, version = line.split()
+
+        except ValueError:
+            continue
+
+        packages[name] = packages[origin] = version
+
+    return packages
+
+
+def pkgng_inventory(refresh=False):
+    """ .. versionadded:: 5.18 """
+
+    return get_inventory('pkgng', pkgng_read_inventory, refresh=refresh)
+
+
 def pkgng_is_installed(pkg):
-    """ Return ``True`` if a given package is installed. """
+    """ Return ``True`` if a given package is installed.
+
+        .. versionchanged:: in 5.18, answered by :func:`pkgng_inventory`.
+    """
 
-    return is_installed("pkg info %s >/dev/null 2>&1" % pkg)
+    return pkg in pkgng_inventory()
 
 
 def pkgng_add(pkgs):
-    for pkg in list_or_split(pkgs):
-        if not pkgng_is_installed(pkg):
-            # -U means REPO_AUTOUPDATE=false
-            sudo('pkg install -Uy %s' % pkg, quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one transaction for all packages. """
+
+    inventory = pkgng_inventory()
+    missing   = unique(pkg for pkg in list_or_split(pkgs)
+                       if pkg not in inventory)
+
+    if missing:
+        # -U means REPO_AUTOUPDATE=false
+        sudo('pkg install -Uy %s' % ' '.join(missing), quiet=QUIET)
+
+        inventory.update((pkg, None) for pkg in missing)
 
 
 def pkgng_del(pkgs):
-    for pkg in list_or_split(pkgs):
-        if pkgng_is_installed(pkg):
-            sudo('pkg delete -Ryf %s' % pkg, quiet=QUIET)
+    """ .. versionchanged:: in 5.18, one transaction for all packages. """
+
+    inventory = pkgng_inventory()
+    installed = unique(pkg for pkg in list_or_split(pkgs) if pkg in inventory)
+
+    if installed:
+        sudo('pkg delete -Ryf %s' % ' '.join(installed), quiet=QUIET)
+
+        # Forget the other key (name or origin) of removed packages too.
+        pkgng_inventory(refresh=True)
 
 
+@once_per_session
 def pkgng_update():
+    """ .. versionchanged:: in 5.18, once per session (see
+            :func:`sparks.pkg.common.once_per_session`).
+    """
 
     sudo('pkg update', quiet=QUIET)
 
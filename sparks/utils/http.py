@@ -21,10 +21,8 @@ License along with sparks.  If not, see http://www.gnu.org/licenses/
 
 import re
 import logging
-import charade
 
 from collections import namedtuple
-from bs4 import BeautifulSoup
 
 url_tuple = namedtuple('url', ['scheme', 'host_and_port', 'remaining', ])
 url_port_tuple = namedtuple('url_port',
@@ -136,6 +134,10 @@ def detect_encoding_from_requests_response(response, meta=False, deep=False):
     # HTTP headers don't contain any encoding.
     # Search in page head, then try to detect from data.
 
+    # Imported here: they are heavy and are not needed by most callers.
+    import charade
+    from bs4 import BeautifulSoup
+
     html_content = BeautifulSoup(response.content, 'lxml')
 
     found = False
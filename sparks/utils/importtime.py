@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Import-time benchmark and regression guard for sparks.
+
+Each module is imported in a fresh interpreter. We report how long it took
+(with a :program:`python -X importtime` breakdown when the interpreter
+supports it), and fail if the import:
+
+- takes longer than ``--max-ms`` milliseconds,
+- spawns any process from sparks code (sparks must not run anything at
+  import time; third-party modules are not ours to fix, eg. Fabric's
+  :mod:`uuid` import runs :program:`ldconfig` on some systems),
+- pulls heavy optional modules that should be imported on demand.
+
+Usage::
+
+    python -m sparks.utils.importtime
+    python -m sparks.utils.importtime --max-ms 300 --top 15 sparks.fabric
+
+.. versionadded:: 5.18
+"""
+
+from __future__ import print_function
+
+import sys
+import json
+import argparse
+import subprocess
+
+DEFAULT_MODULES = ('sparks.fabric', 'sparks.django.settings', )
+
+# Modules that must only be imported when really used.
+LAZY_MODULES = ('bs4', 'charade', 'mistune', )
+
+RESULT_MARKER = 'SPARKS_IMPORTTIME:'
+
+CHILD_SCRIPT = '''
+import os
+import sys
+import time
+import json
+import sysconfig
+import traceback
+import subprocess
+
+spawned = []
+original_init = subprocess.Popen.__init__
+sparks_dir = os.sep + 'sparks' + os.sep
+stdlib_dir = sysconfig.get_paths()['stdlib']
+
+
+def in_stdlib(filename):
+    return filename.startswith('<') or (
+        filename.startswith(stdlib_dir) and 'site-packages' not in filename
+        and 'dist-packages' not in filename)
+
+
+def recording_init(self, *args, **kwargs):
+    # The spawn belongs to the closest caller outside the standard library:
+    # only count it if this is sparks code, not a third-party module.
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if not in_stdlib(frame[0]):
+            if sparks_dir in frame[0]:
+                spawned.append(repr(args[0] if args else kwargs.get('args')))
+            break
+
+    original_init(self, *args, **kwargs)
+
+subprocess.Popen.__init__ = recording_init
+
+already_loaded = set(sys.modules)
+start = time.time()
+__import__({module!r})
+elapsed = time.time() - start
+
+print({marker!r} + json.dumps({{
+    'elapsed': elapsed,
+    'spawned': spawned,
+    'modules': sorted(set(sys.modules) - already_loaded),
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """ Return a list of ``(cumulative_us, self_us, module)`` tuples
+        from :program:`python -X importtime` output. """
+
+    timings = []
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+
+        try:
+            self_us, cumulative_us, module = line[12:].split('|', 2)
+            timings.append((int(cumulative_us), int(self_us), module.rstrip()))
+
+        except ValueError:
+            continue
+
+    return timings
+
+
+def benchmark_import(module, python=None):
+    """ Import :param:`module` in a fresh interpreter and return
+        a ``dict`` with ``elapsed``, ``spawned``, ``modules``
+        and ``timings`` keys. """
+
+    python = python or sys.executable
+    command = [python]
+
+    if sys.version_info >= (3, 7):
+        command += ['-X', 'importtime']
+
+    command += ['-c', CHILD_SCRIPT.format(module=module, marker=RESULT_MARKER)]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate()
+
+    for line in stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            result = json.loads(line[len(RESULT_MARKER):])
+            result['timings'] = parse_importtime(stderr)
+            return result
+
+    raise RuntimeError(u'Could not import {0}:\n{1}'.format(module, stderr))
+
+
+def check_module(module, max_ms, top=10):
+    """ Benchmark :param:`module`, print a report and return the list
+        of guard failures (empty if everything is OK). """
+
+    result  = benchmark_import(module)
+    elapsed = result['elapsed'] * 1000.0
+    errors  = []
+
+    print(u'import {0}: {1:.1f} ms, {2} modules loaded.'.format(
+          module, elapsed, len(result['modules'])))
+
+    for cumulative_us, self_us, name in sorted(result['timings'],
+                                               reverse=True)[:top]:
+        print(u'    {0:>9} us cumulative {1:>9} us self  {2}'.format(
+              cumulative_us, self_us, name))
+
+    if elapsed > max_ms:
+        errors.append(u'{0} took {1:.1f} ms to import (max: {2} ms).'.format(
+                      module, elapsed, max_ms))
+
+    for command in result['spawned']:
+        errors.append(u'{0} spawned {1} at import time.'.format(
+                      module, command))
+
+    for name in result['modules']:
+        if name.split('.', 1)[0] in LAZY_MODULES:
+            errors.append(u'{0} imported {1} at import time.'.format(
+                          module, name))
+
+    return errors
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--max-ms', type=float, default=1000.0,
+                        help='Maximum import time in milliseconds.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to report.')
+
+    args = parser.parse_args()
+
+    errors = []
+
+    for module in args.modules:
+        errors.extend(check_module(module, args.max_ms, args.top))
+
+    for error in errors:
+        print(u'FAILED: ' + error, file=sys.stderr)
+
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 # -*- coding: utf8 -*-
 
 import os
+import re
 import sys
 import multiprocessing
 
@@ -21,11 +22,53 @@ if __package__ is None:
     sys.path.append(os.path.expanduser('~/Dropbox'))
 
 from sparks import pkg
+from sparks.fabric import (run, FACTS_CACHE_DIR,
+                           read_cache_file, write_cache_file)
 
 env.host_string = 'localhost'
 colors = [yellow, green, cyan, blue]
 colnum = len(colors)
 
+# Usable managers and package indexes are kept on disk for this
+# number of seconds. Run `reindex` to refresh them earlier.
+PKGMGR_CACHE_DIR = os.path.join(os.path.dirname(FACTS_CACHE_DIR), 'pkgmgr')
+PKGMGR_CACHE_TTL = int(os.environ.get('SPARKS_PKGMGR_TTL', 86400))
+
+# Maximum number of package managers queried at the same time.
+PKGMGR_WORKERS = int(os.environ.get('SPARKS_PKGMGR_WORKERS', 4))
+
+
+def pacman_records(output):
+    """ Join the ``pacman -Ss`` entries, made of a name line and
+        indented description lines, into one record each. """
+
+    records = []
+
+    for line in output.splitlines():
+        if line[:1].isspace() and records:
+            records[-1] += '\n' + line
+
+        elif line.strip():
+            records.append(line)
+
+    return records
+
+
+# Commands listing all packages known to a manager, and how to split their
+# output in records, for the local index. Records are what `search` matches
+# and prints: with their short description when the manager search command
+# matches descriptions too. The other managers (pip, npm, gem…) are
+# searched live.
+INDEX_COMMANDS = {
+    'apt': ('apt-cache search .', lambda output: output.splitlines()),
+    'arch': ('pacman -Ss', pacman_records),
+    'pkgng': ("pkg rquery -a '%n'", lambda output: output.split()),
+    'brew': ('brew search', lambda output: output.split()),
+}
+
+# suffix -> [(index, name, function)], see lookup().
+lookups = {}
+
 
 #LOGGER = logging.getLogger(__name__)
 
@@ -47,14 +90,39 @@ def usable(module, suffix, name):
 
 
 def lookup(module, suffix):
+    """ Return the usable ``*suffix`` functions of :param:`module`, as a
+        list of ``(index, name, function)`` tuples.
 
-    # TODO: cache after the first lookup for current execution/suffix.
+        The ``*_usable()`` probes run once per cache TTL: their result
+        is kept in memory and on disk.
+    """
 
-    index = 0
-    for k, v in module.__dict__.iteritems():
-        if k.endswith(suffix) and callable(v) and usable(module, suffix, k):
-            yield index, k, v
-            index += 1
+    try:
+        return lookups[suffix]
+
+    except KeyError:
+        pass
+
+    filename = os.path.join(PKGMGR_CACHE_DIR, 'usable.json')
+    cached   = read_cache_file(filename, PKGMGR_CACHE_TTL) or {}
+
+    if suffix in cached:
+        found = [name for name in cached[suffix] if hasattr(module, name)]
+
+    else:
+        found = sorted(k for k, v in list(module.__dict__.items())
+                       if k.endswith(suffix) and callable(v)
+                       and usable(module, suffix, k))
+
+        cached[suffix] = found
+
+        if PKGMGR_CACHE_TTL > 0:
+            write_cache_file(filename, cached)
+
+    lookups[suffix] = [(index, name, getattr(module, name))
+                       for index, name in enumerate(found)]
+
+    return lookups[suffix]
 
 
 def names(module, suffix):
@@ -63,28 +131,114 @@ def names(module, suffix):
                      in lookup(module, suffix))
 
 
-def encapsulate(func, name, args, suffix, index):
+def package_records(manager):
+    """ Return all package records of :param:`manager` (see
+        :data:`INDEX_COMMANDS`), from the local index, building it if
+        needed. Return ``None`` for managers which cannot list their
+        packages. """
+
+    if manager not in INDEX_COMMANDS:
+        return None
+
+    filename = os.path.join(PKGMGR_CACHE_DIR,
+                            'index-{0}.json'.format(manager))
+    records  = read_cache_file(filename, PKGMGR_CACHE_TTL)
+
+    if records is None:
+        command, splitter = INDEX_COMMANDS[manager]
+
+        result = run(command, quiet=True, warn_only=True)
+
+        if result.failed:
+            return None
+
+        records = sorted(set(splitter(result)))
 
-    # fancy pkg-manager name
-    name = colors[index % colnum](name[:-len(suffix)].upper())
+        if PKGMGR_CACHE_TTL > 0:
+            write_cache_file(filename, records)
 
-    for result in func(args):
-        for line in result.splitlines():
-            print('%s %s' % (name, line))
+    return records
+
+
+def matcher(pattern):
+    """ Return a case-insensitive match function for :param:`pattern`:
+        a regular expression, like the managers search commands take,
+        or a plain string if it is not a valid one. """
+
+    try:
+        return re.compile(pattern, re.IGNORECASE).search
+
+    except re.error:
+        return lambda record: pattern.lower() in record.lower()
+
+
+def encapsulate(task):
+    """ Run one manager search in a pool worker and return its output
+        lines, for the parent process to print them.
+
+        Managers with an index (see :data:`INDEX_COMMANDS`) are searched
+        in it. Like their own search command, names and short descriptions
+        match (names only for ``pkgng`` and ``brew``), but not the long
+        descriptions :program:`apt-cache search` also looks into.
+    """
+
+    index, name, args, suffix = task
+
+    manager = name[:-len(suffix)]
+    lines   = []
+
+    records = package_records(manager) if suffix == '_search' else None
+
+    if records is None:
+        for result in getattr(pkg, name)(args):
+            lines.extend(result.splitlines())
+
+    else:
+        for arg in args:
+            matches = matcher(arg)
+
+            for record in records:
+                if matches(record):
+                    lines.extend(record.splitlines())
+
+    return index, name, lines
 
 
 def wrap(module, suffix, args):
+    """ Run all usable ``*suffix`` functions of :param:`module` in a
+        bounded pool, printing each manager output as soon as it is
+        complete. Lines of different managers are never mixed. """
+
+    tasks = [(index, name, args, suffix)
+             for index, name, func in lookup(module, suffix)]
+
+    if not tasks:
+        return
+
+    workers = multiprocessing.Pool(min(PKGMGR_WORKERS, len(tasks)))
+
+    try:
+        for index, name, lines in workers.imap_unordered(encapsulate, tasks):
+
+            # fancy pkg-manager name
+            name = colors[index % colnum](name[:-len(suffix)].upper())
 
-    ps = []
+            for line in lines:
+                print('%s %s' % (name, line))
 
-    for index, name, func in lookup(module, suffix):
-        p = multiprocessing.Process(target=encapsulate,
-                                    args=(func, name, args, suffix, index, ))
-        ps.append(p)
-        p.start()
+            sys.stdout.flush()
 
-    for p in ps:
-        p.join()
+    except BaseException:
+        # A worker failed or we were interrupted: don't wait
+        # for the other managers, the error must show now.
+        workers.terminate()
+        raise
+
+    else:
+        workers.close()
+
+    finally:
+        workers.join()
 
 
 def search(args):
@@ -95,6 +249,17 @@ def search(args):
     wrap(pkg, '_search', args)
 
 
+def reindex(args):
+    """ Forget the usable managers and the package indexes. """
+
+    if not os.path.isdir(PKGMGR_CACHE_DIR):
+        return
+
+    for filename in os.listdir(PKGMGR_CACHE_DIR):
+        if filename.endswith('.json'):
+            os.unlink(os.path.join(PKGMGR_CACHE_DIR, filename))
+
+
 def install(args):
     pass
 
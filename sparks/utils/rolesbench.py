@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+"""
+Micro-benchmark of sparks roles lookups on a synthetic inventory.
+
+It compares the historical list scans of ``execute_or_not()`` and
+``non_empty_roles()`` with the host/role index built by
+:func:`sparks.fabric.build_roles_index`, on an inventory of ``--hosts``
+machines spread over all sparks roles (about 130).
+
+Usage::
+
+    python -m sparks.utils.rolesbench
+    python -m sparks.utils.rolesbench --hosts 5000 --calls 200
+
+.. versionadded:: 5.18
+"""
+
+from __future__ import print_function
+
+import random
+import timeit
+import argparse
+
+from sparks.fabric import all_roles, build_roles_index
+
+
+def synthetic_roledefs(nbhosts, seed=0):
+    """ Return a ``roledefs`` ``dict`` with :param:`nbhosts` hosts,
+        each of them in 1 to 3 random roles. Some roles stay empty,
+        like in real-life inventories. """
+
+    randomizer = random.Random(seed)
+    roles      = all_roles[:]
+    used_roles = roles[:len(roles) * 3 // 4]
+    roledefs   = dict((role, []) for role in roles)
+
+    for number in range(nbhosts):
+        host = 'host{0:05d}.example.com'.format(number)
+
+        for role in randomizer.sample(used_roles, randomizer.randint(1, 3)):
+            roledefs[role].append(host)
+
+    return roledefs
+
+
+def scan_non_empty_roles(roledefs, roles):
+    """ ``non_empty_roles()`` before the index. """
+
+    return [role for role in roles if roledefs.get(role, []) != []]
+
+
+def scan_should_run(roledefs, host, roles):
+    """ ``execute_or_not()`` host matching before the index. """
+
+    for role in scan_non_empty_roles(roledefs, roles):
+        if host in roledefs[role]:
+            return role
+
+
+def index_non_empty_roles(index, roles):
+
+    roles_hosts = index[1]
+
+    return [role for role in roles if roles_hosts.get(role)]
+
+
+def index_should_run(index, host, roles):
+
+    host_roles = index[0].get(host, ())
+
+    for role in index_non_empty_roles(index, roles):
+        if role in host_roles:
+            return role
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='Number of hosts in the synthetic inventory.')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='Number of lookups per host.')
+
+    args = parser.parse_args()
+
+    roledefs = synthetic_roledefs(args.hosts)
+    hosts    = sorted(set(host for hosts in roledefs.values()
+                          for host in hosts))
+    roles    = all_roles[:]
+    index    = build_roles_index(roledefs)
+
+    build_time = timeit.timeit(lambda: build_roles_index(roledefs), number=10)
+
+    print(u'{0} hosts, {1} roles; index built in {2:.2f} ms.'.format(
+          len(hosts), len(roledefs), build_time * 100.0))
+
+    for name, scan, indexed in (
+        ('non_empty_roles',
+         lambda: scan_non_empty_roles(roledefs, roles),
+         lambda: index_non_empty_roles(index, roles)),
+        ('execute_or_not',
+         lambda: [scan_should_run(roledefs, host, roles) for host in hosts],
+         lambda: [index_should_run(index, host, roles) for host in hosts]),
+    ):
+        assert scan() == indexed()
+
+        scan_time    = timeit.timeit(scan, number=args.calls)
+        indexed_time = timeit.timeit(indexed, number=args.calls)
+
+        print(u'{0:>16}: scan {1:9.2f} ms, index {2:9.2f} ms '
+              u'(x{3:.1f}) for {4} calls.'.format(
+                  name, scan_time * 1000.0, indexed_time * 1000.0,
+                  scan_time / indexed_time, args.calls))
+
+
+if __name__ == '__main__':
+    main()